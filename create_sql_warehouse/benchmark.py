@@ -0,0 +1,354 @@
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import click
+import sqlalchemy
+
+from catalog import sa_type
+from dbutil import DbUtil
+from manifest import template_version
+from settings import Settings
+from sqlformat import format_sql
+from tablemodel import Column, type_string
+
+# offline generation benchmark: synthetic column models are fed straight to
+# DbUtil, so no database (or GUI) is involved, e.g.
+#   python benchmark.py --tables 1,100,1000 --columns 5,100 --output bench.json
+#   python benchmark.py --baseline bench.json
+# every case runs --warmup untimed passes, then --repeat timed ones, and is
+# compared on its best pass: other load on the machine only ever slows a pass
+# down, so the fastest one is the least noisy measure of the code. A timed
+# pass generates the schema as often as it takes to run --min-time seconds,
+# a single small schema is over too quickly to time
+
+BENCHMARK_VERSION = 2
+
+# (type name, max_length, precision, scale) as sys.columns would report them
+synthetic_types = [
+    ("int", None, 10, 0),
+    ("bigint", None, 19, 0),
+    ("smallint", None, 5, 0),
+    ("bit", None, 1, 0),
+    ("decimal", None, 18, 4),
+    ("money", None, 19, 4),
+    ("float", None, 53, 0),
+    ("nvarchar", 200, 0, 0),
+    ("nvarchar", -1, 0, 0),
+    ("varchar", 50, 0, 0),
+    ("nchar", 20, 0, 0),
+    ("date", None, 10, 0),
+    ("datetime", None, 23, 3),
+    ("datetime2", None, 27, 7),
+    ("datetimeoffset", None, 34, 7),
+    ("uniqueidentifier", None, 0, 0),
+    ("varbinary", 64, 0, 0),
+]
+
+stages = ["staging", "temporal", "dimension", "format"]
+
+base_settings = {
+    "source_server": "localhost",
+    "source_db": "bench_source",
+    "source_schema": "dbo",
+    "target_server": "localhost",
+    "target_db": "bench_target",
+    "staging_schema": "staging",
+    "temporal_schema": "hist",
+    "dimension_schema": "dim",
+    "dimension_id_column_name": "dimId",
+    "dropfirst": True,
+    "backdate_hist_to": "2019-01-01",
+    "outputdir": ".",
+    "offline": True,
+    # answers for every prompt, tables without a key use their first column
+    "rules": {
+        "primary_keys": {"NoPk.*": ["col0"]},
+        "scd_type": {".*Type1": "Type 1", ".*": "Type 2"},
+    },
+}
+
+
+def synthetic_columns(rng, count, with_pk):
+    columns = [
+        Column(
+            "col0",
+            type_string(sa_type("int")),
+            nullable=False,
+            primary_key=with_pk,
+            identity=with_pk,
+        )
+    ]
+    for i in range(1, count):
+        type_name, max_length, precision, scale = rng.choice(synthetic_types)
+        columns.append(
+            Column(
+                f"col{i}",
+                type_string(sa_type(type_name, max_length, precision, scale)),
+                nullable=rng.random() < 0.7,
+            )
+        )
+    return tuple(columns)
+
+
+def synthetic_schema(tables, columns, seed):
+    # every other table has a primary key, every third dimension is type 1
+    rng = random.Random(seed)
+    models = {}
+    for i in range(tables):
+        with_pk = i % 2 == 0
+        name = f"{'Pk' if with_pk else 'NoPk'}{i:05d}"
+        if i % 3 == 0:
+            name += "Type1"
+        models[name] = synthetic_columns(rng, columns, with_pk)
+    return models
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def _summarize(timings):
+    return {
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "p50_ms": _percentile(timings, 0.5) * 1000,
+        "p95_ms": _percentile(timings, 0.95) * 1000,
+        "max_ms": max(timings) * 1000,
+    }
+
+
+def generate_schema(values, models):
+    # the same calls get_artifacts makes, timed one stage at a time
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns=models)
+    timings = dict([(stage, []) for stage in stages])
+    for table in models:
+        settings.set_table(table)
+        start = time.perf_counter()
+        staging = dbutil.get_staging_ddl(table)
+        timings["staging"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        temporal = dbutil.get_temporal_ddl(table)
+        timings["temporal"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        dimension = dbutil.get_dimension_ddl(table)
+        timings["dimension"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for sql in staging + temporal + dimension:
+            format_sql(sql.replace("\r", ""))
+        timings["format"].append(time.perf_counter() - start)
+    return timings
+
+
+def run_case(
+    values, tables, columns, seed, memory, repeat=5, warmup=1, min_time=0.2
+):
+    models = synthetic_schema(tables, columns, seed)
+    for i in range(warmup):
+        generate_schema(values, models)
+    timings = dict([(stage, []) for stage in stages])
+    # seconds per generation of the schema, one per timed pass
+    passes = []
+    for i in range(repeat):
+        gc.collect()
+        # as timeit does, a collection landing in one pass and not another is
+        # noise
+        gc.disable()
+        try:
+            loops = 0
+            start = time.perf_counter()
+            while True:
+                for stage, stage_timings in generate_schema(values, models).items():
+                    timings[stage].extend(stage_timings)
+                loops += 1
+                seconds = time.perf_counter() - start
+                if seconds >= min_time:
+                    break
+        finally:
+            gc.enable()
+        passes.append(seconds / loops)
+
+    seconds = _percentile(passes, 0.5)
+    result = {
+        "name": f"t{tables}_c{columns}",
+        "tables": tables,
+        "columns": columns,
+        "warmup": warmup,
+        "passes": passes,
+        # the median pass, and the best one that compare() uses
+        "seconds": seconds,
+        "tables_per_sec": tables / seconds,
+        "best_tables_per_sec": tables / min(passes),
+        "stages": dict([(stage, _summarize(timings[stage])) for stage in stages]),
+        "peak_memory_bytes": None,
+    }
+    if memory:
+        # a second pass, tracemalloc slows everything down too much to time it
+        gc.collect()
+        tracemalloc.start()
+        generate_schema(values, models)
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def compare(results, baseline, threshold):
+    # a best pass slower than the baseline's by more than threshold is a
+    # regression
+    if baseline.get("benchmark_version") != BENCHMARK_VERSION:
+        click.echo(
+            f"baseline is benchmark version {baseline.get('benchmark_version')}, "
+            f"not {BENCHMARK_VERSION}, its single pass timings are noisier"
+        )
+    previous = dict([(case["name"], case) for case in baseline["cases"]])
+    regressions = []
+    for case in results["cases"]:
+        old = previous.get(case["name"])
+        if old is None:
+            continue
+        # version 1 baselines only have their single pass
+        ratio = case["best_tables_per_sec"] / old.get(
+            "best_tables_per_sec", old["tables_per_sec"]
+        )
+        line = f"{case['name']:>16}: {ratio:6.2f}x tables/sec"
+        if case["peak_memory_bytes"] and old.get("peak_memory_bytes"):
+            line += (
+                f", {case['peak_memory_bytes'] / old['peak_memory_bytes']:6.2f}x"
+                " peak memory"
+            )
+        if ratio < 1 - threshold:
+            line += "  REGRESSION"
+            regressions.append(case["name"])
+        click.echo(line)
+    return regressions
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+@click.command()
+@click.option(
+    "--tables", default="1,10,100", help="comma separated table counts to generate"
+)
+@click.option(
+    "--columns", default="5,50,200", help="comma separated columns per table"
+)
+@click.option(
+    "--config",
+    type=click.Path(exists=True),
+    default=None,
+    help="JSON settings merged over the defaults, e.g. to benchmark options",
+)
+@click.option("--seed", type=int, default=0, help="seed for the synthetic schemas")
+@click.option(
+    "--repeat", type=click.IntRange(min=1), default=5, help="timed passes per case"
+)
+@click.option(
+    "--warmup",
+    type=click.IntRange(min=0),
+    default=1,
+    help="untimed passes per case before the timed ones",
+)
+@click.option(
+    "--min-time",
+    type=click.FloatRange(min=0),
+    default=0.2,
+    help="seconds a timed pass repeats generating the schema for",
+)
+@click.option(
+    "--memory/--no-memory",
+    default=True,
+    help="measure peak memory with tracemalloc in an extra pass",
+)
+@click.option("--output", default=None, help="JSON file to write the results to")
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True),
+    default=None,
+    help="earlier results to compare against, exits 1 on a regression",
+)
+@click.option(
+    "--threshold",
+    type=float,
+    default=0.1,
+    help="allowed throughput drop against the baseline",
+)
+def main(
+    tables,
+    columns,
+    config,
+    seed,
+    repeat,
+    warmup,
+    min_time,
+    memory,
+    output,
+    baseline,
+    threshold,
+):
+    values = dict(base_settings)
+    if config:
+        with open(config, "r", encoding="utf-8") as fp:
+            values.update(json.load(fp))
+
+    results = {
+        "benchmark_version": BENCHMARK_VERSION,
+        "template_version": template_version(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "platform": platform.platform(),
+        "seed": seed,
+        "repeat": repeat,
+        "warmup": warmup,
+        "min_time": min_time,
+        "cases": [],
+    }
+    for table_count in _int_list(tables):
+        for column_count in _int_list(columns):
+            case = run_case(
+                values,
+                table_count,
+                column_count,
+                seed,
+                memory,
+                repeat,
+                warmup,
+                min_time,
+            )
+            results["cases"].append(case)
+            line = (
+                f"{case['name']:>16}: {case['tables_per_sec']:10.1f} tables/sec "
+                f"(best {case['best_tables_per_sec']:.1f}), "
+                + ", ".join(
+                    f"{stage} {case['stages'][stage]['p50_ms']:.2f}ms"
+                    for stage in stages
+                )
+            )
+            if case["peak_memory_bytes"] is not None:
+                line += f", peak {case['peak_memory_bytes'] / 2 ** 20:.1f}MiB"
+            click.echo(line)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=4, sort_keys=True)
+
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as fp:
+            regressions = compare(results, json.load(fp), threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+from dbtemplates import (
+    select_catalog_columns_template,
+    select_catalog_primary_keys_template,
+)
+from sqlalchemy import text
+from sqlalchemy import types as sqltypes
+from tablemodel import Column, type_string
+from sqlalchemy.dialects.mssql.base import ischema_names
+import logging
+
+logger = logging.getLogger(__file__)
+
+# types whose sys.columns.max_length is in bytes for two byte characters
+unicode_types = ["nchar", "nvarchar"]
+length_types = ["char", "varchar", "nchar", "nvarchar", "binary", "varbinary"]
+# precision lives in sys.columns.scale for these
+time_types = ["datetime2", "datetimeoffset", "time"]
+
+
+def sa_type(type_name, max_length=None, precision=None, scale=None, collation=None):
+    type_name = type_name.lower()
+    coltype = ischema_names.get(type_name)
+    if coltype is None:
+        logger.warning(f"Did not recognize type '{type_name}'")
+        return sqltypes.NULLTYPE
+
+    kwargs = {}
+    if type_name in length_types:
+        length = max_length
+        if length == -1:
+            length = None
+        elif length is not None and type_name in unicode_types:
+            length = length // 2
+        kwargs["length"] = length
+        if collation and type_name not in ["binary", "varbinary"]:
+            kwargs["collation"] = collation
+    elif type_name in ["text", "ntext"] and collation:
+        kwargs["collation"] = collation
+
+    if type_name in time_types and scale is not None:
+        kwargs["precision"] = scale
+    # Float is no Numeric subclass from sqlalchemy 2.1 on
+    elif issubclass(coltype, (sqltypes.Numeric, sqltypes.Float)):
+        kwargs["precision"] = precision
+        if not issubclass(coltype, sqltypes.Float):
+            kwargs["scale"] = scale
+
+    return coltype(**kwargs)
+
+
+class CatalogReader:
+    # reads a whole schema's column model from sys.columns/sys.types/
+    # sys.indexes in two set based queries instead of reflecting table by table
+    def __init__(self, engine, schema):
+        self.engine = engine
+        self.schema = schema
+
+    def read(self, tables=None):
+        models = {}
+        if tables is not None:
+            tables = set(tables)
+        with self.engine.connect() as connection:
+            column_rows = connection.execute(
+                text(select_catalog_columns_template.render(source_schema=self.schema))
+            ).fetchall()
+            key_rows = connection.execute(
+                text(
+                    select_catalog_primary_keys_template.render(
+                        source_schema=self.schema
+                    )
+                )
+            ).fetchall()
+
+        for row in column_rows:
+            if tables is not None and row.table_name not in tables:
+                continue
+            models.setdefault(row.table_name, []).append(
+                Column(
+                    row.column_name,
+                    type_string(
+                        sa_type(
+                            row.type_name,
+                            row.max_length,
+                            row.precision,
+                            row.scale,
+                            row.collation_name,
+                        )
+                    ),
+                    nullable=bool(row.is_nullable),
+                    identity=bool(row.is_identity),
+                    computed=bool(row.is_computed),
+                )
+            )
+
+        for row in key_rows:
+            columns = models.get(row.table_name, [])
+            for i, column in enumerate(columns):
+                if column.name == row.column_name:
+                    columns[i] = column._replace(primary_key=True)
+
+        logger.debug(f"read {len(models)} tables from the {self.schema} catalog")
+        return dict([(table, tuple(columns)) for table, columns in models.items()])
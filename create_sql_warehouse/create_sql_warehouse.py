@@ -2,29 +2,53 @@ import os
 import click
 from settings import Settings
 from dbutil import DbUtil
-import subprocess
+from engines import EngineRegistry
+from generate import generate_tables
+from manifest import Manifest
+from loader import StagingLoader
+from deploy import Deployer
+import tracing
 import logging
-import glob
-
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s,%(name)s,%(levelname)s,"%(message)s"',
-    datefmt="%m-%d %H:%M",
-    filename="create_sql_warehouse.log",
-    filemode="w",
-)
-console = logging.StreamHandler()
-console.setLevel(logging.DEBUG)
-formatter = logging.Formatter("%(name)-12s: %(levelname)-8s %(message)s")
-console.setFormatter(formatter)
-logging.getLogger("").addHandler(console)
+import fnmatch
+import re
+
 logger = logging.getLogger()
-# logging.getLogger('sqlalchemy.engine').setLevel(logging.DEBUG)
+
+
+def setup_logging():
+    # only from main, worker processes re-import this module and must not
+    # truncate the log
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s,%(name)s,%(levelname)s,"%(message)s"',
+        datefmt="%m-%d %H:%M",
+        filename="create_sql_warehouse.log",
+        filemode="w",
+    )
+    console = logging.StreamHandler()
+    console.setLevel(logging.DEBUG)
+    formatter = logging.Formatter("%(name)-12s: %(levelname)-8s %(message)s")
+    console.setFormatter(formatter)
+    logging.getLogger("").addHandler(console)
+    # logging.getLogger('sqlalchemy.engine').setLevel(logging.DEBUG)
+
+
 def saveOutputFile(outputdir, schema, otype, name, sql):
-    with open(
-        os.path.join(outputdir, schema, otype, name + ".sql"), "w", encoding="utf-8"
-    ) as fp:
-        fp.write(sql.replace("\r", ""))
+    # sql arrives formatted, each artifact is written exactly once
+    path = os.path.join(outputdir, schema, otype, name + ".sql")
+    with tracing.span("write_file", artifact=name):
+        return _write_if_changed(path, sql)
+
+
+def _write_if_changed(path, sql):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as fp:
+            if fp.read() == sql:
+                # unchanged, leave the mtime alone
+                return path
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write(sql)
+    return path
 
 
 def ensure_dir_exists(path):
@@ -34,6 +58,89 @@ def ensure_dir_exists(path):
         pass
 
 
+def select_tables(tablelist, tables=None, pattern=None, globpattern=None):
+    if tables:
+        names = [t.strip() for t in tables.split(",") if t.strip()]
+        missing = [t for t in names if t not in tablelist]
+        if missing:
+            logger.warning(f"not found in source schema: {', '.join(missing)}")
+        tablelist = [t for t in names if t not in missing]
+    if pattern:
+        tablelist = [t for t in tablelist if re.search(pattern, t)]
+    if globpattern:
+        tablelist = [t for t in tablelist if fnmatch.fnmatch(t, globpattern)]
+    return tablelist
+
+
+def save_table(settings, table, artifacts):
+    logger.info(f"...Saving {table}")
+    with tracing.span("save", table=table):
+        return [
+            saveOutputFile(settings.get("outputdir"), schema, otype, name, sql)
+            for schema, otype, name, sql in artifacts
+        ]
+
+
+def load_tables(settings, dbutil, tablelist):
+    loader = StagingLoader(settings, dbutil)
+    rows = 0
+    seconds = 0
+    failed = []
+    for table in tablelist:
+        settings.set_table(table)
+        try:
+            stats = loader.load(table)
+        except Exception as e:
+            if len(tablelist) == 1:
+                raise
+            logger.exception(f"...Failed {table}")
+            failed.append((table, e))
+            continue
+        rows += stats["rows"]
+        seconds += stats["seconds"]
+
+    if len(tablelist) > 1:
+        logger.info(
+            f"...Summary: {len(tablelist) - len(failed)} loaded, {len(failed)} "
+            f"failed, {rows} rows at {rows / seconds if seconds else 0:.0f} rows/sec"
+        )
+        for table, e in failed:
+            logger.error(f"   {table}: {e}")
+
+
+def deploy_tables(settings, manifest, tablelist, jobs, force):
+    tables = [
+        (table, manifest.files(table))
+        for table in tablelist
+        if table in manifest.tables
+    ]
+    deployer = Deployer(settings, jobs=jobs, force=force)
+    logger.info(f"...Deploying {len(tables)} tables to {settings.get('target_db')}")
+    counts = {"deployed": 0, "current": 0, "failed": 0}
+    failed = []
+    for table, deployed, e in deployer.deploy(tables):
+        if e is not None:
+            logger.error(f"...Failed deploying {table}: {e}")
+            failed.append((table, e))
+            counts["failed"] += 1
+        elif deployed:
+            logger.info(f"...Deployed {table}, {deployed} objects")
+            counts["deployed"] += 1
+        else:
+            counts["current"] += 1
+
+    logger.info(
+        f"...Deploy summary: {counts['deployed']} deployed, {counts['current']} "
+        f"already current, {counts['failed']} failed"
+    )
+    for seconds, key in deployer.slowest():
+        logger.info(f"   {seconds:8.2f}s {key}")
+    if failed:
+        logger.error("...Run --deploy again to resume after fixing the failures")
+        if len(tablelist) == 1:
+            raise failed[0][1]
+
+
 @click.command()
 @click.option(
     "--config",
@@ -41,10 +148,126 @@ def ensure_dir_exists(path):
     default="settings.json",
     help="JSON file to read parameters from",
 )
-def main(config):
+@click.option(
+    "--tables", default=None, help="comma separated list of source tables to process"
+)
+@click.option(
+    "--pattern", default=None, help="process source tables matching this regex"
+)
+@click.option(
+    "--glob",
+    "globpattern",
+    default=None,
+    help="process source tables matching this glob, e.g. 'Sales*'",
+)
+@click.option(
+    "--all-tables",
+    is_flag=True,
+    default=False,
+    help="process every table in the source schema",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    default=False,
+    help="generate from the metadata cache without querying the source",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="regenerate tables even if their fingerprint is unchanged",
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    help="number of processes to generate tables on",
+)
+@click.option(
+    "--headless",
+    is_flag=True,
+    default=False,
+    help="never prompt, answer from the rules in the settings file or fail",
+)
+@click.option(
+    "--load",
+    is_flag=True,
+    default=False,
+    help="stream the selected tables from the source into their staging tables "
+    "instead of generating",
+)
+@click.option(
+    "--deploy",
+    is_flag=True,
+    default=False,
+    help="run the generated scripts against the target, --jobs tables at a time, "
+    "resuming after the objects a failed deploy already ran",
+)
+@click.option(
+    "--trace",
+    default=None,
+    help="time every stage, write <trace>.summary.json and a Chrome trace "
+    "<trace>.trace.json",
+)
+def main(
+    config,
+    tables,
+    pattern,
+    globpattern,
+    all_tables,
+    offline,
+    force,
+    jobs,
+    headless,
+    load,
+    deploy,
+    trace,
+):
+    setup_logging()
+    tracing.reset(trace is not None)
+    with tracing.span("run"):
+        run(
+            config,
+            tables,
+            pattern,
+            globpattern,
+            all_tables,
+            offline,
+            force,
+            jobs,
+            headless,
+            load,
+            deploy,
+        )
+    if trace:
+        for path in tracing.write(trace):
+            logger.info(f"...Wrote {path}")
+
+
+def run(
+    config,
+    tables,
+    pattern,
+    globpattern,
+    all_tables,
+    offline,
+    force,
+    jobs,
+    headless,
+    load,
+    deploy,
+):
     # get / change basic settings & scopes
     print("...Loading settings")
-    settings = Settings(config_path=config)
+    settings = Settings(config_path=config, headless=headless)
+    if offline:
+        settings.settings["offline"] = True
+    EngineRegistry.configure(
+        pool_size=settings.get("pool_size"),
+        max_overflow=settings.get("max_overflow"),
+        pool_recycle=settings.get("pool_recycle"),
+    )
     dbutil = DbUtil(settingsinstance=settings)
     outdir = settings.get("outputdir")
     print(outdir)
@@ -98,88 +321,75 @@ def main(config):
         )
     )
 
-    # select tables from source
-    table = dbutil.get_source_table()
-    logger.info(f"...Processing {table}")
-    # todo for wh for table:
-    # * given input table ->
-    # * create staging table
-    stagingtablesql, stagingloadprocsql = dbutil.get_staging_ddl(table)
-    saveOutputFile(
-        settings.get("outputdir"),
-        settings.get("staging_schema"),
-        "Tables",
-        table,
-        stagingtablesql,
-    )
-    # * create load to staging
-    saveOutputFile(
-        settings.get("outputdir"),
-        settings.get("staging_schema"),
-        "Stored Procedures",
-        f"Populate{table}",
-        stagingloadprocsql,
-    )
+    if tables or pattern or globpattern or all_tables:
+        tablelist = select_tables(
+            dbutil.get_source_tables(), tables, pattern, globpattern
+        )
+        logger.info(f"...Reflecting {len(tablelist)} tables")
+        dbutil.reflect_source_tables(tablelist)
+    else:
+        # select tables from source
+        tablelist = [dbutil.get_source_table()]
 
-    # * create temporal table
-    temporaltablesql, temporalloadprocsql = dbutil.get_temporal_ddl(table)
-    saveOutputFile(
-        settings.get("outputdir"),
-        settings.get("temporal_schema"),
-        "Tables",
-        table,
-        temporaltablesql,
-    )
-    # * create load to temporal table
-    saveOutputFile(
-        settings.get("outputdir"),
-        settings.get("temporal_schema"),
-        "Stored Procedures",
-        f'Populate{table.replace(" ", "")}',
-        temporalloadprocsql,
-    )
+    if load:
+        load_tables(settings, dbutil, tablelist)
+        EngineRegistry.report()
+        return
 
-    # * create scd1or2 dim table
-    dimensionsql, dimensionloadsql = dbutil.get_dimension_ddl(table)
-    saveOutputFile(
-        settings.get("outputdir"),
-        settings.get("dimension_schema"),
-        "Tables",
-        table,
-        dimensionsql,
-    )
-    # * create load to dim
-    saveOutputFile(
-        settings.get("outputdir"),
-        settings.get("dimension_schema"),
-        "Stored Procedures",
-        f'BuildDim{table.replace(" ", "")}',
-        dimensionloadsql,
-    )
+    manifest = Manifest(settings.get("outputdir"))
+    results = []
+    todo = {}
+    for table in tablelist:
+        try:
+            settings.set_table(table)
+            with tracing.span("fingerprint", table=table):
+                fingerprint = manifest.fingerprint(
+                    settings, dbutil.get_source_columns(table)
+                )
+        except Exception as e:
+            if len(tablelist) == 1:
+                raise
+            logger.exception(f"...Failed {table}")
+            results.append((table, "failed", e))
+            continue
+        if not force and manifest.is_current(table, fingerprint):
+            logger.debug(f"...{table} unchanged, skipping")
+            results.append((table, "unchanged", None))
+        else:
+            todo[table] = fingerprint
 
-    # format output nicely
-    logger.info("...formatting output")
-    me = os.path.abspath(__file__)
-    binpath = os.path.realpath(os.path.join(me, os.pardir, os.pardir, "bin"))
-    sqlformatter = os.path.join(binpath, "SqlFormatter.exe")
-    process = subprocess.Popen(
-        [sqlformatter, settings.get("outputdir"), "/ae", "/b-", "/r", "/sk"]
-    )
-    process.wait()
-    logger.info("...tidying up")
-    # poorsql doesn't like some of the temporal table stuff, so remove these
-    # lines
-    # --WARNING!  ERRORS ENCOUNTERED DURING SQL PARSING!
-    for filepath in glob.iglob(f'{settings.get("outputdir")}/**/*.sql', recursive=True):
-        with open(filepath, "r") as file:
-            s = file.read()
-        with open(filepath, "w") as file:
-            file.write(
-                s.replace("--WARNING! ERRORS ENCOUNTERED DURING SQL PARSING!", "")
-                .lstrip()
-                .rstrip()
-            )
+    for table, artifacts, e in generate_tables(settings, dbutil, list(todo), jobs):
+        try:
+            if e is not None:
+                raise e
+            files = save_table(settings, table, artifacts)
+            manifest.record(table, todo[table], files)
+            results.append((table, "generated", None))
+        except Exception as e:
+            manifest.forget(table)
+            if len(tablelist) == 1:
+                manifest.save()
+                raise
+            logger.exception(f"...Failed {table}")
+            results.append((table, "failed", e))
+    manifest.save()
+
+    if len(tablelist) > 1:
+        counts = {"generated": 0, "unchanged": 0, "failed": 0}
+        for table, status, e in results:
+            counts[status] += 1
+        logger.info(
+            f"...Summary: {counts['generated']} generated, "
+            f"{counts['unchanged']} unchanged, {counts['failed']} failed"
+        )
+        for table, status, e in results:
+            if status == "failed":
+                logger.error(f"   {table}: {e}")
+
+    if deploy:
+        deploy_tables(settings, manifest, tablelist, jobs, force)
 
+    EngineRegistry.report()
     logger.info("All done!")
 
 
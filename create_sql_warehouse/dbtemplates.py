@@ -1,4 +1,15 @@
-from jinja2 import Template
+from jinja2 import Template as JinjaTemplate
+from tracing import span
+
+
+class Template(JinjaTemplate):
+    # every render is a tracing span named after the template
+    trace_name = None
+
+    def render(self, *args, **kwargs):
+        with span("render", template=self.trace_name):
+            return super().render(*args, **kwargs)
+
 
 select_source_tables_template = Template(
     """
@@ -11,6 +22,59 @@ order by TABLE_TYPE, TABLE_NAME
 """
 )
 
+select_modify_dates_template = Template(
+    """
+select 
+    o.name,
+    o.modify_date
+from sys.objects o
+join sys.schemas s on s.schema_id = o.schema_id
+where s.name = '{{source_schema}}'
+and o.type in ('U', 'V')
+"""
+)
+
+select_catalog_columns_template = Template(
+    """
+select 
+    o.name as table_name,
+    c.name as column_name,
+    t.name as type_name,
+    c.max_length,
+    c.precision,
+    c.scale,
+    c.collation_name,
+    c.is_nullable,
+    c.is_identity,
+    c.is_computed
+from sys.columns c
+join sys.objects o on o.object_id = c.object_id
+join sys.schemas s on s.schema_id = o.schema_id
+join sys.types t on t.user_type_id = case 
+    when c.system_type_id = 240 then c.user_type_id 
+    else c.system_type_id end
+where s.name = '{{source_schema}}'
+and o.type in ('U', 'V')
+order by o.name, c.column_id
+"""
+)
+
+select_catalog_primary_keys_template = Template(
+    """
+select 
+    o.name as table_name,
+    c.name as column_name
+from sys.indexes i
+join sys.objects o on o.object_id = i.object_id
+join sys.schemas s on s.schema_id = o.schema_id
+join sys.index_columns ic on ic.object_id = i.object_id and ic.index_id = i.index_id
+join sys.columns c on c.object_id = ic.object_id and c.column_id = ic.column_id
+where i.is_primary_key = 1
+and s.name = '{{source_schema}}'
+order by o.name, ic.key_ordinal
+"""
+)
+
 drop_procedure_template = Template(
     """
 {% if dropfirst %}
@@ -38,6 +102,9 @@ drop table [{{schema}}].[{{table}}];
 {% endif%}
 
 {{create}};    
+{%- for statement in after_create or [] %}
+{{statement}};
+{%- endfor %}
 """
 )
 
@@ -68,8 +135,24 @@ BEGIN CATCH
     --Do nothing
 END CATCH
 GO
+{%- if partitioned %}
+
+BEGIN TRY
+    drop table [{{schema}}].[{{table}}HistoryExpired]
+END TRY
+BEGIN CATCH
+    --Do nothing
+END CATCH
+GO
+{%- endif %}
 {% endif %}    
+{%- for statement in before_create or [] %}
+{{statement}};
+{%- endfor %}
 {{create}};
+{%- for statement in after_create or [] %}
+{{statement}};
+{%- endfor %}
 
 """
 )
@@ -89,22 +172,257 @@ GO
 CREATE PROCEDURE [{{staging_schema}}].[{{procedurename}}] AS 
 BEGIN
     SET NOCOUNT ON;
+    {%- if batch_size or incremental_mode %}
+    --a failed statement rolls back and stops the load, the watermark never moves past it
+    SET XACT_ABORT ON;
+    {%- endif %}
+    {%- if incremental_mode == "watermark" %}
+    DECLARE @from {{watermark_type}} = (
+        SELECT CAST([Watermark] AS {{watermark_type}}) 
+        FROM {{watermark_table}} 
+        WHERE [ObjectName] = '{{source_table}}');
+    {%- if watermark_rowversion %}
+    --a row is written with the rowversion of its statement and may commit after
+    --this load, stop below the oldest rowversion not committed yet
+    DECLARE @to {{watermark_type}};
+    EXEC [{{source_db}}].sys.sp_executesql 
+        N'SELECT @to = CAST(CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1 AS BINARY(8))',
+        N'@to BINARY(8) OUTPUT',
+        @to = @to OUTPUT;
+    {%- elif watermark_lag %}
+    --a row is stamped before its transaction commits, maybe after this load,
+    --only read up to longer ago than the source's transactions take
+    DECLARE @to {{watermark_type}} = CAST(DATEADD(SECOND, -{{watermark_lag}}, {{watermark_clock}}) AS {{watermark_type}});
+    {%- else %}
+    DECLARE @to {{watermark_type}} = (
+        SELECT MAX([{{watermark_column}}]) 
+        FROM [{{source_db}}].[{{source_schema}}].[{{source_table}}]);
+    {%- endif %}
+    --the watermark never moves back
+    IF @to < @from
+        SET @to = @from;
+    {%- elif incremental_mode == "change_tracking" %}
+    DECLARE @from BIGINT = (
+        SELECT CAST([Watermark] AS BIGINT) 
+        FROM {{watermark_table}} 
+        WHERE [ObjectName] = '{{source_table}}');
+    DECLARE @to BIGINT;
+    DECLARE @min_valid BIGINT;
+    EXEC [{{source_db}}].sys.sp_executesql 
+        N'SELECT @to = CHANGE_TRACKING_CURRENT_VERSION(), @min_valid = CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID(N''[{{source_schema}}].[{{source_table}}]''))',
+        N'@to BIGINT OUTPUT, @min_valid BIGINT OUTPUT',
+        @to = @to OUTPUT, @min_valid = @min_valid OUTPUT;
+    --changes older than the retention period are gone, start over with a full snapshot
+    IF @from < @min_valid
+        SET @from = NULL;
+    {%- endif %}
+    {%- if incremental_mode %}
+    --@from is the last delta the temporal load merged, a delta staged since then
+    --is reloaded within this one, so truncating it loses nothing. Until this
+    --load finishes there is no staged delta for the temporal load to commit
+    UPDATE {{watermark_table}} 
+    SET [PendingWatermark] = NULL 
+    WHERE [ObjectName] = '{{source_table}}';
+    {%- endif %}
     TRUNCATE TABLE {{staging_table}};
-    INSERT INTO {{staging_table}} (
+    {%- if index_after_load %}
+    --load into a heap, the indexes are built once the rows are in
+    {%- for name, sql in after_load_indexes %}
+    DROP INDEX IF EXISTS [{{name}}] ON {{staging_table}};
+    {%- endfor %}
+    DROP INDEX IF EXISTS [{{index_name}}] ON {{staging_table}};
+    {%- endif %}
+    {%- if incremental_mode == "change_tracking" %}
+    IF @from IS NULL
+    BEGIN
+    {%- endif %}
+    {%- if batch_size %}
+    DECLARE @batch_from {{batch_key_type}};
+    DECLARE @batch_to {{batch_key_type}};
+    WHILE 1 = 1
+    BEGIN
+        SELECT @batch_to = MAX([{{batch_key}}]) 
+        FROM (
+            SELECT TOP ({{batch_size}}) [{{batch_key}}] 
+            FROM [{{source_db}}].[{{source_schema}}].[{{source_table}}]
+            WHERE (@batch_from IS NULL OR [{{batch_key}}] > @batch_from)
+            {%- if incremental_mode == "watermark" %}
+            AND (@from IS NULL OR [{{watermark_column}}] > @from) AND [{{watermark_column}}] <= @to
+            {%- endif %}
+            ORDER BY [{{batch_key}}]) AS batch;
+        IF @batch_to IS NULL
+            BREAK;
+        BEGIN TRY
+        BEGIN TRANSACTION;
+    {%- endif %}
+    INSERT INTO {{staging_table}} {{- " WITH (TABLOCK)" if tablock }} (
     {% for col in staging_columns %}
     {{col}}{{ "," if not loop.last }}
     {% endfor %}
     )
     SELECT 
     {% for col in staging_columns %}{{col}}{{ "," if not loop.last }}{% endfor %}
-    FROM [{{source_db}}].[{{source_schema}}].[{{source_table}}];
+    FROM [{{source_db}}].[{{source_schema}}].[{{source_table}}]
+    {%- if batch_size %}
+    WHERE (@batch_from IS NULL OR [{{batch_key}}] > @batch_from) AND [{{batch_key}}] <= @batch_to
+    {%- if incremental_mode == "watermark" %}
+    AND (@from IS NULL OR [{{watermark_column}}] > @from) AND [{{watermark_column}}] <= @to
+    {%- endif %}
+    {%- elif incremental_mode == "watermark" %}
+    WHERE (@from IS NULL OR [{{watermark_column}}] > @from) AND [{{watermark_column}}] <= @to
+    {%- endif %};
+    {%- if batch_size %}
+        COMMIT TRANSACTION;
+        SET @batch_from = @batch_to;
+        END TRY
+        BEGIN CATCH
+            IF @@TRANCOUNT > 0
+                ROLLBACK TRANSACTION;
+            THROW;
+        END CATCH
+    END
+    {%- endif %}
+    {%- if incremental_mode == "change_tracking" %}
+    END
+    ELSE
+        EXEC [{{source_db}}].sys.sp_executesql N'{{changes_sql}}', N'@from BIGINT', @from = @from;
+    {%- endif %}
+    {%- if index_after_load %}
+    CREATE UNIQUE CLUSTERED INDEX [{{index_name}}] ON {{staging_table}} ({{ index_columns|join(", ") }});
+    {%- for name, sql in after_load_indexes %}
+    {{sql}};
+    {%- endfor %}
+    {%- endif %}
+    {%- if incremental_mode %}
+    --pending until the temporal load has merged the delta
+    IF @to IS NOT NULL
+    MERGE {{watermark_table}} AS target
+    USING (SELECT '{{source_table}}' AS [ObjectName]) AS source
+    ON (target.[ObjectName] = source.[ObjectName])
+    WHEN MATCHED THEN UPDATE 
+        SET [PendingWatermark] = CAST(@to AS SQL_VARIANT), [UpdatedAt] = SYSUTCDATETIME()
+    WHEN NOT MATCHED THEN INSERT ([ObjectName], [Watermark], [PendingWatermark], [UpdatedAt])
+        VALUES (source.[ObjectName], NULL, CAST(@to AS SQL_VARIANT), SYSUTCDATETIME());
+    {%- endif %}
 END
 GO  
 """
 )
 
+change_tracking_insert_template = Template(
+    """
+INSERT INTO [{{target_db}}].{{staging_table}} {{- " WITH (TABLOCK)" if tablock }} ({% for col in staging_columns %}{{col}},{% endfor %}[{{change_operation_column}}])
+SELECT {% for col in staging_columns %}{{ "ct." if col in key_columns else "src." }}{{col}},{% endfor %}ct.[SYS_CHANGE_OPERATION]
+FROM CHANGETABLE(CHANGES [{{source_schema}}].[{{source_table}}], @from) AS ct
+LEFT JOIN [{{source_schema}}].[{{source_table}}] AS src
+ON ({% for col in key_columns %}src.{{col}}=ct.{{col}}{{ " AND " if not loop.last }}{% endfor %})
+"""
+)
+
+bulk_prepare_template = Template(
+    """
+TRUNCATE TABLE {{staging_table}};
+{%- if index_after_load %}
+{%- for name, sql in after_load_indexes %}
+DROP INDEX IF EXISTS [{{name}}] ON {{staging_table}};
+{%- endfor %}
+DROP INDEX IF EXISTS [{{index_name}}] ON {{staging_table}};
+{%- endif %}
+"""
+)
+
+bulk_ranges_template = Template(
+    """
+SELECT MAX([{{key}}]) AS [UpperBound]
+FROM (
+    SELECT [{{key}}], NTILE({{partitions}}) OVER (ORDER BY [{{key}}]) AS [Part]
+    FROM [{{source_schema}}].[{{source_table}}]
+    {%- if sample_percent %} TABLESAMPLE ({{sample_percent}} PERCENT){% endif %}
+) AS tiles
+GROUP BY [Part]
+ORDER BY [UpperBound]
+"""
+)
+
+bulk_select_template = Template(
+    """
+SELECT {{ columns|join(", ") }}
+FROM [{{source_schema}}].[{{source_table}}]
+{%- if key %}
+WHERE (? IS NULL OR [{{key}}] > ?) AND (? IS NULL OR [{{key}}] <= ?)
+OPTION (RECOMPILE)
+{%- endif %}
+"""
+)
+
+bulk_delete_template = Template(
+    """
+{%- if key %}
+DELETE FROM {{staging_table}}
+WHERE (? IS NULL OR [{{key}}] > ?) AND (? IS NULL OR [{{key}}] <= ?)
+OPTION (RECOMPILE)
+{%- else %}
+TRUNCATE TABLE {{staging_table}}
+{%- endif %}
+"""
+)
+
+bulk_count_template = Template(
+    """
+SELECT COUNT_BIG(*) FROM {{table}}
+"""
+)
+
+bulk_insert_template = Template(
+    """
+INSERT INTO {{staging_table}} {{- " WITH (TABLOCK)" if tablock }} ({{ columns|join(", ") }})
+VALUES ({% for col in columns %}?{{ ", " if not loop.last }}{% endfor %})
+"""
+)
+
+bulk_finish_template = Template(
+    """
+{%- if index_after_load %}
+CREATE UNIQUE CLUSTERED INDEX [{{index_name}}] ON {{staging_table}} ({{ index_columns|join(", ") }});
+{%- for name, sql in after_load_indexes %}
+{{sql}};
+{%- endfor %}
+{%- endif %}
+"""
+)
+
+watermark_table_template = Template(
+    """
+IF OBJECT_ID('[{{schema}}].[{{table}}]', 'U') IS NULL
+CREATE TABLE [{{schema}}].[{{table}}] (
+    [ObjectName] SYSNAME NOT NULL PRIMARY KEY,
+    [Watermark] SQL_VARIANT NULL,
+    {%- if pending %}
+    [PendingWatermark] SQL_VARIANT NULL,
+    {%- endif %}
+    [UpdatedAt] DATETIME2(0) NOT NULL
+);
+{%- if pending %}
+IF COL_LENGTH(N'[{{schema}}].[{{table}}]', 'PendingWatermark') IS NULL
+    ALTER TABLE [{{schema}}].[{{table}}] ADD [PendingWatermark] SQL_VARIANT NULL;
+{%- endif %}
+"""
+)
+
+# a recreated table starts empty, so the incremental loads into it start over
+watermark_reset_template = Template(
+    """
+IF OBJECT_ID(N'{{watermark_table}}', 'U') IS NOT NULL
+    DELETE FROM {{watermark_table}} 
+    WHERE [ObjectName] IN ({% for name in object_names %}'{{name}}'{{ ", " if not loop.last }}{% endfor %})
+"""
+)
+
 temporal_loadproc_template = Template(
     """
+{%- macro in_batch(column) -%}
+(@batch_from IS NULL OR {{column}} > @batch_from) AND {{column}} <= @batch_to
+{%- endmacro %}
 {% if dropfirst %}
 IF EXISTS (
         SELECT * 
@@ -119,33 +437,145 @@ GO
 {% endif %}
 CREATE PROCEDURE [{{temporal_schema}}].[{{procedurename}}] AS
 BEGIN
+    {%- if backdate_procedure %}
+    --versioning is off only while a backdate is unfinished, complete it first
+    IF OBJECTPROPERTY(OBJECT_ID(N'[{{temporal_schema}}].[{{source_table}}]'), 'TableTemporalType') <> 2
+        EXEC [{{temporal_schema}}].[{{backdate_procedure}}];
+    {%- endif %}
     declare @old_ansi_null as sql_variant = sessionproperty('ANSI_NULLS')
     SET ANSI_NULLS OFF;
     SET NOCOUNT ON;
+    {%- if incremental_mode and not batch_size %}
+    --a failed statement stops the load before the staged delta is committed
+    SET XACT_ABORT ON;
+    {%- endif %}
+    {%- if batch_size %}
+    --a failed statement rolls back its range and stops the load
+    SET XACT_ABORT ON;
+    --one key range of at most {{batch_size}} rows of either table per transaction
+    DECLARE @batch_from {{batch_key_type}};
+    DECLARE @batch_to {{batch_key_type}};
+    DECLARE @staging_to {{batch_key_type}};
+    DECLARE @temporal_to {{batch_key_type}};
+    WHILE 1 = 1
+    BEGIN
+        SELECT @staging_to = MAX([{{batch_key}}]) 
+        FROM (
+            SELECT TOP ({{batch_size}}) [{{batch_key}}] 
+            FROM [{{staging_schema}}].[{{source_table}}]
+            WHERE @batch_from IS NULL OR [{{batch_key}}] > @batch_from
+            ORDER BY [{{batch_key}}]) AS batch;
+        {%- if incremental_mode != "watermark" %}
+        SELECT @temporal_to = MAX([{{batch_key}}]) 
+        FROM (
+            SELECT TOP ({{batch_size}}) [{{batch_key}}] 
+            FROM [{{temporal_schema}}].[{{source_table}}]
+            WHERE @batch_from IS NULL OR [{{batch_key}}] > @batch_from
+            ORDER BY [{{batch_key}}]) AS batch;
+        {%- endif %}
+        IF @staging_to IS NULL AND @temporal_to IS NULL
+            BREAK;
+        SET @batch_to = CASE 
+            WHEN @temporal_to IS NULL OR @staging_to < @temporal_to THEN @staging_to 
+            ELSE @temporal_to END;
+        BEGIN TRY
+        BEGIN TRANSACTION;
+    {%- endif %}
     MERGE [{{temporal_schema}}].[{{source_table}}] AS target
     USING (
-        SELECT {% for col in merge_columns %}{{col}}{{ "," if not loop.last }}{% endfor %} FROM [{{staging_schema}}].[{{source_table}}]
+        SELECT {% for col in merge_columns %}{{col}}{{ "," if not loop.last }}{% endfor %} {{- ",[" ~ hash_column ~ "]" if hash_column }} FROM [{{staging_schema}}].[{{source_table}}]
+        {%- if incremental_mode == "change_tracking" %}
+        WHERE ([{{change_operation_column}}] IS NULL OR [{{change_operation_column}}] <> 'D')
+        {%- endif %}
+        {%- if batch_size %}
+        {{ "AND" if incremental_mode == "change_tracking" else "WHERE" }} {{ in_batch("[" ~ batch_key ~ "]") }}
+        {%- endif %}
+        {%- if not hash_column %}
         except
         SELECT {% for col in merge_columns %}{{col}}{{ "," if not loop.last }}{% endfor %} FROM [{{temporal_schema}}].[{{source_table}}]
-    ) as source ({% for col in merge_columns %}{{col}}{{ "," if not loop.last }}{% endfor %})
+        {%- if batch_size %}
+        WHERE {{ in_batch("[" ~ batch_key ~ "]") }}
+        {%- endif %}
+        {%- endif %}
+    ) as source ({% for col in merge_columns %}{{col}}{{ "," if not loop.last }}{% endfor %} {{- ",[" ~ hash_column ~ "]" if hash_column }})
     ON ({% for col in pk_col_equality_list %}{{col}}{{ " AND " if not loop.last }}{% endfor %})    
+    {%- if hash_column %}
+    WHEN MATCHED AND (target.[{{hash_column}}] <> source.[{{hash_column}}]
+        {%- for col in unhashed_columns %} OR NOT EXISTS (SELECT target.{{col}} INTERSECT SELECT source.{{col}}){% endfor %}) THEN UPDATE
+    {%- else %}
     WHEN MATCHED THEN UPDATE
+    {%- endif %}
         SET {% for col in col_equality_list %}{{col}}{{ "," if not loop.last }}{% endfor %}
     WHEN NOT MATCHED BY TARGET THEN INSERT
         ({% for col in merge_columns %}{{col}}{{ "," if not loop.last }}{% endfor %})
         VALUES ({% for col in merge_columns %}{{col}}{{ "," if not loop.last }}{% endfor %});
 
+    {% if incremental_mode == "change_tracking" %}
+    --a full snapshot has no change operations, anything missing from it was deleted
+    IF EXISTS (SELECT 1 FROM [{{staging_schema}}].[{{source_table}}] WHERE [{{change_operation_column}}] IS NULL)
+    BEGIN
+    {%- endif %}
+    {%- if incremental_mode != "watermark" %}
+    {%- set delete_columns = key_columns if hash_column else merge_columns %}
+    {%- if batch_size %}
+    --the merge target is the batch, rows outside the range are not missing
+    WITH batch AS (
+        SELECT * FROM [{{temporal_schema}}].[{{source_table}}]
+        WHERE {{ in_batch("[" ~ batch_key ~ "]") }})
+    MERGE batch AS target
+    {%- else %}
     MERGE [{{temporal_schema}}].[{{source_table}}] AS target
+    {%- endif %}
     USING (
-        SELECT {% for col in merge_columns %}{{col}}{{ "," if not loop.last }}{% endfor %} FROM [{{staging_schema}}].[{{source_table}}]
-    ) as source ( {% for col in merge_columns %}{{col}}{{ "," if not loop.last }}{% endfor %})
+        SELECT {% for col in delete_columns %}{{col}}{{ "," if not loop.last }}{% endfor %} FROM [{{staging_schema}}].[{{source_table}}]
+        {%- if batch_size %}
+        WHERE {{ in_batch("[" ~ batch_key ~ "]") }}
+        {%- endif %}
+    ) as source ( {% for col in delete_columns %}{{col}}{{ "," if not loop.last }}{% endfor %})
     ON ({% for col in pk_col_equality_list %}{{col}}{{ " AND " if not loop.last }}{% endfor %})
     WHEN NOT MATCHED BY SOURCE THEN DELETE;
+    {%- endif %}
+    {%- if incremental_mode == "change_tracking" %}
+    END
+    ELSE
+        DELETE target
+        FROM [{{temporal_schema}}].[{{source_table}}] AS target
+        JOIN [{{staging_schema}}].[{{source_table}}] AS source
+        ON ({% for col in pk_col_equality_list %}{{col}}{{ " AND " if not loop.last }}{% endfor %})
+        WHERE source.[{{change_operation_column}}] = 'D'
+        {%- if batch_size %}
+        AND {{ in_batch("source.[" ~ batch_key ~ "]") }}
+        {%- endif %};
+    {%- endif %}
+    {%- if batch_size %}
+        COMMIT TRANSACTION;
+        SET @batch_from = @batch_to;
+        END TRY
+        BEGIN CATCH
+            IF @@TRANCOUNT > 0
+                ROLLBACK TRANSACTION;
+            THROW;
+        END CATCH
+        {%- if batch_pause %}
+        WAITFOR DELAY '{{batch_pause}}';
+        {%- endif %}
+    END
+    {%- endif %}
+
+    {%- if incremental_mode %}
+
+    --the staged delta is merged, the next staging load starts after it
+    UPDATE {{watermark_table}} 
+    SET [Watermark] = [PendingWatermark], [PendingWatermark] = NULL, [UpdatedAt] = SYSUTCDATETIME()
+    WHERE [ObjectName] = '{{source_table}}' AND [PendingWatermark] IS NOT NULL;
+    {%- endif %}
 
     if @old_ansi_null = 1 
     SET ANSI_NULLS ON
 
-    {% if backdate_hist_to %}   
+    {% if backdate_procedure %}
+    EXEC [{{temporal_schema}}].[{{backdate_procedure}}];
+    {% elif backdate_hist_to %}   
     --this will only be run on the first load, since after that min(validfrom) will equal backfill date
     declare @oldest datetime2(7) = (SELECT MIN([ValidFrom]) FROM [{{temporal_schema}}].[{{source_table}}])
     IF @oldest <> '{{backdate_hist_to}}'
@@ -163,6 +593,191 @@ GO
 """
 )
 
+backdate_proc_template = Template(
+    """
+{% if dropfirst %}
+IF EXISTS (
+        SELECT * 
+        FROM INFORMATION_SCHEMA.ROUTINES 
+        WHERE routine_type = 'PROCEDURE' 
+        and SPECIFIC_NAME = '{{procedurename}}' 
+        AND SPECIFIC_SCHEMA = '{{temporal_schema}}')
+    DROP PROCEDURE [{{temporal_schema}}].[{{procedurename}}];
+GO
+{% endif %}
+CREATE PROCEDURE [{{temporal_schema}}].[{{procedurename}}] AS
+BEGIN
+    SET NOCOUNT ON;
+    --a failed range rolls back with its progress row, the next run redoes it
+    SET XACT_ABORT ON;
+    --a finished backdate leaves a marker row, checking it is a key seek
+    IF EXISTS (SELECT 1 FROM {{control_table}} WHERE [ObjectName] = '{{done_marker}}')
+        RETURN;
+    --the last key backdated by an interrupted run
+    DECLARE @batch_from {{batch_key_type}} = (
+        SELECT CAST([Watermark] AS {{batch_key_type}}) 
+        FROM {{control_table}} 
+        WHERE [ObjectName] = '{{progress_marker}}');
+    DECLARE @batch_to {{batch_key_type}};
+    IF @batch_from IS NULL
+    BEGIN
+        --nothing loaded yet
+        IF NOT EXISTS (SELECT 1 FROM [{{temporal_schema}}].[{{source_table}}])
+            RETURN;
+        --backdated before there were markers, any single row tells
+        IF (SELECT TOP (1) [ValidFrom] FROM [{{temporal_schema}}].[{{source_table}}]) = '{{backdate_hist_to}}'
+        BEGIN
+            INSERT INTO {{control_table}} ([ObjectName], [Watermark], [UpdatedAt])
+                VALUES ('{{done_marker}}', NULL, SYSUTCDATETIME());
+            RETURN;
+        END
+    END
+
+    IF OBJECTPROPERTY(OBJECT_ID(N'[{{temporal_schema}}].[{{source_table}}]'), 'TableTemporalType') = 2
+        EXEC sp_executesql N'ALTER TABLE [{{temporal_schema}}].[{{source_table}}] SET (system_versioning = off);';
+    IF EXISTS (SELECT 1 FROM sys.periods WHERE [object_id] = OBJECT_ID(N'[{{temporal_schema}}].[{{source_table}}]'))
+        EXEC sp_executesql N'ALTER TABLE [{{temporal_schema}}].[{{source_table}}] DROP PERIOD FOR SYSTEM_TIME;';
+
+    --one key range of {{batch_size}} rows per transaction, the progress row
+    --commits with it so a failed run resumes after the last finished range
+    WHILE 1 = 1
+    BEGIN
+        SELECT @batch_to = MAX([{{batch_key}}]) 
+        FROM (
+            SELECT TOP ({{batch_size}}) [{{batch_key}}] 
+            FROM [{{temporal_schema}}].[{{source_table}}]
+            WHERE @batch_from IS NULL OR [{{batch_key}}] > @batch_from
+            ORDER BY [{{batch_key}}]) AS batch;
+        IF @batch_to IS NULL
+            BREAK;
+        BEGIN TRY
+        BEGIN TRANSACTION;
+        EXEC sp_executesql 
+            N'UPDATE [{{temporal_schema}}].[{{source_table}}] SET ValidFrom=''{{backdate_hist_to}}'' WHERE (@batch_from IS NULL OR [{{batch_key}}] > @batch_from) AND [{{batch_key}}] <= @batch_to;',
+            N'@batch_from {{batch_key_type}}, @batch_to {{batch_key_type}}',
+            @batch_from = @batch_from, @batch_to = @batch_to;
+        MERGE {{control_table}} AS target
+        USING (SELECT '{{progress_marker}}' AS [ObjectName]) AS source
+        ON (target.[ObjectName] = source.[ObjectName])
+        WHEN MATCHED THEN UPDATE 
+            SET [Watermark] = CAST(@batch_to AS SQL_VARIANT), [UpdatedAt] = SYSUTCDATETIME()
+        WHEN NOT MATCHED THEN INSERT ([ObjectName], [Watermark], [UpdatedAt])
+            VALUES (source.[ObjectName], CAST(@batch_to AS SQL_VARIANT), SYSUTCDATETIME());
+        COMMIT TRANSACTION;
+        SET @batch_from = @batch_to;
+        END TRY
+        BEGIN CATCH
+            IF @@TRANCOUNT > 0
+                ROLLBACK TRANSACTION;
+            THROW;
+        END CATCH
+    END
+
+    EXEC sp_executesql N'ALTER TABLE [{{temporal_schema}}].[{{source_table}}] ADD PERIOD FOR SYSTEM_TIME (ValidFrom,ValidTo);';
+    EXEC sp_executesql N'ALTER TABLE [{{temporal_schema}}].[{{source_table}}] set (system_versioning = on (HISTORY_TABLE=[{{temporal_schema}}].[{{source_table}}History]));';
+    BEGIN TRY
+    BEGIN TRANSACTION;
+    DELETE FROM {{control_table}} WHERE [ObjectName] = '{{progress_marker}}';
+    INSERT INTO {{control_table}} ([ObjectName], [Watermark], [UpdatedAt])
+        VALUES ('{{done_marker}}', NULL, SYSUTCDATETIME());
+    COMMIT TRANSACTION;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
+        THROW;
+    END CATCH
+    SET NOCOUNT OFF;
+END
+
+GO
+"""
+)
+
+partition_function_template = Template(
+    """
+--boundaries from the current {{interval}} on, so the last partition, which the
+--maintenance proc splits, only gets rows once the next {{ahead}} {{interval}}s are over
+IF NOT EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = N'{{function}}')
+BEGIN
+    DECLARE @current DATETIME2(0) = DATEADD({{interval}}, DATEDIFF({{interval}}, 0, SYSUTCDATETIME()), 0);
+    CREATE PARTITION FUNCTION [{{function}}] (DATETIME2(0)) AS RANGE RIGHT FOR VALUES (@current{% for i in range(1, ahead + 1) %}, DATEADD({{interval}}, {{i}}, @current){% endfor %});
+END
+IF NOT EXISTS (SELECT 1 FROM sys.partition_schemes WHERE name = N'{{scheme}}')
+    CREATE PARTITION SCHEME [{{scheme}}] AS PARTITION [{{function}}] ALL TO ([{{filegroup}}])
+"""
+)
+
+history_maintenance_template = Template(
+    """
+{% if dropfirst %}
+IF EXISTS (
+        SELECT * 
+        FROM INFORMATION_SCHEMA.ROUTINES 
+        WHERE routine_type = 'PROCEDURE' 
+        and SPECIFIC_NAME = '{{procedurename}}' 
+        AND SPECIFIC_SCHEMA = '{{temporal_schema}}')
+    DROP PROCEDURE [{{temporal_schema}}].[{{procedurename}}];
+GO
+{% endif %}
+CREATE PROCEDURE [{{temporal_schema}}].[{{procedurename}}] AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @current DATETIME2(0) = DATEADD({{interval}}, DATEDIFF({{interval}}, 0, SYSUTCDATETIME()), 0);
+    DECLARE @cutoff DATETIME2(0) = DATEADD({{interval}}, -{{retention}}, @current);
+    DECLARE @boundary DATETIME2(0);
+    DECLARE @boundary_text NVARCHAR(30);
+
+    --partition 1 holds everything before the lowest boundary, once that is
+    --past the retention cutoff it is switched out, truncated and merged away
+    WHILE 1 = 1
+    BEGIN
+        SET @boundary = (
+            SELECT MIN(CAST(rv.[value] AS DATETIME2(0))) 
+            FROM sys.partition_range_values rv 
+            JOIN sys.partition_functions pf ON pf.[function_id] = rv.[function_id]
+            WHERE pf.[name] = N'{{function}}');
+        IF @boundary IS NULL OR @boundary > @cutoff
+            BREAK;
+        ALTER TABLE [{{temporal_schema}}].[{{history_table}}] SWITCH PARTITION 1 TO [{{temporal_schema}}].[{{expired_table}}];
+        TRUNCATE TABLE [{{temporal_schema}}].[{{expired_table}}];
+        ALTER PARTITION FUNCTION [{{function}}]() MERGE RANGE (@boundary);
+    END
+
+    --split the upcoming partitions, only while they are still empty: splitting
+    --one with rows moves them under a schema modification lock on history
+    SET @boundary = (
+        SELECT DATEADD({{interval}}, 1, MAX(CAST(rv.[value] AS DATETIME2(0)))) 
+        FROM sys.partition_range_values rv 
+        JOIN sys.partition_functions pf ON pf.[function_id] = rv.[function_id]
+        WHERE pf.[name] = N'{{function}}');
+    IF @boundary IS NULL
+        SET @boundary = @cutoff;
+    WHILE @boundary <= DATEADD({{interval}}, {{ahead}}, @current)
+    BEGIN
+        IF EXISTS (
+            SELECT 1 
+            FROM sys.partitions 
+            WHERE [object_id] = OBJECT_ID(N'[{{temporal_schema}}].[{{history_table}}]') 
+            AND [index_id] IN (0, 1) 
+            AND [partition_number] = $PARTITION.[{{function}}](@boundary) 
+            AND [rows] > 0)
+        BEGIN
+            --every later boundary falls in the same partition
+            SET @boundary_text = CONVERT(NVARCHAR(30), @boundary, 126);
+            RAISERROR(N'{{history_table}}: the partition for %s has rows, not splitting it', 10, 1, @boundary_text) WITH NOWAIT;
+            BREAK;
+        END
+        ALTER PARTITION FUNCTION [{{function}}]() SPLIT RANGE (@boundary);
+        SET @boundary = DATEADD({{interval}}, 1, @boundary);
+    END
+    SET NOCOUNT OFF;
+END
+
+GO
+"""
+)
+
 scd1_load_template = Template(
     """
 {% if dropfirst %}    
@@ -178,6 +793,67 @@ GO;
 CREATE PROCEDURE [{{dimension_schema}}].[{{procedurename}}] AS
 BEGIN
     SET NOCOUNT ON;
+    {%- if incremental %}
+    --only keys with versions opened or closed since the last build are merged,
+    --unchanged rows and existing surrogate keys are left alone
+    SET XACT_ABORT ON;
+    DECLARE @from DATETIME2(0) = (
+        SELECT CAST([Watermark] AS DATETIME2(0)) 
+        FROM {{watermark_table}} 
+        WHERE [ObjectName] = '{{procedurename}}');
+    --ValidFrom and ValidTo are transaction begin times to the second, versions
+    --still committing stamped before now are only read once they are {{lag}}s old
+    DECLARE @to DATETIME2(0) = CAST(DATEADD(SECOND, -{{lag}}, SYSUTCDATETIME()) AS DATETIME2(0));
+
+    SELECT DISTINCT {% for col in key_columns %}[{{col}}]{{ "," if not loop.last }}{% endfor %}
+    INTO #changed
+    FROM [{{temporal_schema}}].[{{temporal_table}}] FOR SYSTEM_TIME ALL
+    WHERE ([ValidFrom] < @to AND (@from IS NULL OR [ValidFrom] >= @from)) 
+        OR ([ValidTo] < @to AND (@from IS NULL OR [ValidTo] >= @from));
+
+    --the merge and the watermark commit together or not at all
+    BEGIN TRY
+    BEGIN TRANSACTION;
+    WITH changed AS (
+        SELECT * FROM [{{dimension_schema}}].[{{dimension_table}}] AS dim
+        WHERE EXISTS (
+            SELECT 1 FROM #changed AS c 
+            WHERE {% for col in key_columns %}c.[{{col}}]=dim.[{{col}}]{{ " AND " if not loop.last }}{% endfor %}))
+    MERGE changed AS target
+    USING (
+        SELECT {% for col in selected_columns %}t.[{{col}}]{{ "," if not loop.last }}{% endfor %}
+        FROM [{{temporal_schema}}].[{{temporal_table}}] FOR SYSTEM_TIME AS OF @to AS t
+        JOIN #changed AS c 
+        ON ({% for col in key_columns %}c.[{{col}}]=t.[{{col}}]{{ " AND " if not loop.last }}{% endfor %})
+    ) AS source ({% for col in selected_columns %}[{{col}}]{{ "," if not loop.last }}{% endfor %})
+    ON ({% for col in key_columns %}target.[{{col}}]=source.[{{col}}]{{ " AND " if not loop.last }}{% endfor %})
+    WHEN MATCHED AND NOT EXISTS (
+        SELECT {% for col in selected_columns %}target.[{{col}}]{{ "," if not loop.last }}{% endfor %}
+        INTERSECT
+        SELECT {% for col in selected_columns %}source.[{{col}}]{{ "," if not loop.last }}{% endfor %}) THEN UPDATE
+        SET {% for col in selected_columns %}target.[{{col}}]=source.[{{col}}]{{ "," if not loop.last }}{% endfor %}
+    WHEN NOT MATCHED BY TARGET THEN INSERT
+        ({% for col in selected_columns %}[{{col}}]{{ "," if not loop.last }}{% endfor %})
+        VALUES ({% for col in selected_columns %}source.[{{col}}]{{ "," if not loop.last }}{% endfor %})
+    WHEN NOT MATCHED BY SOURCE THEN DELETE;
+
+    MERGE {{watermark_table}} AS target
+    USING (SELECT '{{procedurename}}' AS [ObjectName]) AS source
+    ON (target.[ObjectName] = source.[ObjectName])
+    WHEN MATCHED THEN UPDATE 
+        SET [Watermark] = CAST(@to AS SQL_VARIANT), [UpdatedAt] = SYSUTCDATETIME()
+    WHEN NOT MATCHED THEN INSERT ([ObjectName], [Watermark], [UpdatedAt])
+        VALUES (source.[ObjectName], CAST(@to AS SQL_VARIANT), SYSUTCDATETIME());
+    COMMIT TRANSACTION;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
+        THROW;
+    END CATCH
+
+    DROP TABLE #changed;
+    {%- else %}
     declare @d as DATE = (select GETDATE())
     truncate table [{{dimension_schema}}].[{{dimension_table}}];        
     DBCC CHECKIDENT ('[{{dimension_schema}}].[{{dimension_table}}]', RESEED, 1);
@@ -188,6 +864,7 @@ BEGIN
     SELECT {% for col in selected_columns %}[{{col}}]{{ "," if not loop.last }}{% endfor %}
     FROM [{{temporal_schema}}].[{{temporal_table}}]
     FOR SYSTEM_TIME AS OF @d
+    {%- endif %}
     SET NOCOUNT OFF;
 END;
 
@@ -210,6 +887,70 @@ GO;
 CREATE PROCEDURE [{{dimension_schema}}].[{{procedurename}}] AS
 BEGIN
     SET NOCOUNT ON;
+    {%- if incremental %}
+    --only versions opened or closed since the last build are read, rows are
+    --matched on their values so existing surrogate keys never change
+    SET XACT_ABORT ON;
+    DECLARE @from DATETIME2(0) = (
+        SELECT CAST([Watermark] AS DATETIME2(0)) 
+        FROM {{watermark_table}} 
+        WHERE [ObjectName] = '{{procedurename}}');
+    --ValidFrom and ValidTo are transaction begin times to the second, versions
+    --still committing stamped before now are only read once they are {{lag}}s old
+    DECLARE @to DATETIME2(0) = CAST(DATEADD(SECOND, -{{lag}}, SYSUTCDATETIME()) AS DATETIME2(0));
+
+    SELECT {% for col in selected_columns %}[{{col}}]{{ "," if not loop.last }}{% endfor %},MIN([ValidFrom]) as ValidFrom ,MAX([ValidTo]) as ValidTo
+    INTO #changes
+    FROM [{{temporal_schema}}].[{{temporal_table}}] FOR SYSTEM_TIME ALL
+    WHERE ([ValidFrom] < @to AND (@from IS NULL OR [ValidFrom] >= @from)) 
+        OR ([ValidTo] < @to AND (@from IS NULL OR [ValidTo] >= @from))
+    GROUP BY {% for col in selected_columns %}[{{col}}]{{ "," if not loop.last }}{% endfor %};
+
+    --expiring, inserting and the watermark commit together or not at all
+    BEGIN TRY
+    BEGIN TRANSACTION;
+    --close out versions that ended and extend the ones that continue
+    UPDATE target 
+    SET target.[ValidFrom] = CASE WHEN source.[ValidFrom] < target.[ValidFrom] THEN source.[ValidFrom] ELSE target.[ValidFrom] END,
+        target.[ValidTo] = source.[ValidTo]
+    FROM [{{dimension_schema}}].[{{dimension_table}}] AS target
+    JOIN #changes AS source
+    ON ({% for col in key_columns %}target.[{{col}}]=source.[{{col}}]{{ " AND " if not loop.last }}{% endfor %})
+    WHERE EXISTS (
+        SELECT {% for col in selected_columns %}target.[{{col}}]{{ "," if not loop.last }}{% endfor %}
+        INTERSECT
+        SELECT {% for col in selected_columns %}source.[{{col}}]{{ "," if not loop.last }}{% endfor %});
+
+    INSERT INTO [{{dimension_schema}}].[{{dimension_table}}] (
+    {% for col in selected_columns %}[{{col}}]{{ "," if not loop.last }}{% endfor %},[ValidFrom],[ValidTo])
+    select {% for col in selected_columns %}source.[{{col}}]{{ "," if not loop.last }}{% endfor %},source.[ValidFrom],source.[ValidTo] 
+    FROM #changes AS source
+    WHERE NOT EXISTS (
+        SELECT 1 
+        FROM [{{dimension_schema}}].[{{dimension_table}}] AS target
+        WHERE {% for col in key_columns %}target.[{{col}}]=source.[{{col}}]{{ " AND " if not loop.last }}{% endfor %}
+        AND EXISTS (
+            SELECT {% for col in selected_columns %}target.[{{col}}]{{ "," if not loop.last }}{% endfor %}
+            INTERSECT
+            SELECT {% for col in selected_columns %}source.[{{col}}]{{ "," if not loop.last }}{% endfor %}));
+
+    MERGE {{watermark_table}} AS target
+    USING (SELECT '{{procedurename}}' AS [ObjectName]) AS source
+    ON (target.[ObjectName] = source.[ObjectName])
+    WHEN MATCHED THEN UPDATE 
+        SET [Watermark] = CAST(@to AS SQL_VARIANT), [UpdatedAt] = SYSUTCDATETIME()
+    WHEN NOT MATCHED THEN INSERT ([ObjectName], [Watermark], [UpdatedAt])
+        VALUES (source.[ObjectName], CAST(@to AS SQL_VARIANT), SYSUTCDATETIME());
+    COMMIT TRANSACTION;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
+        THROW;
+    END CATCH
+
+    DROP TABLE #changes;
+    {%- else %}
     truncate table [{{dimension_schema}}].[{{dimension_table}}];  
     DBCC CHECKIDENT ('[{{dimension_schema}}].[{{dimension_table}}]', RESEED, 1) WITH NO_INFOMSGS;
 
@@ -220,6 +961,7 @@ BEGIN
     INSERT INTO [{{dimension_schema}}].[{{dimension_table}}] (
     {% for col in selected_columns %}[{{col}}]{{ "," if not loop.last }}{% endfor %},[ValidFrom],[ValidTo])
     select {% for col in selected_columns %}[{{col}}]{{ "," if not loop.last }}{% endfor %},[ValidFrom],[ValidTo] FROM rawdim;
+    {%- endif %}
     
     SET NOCOUNT OFF;
 END
@@ -227,3 +969,8 @@ END
 GO
 """
 )
+
+
+for _name, _template in list(globals().items()):
+    if isinstance(_template, Template):
+        _template.trace_name = _name
@@ -1,112 +1,825 @@
 from dbtemplates import *
-from sqlalchemy import (
-    create_engine,
-    Table,
-    Column,
-    Integer,
-    String,
-    MetaData,
-    ForeignKey,
-    inspect,
-)
-from sqlalchemy.dialects import mssql
-from sqlalchemy.schema import CreateTable
+from engines import EngineRegistry
+from tracing import span
+from metacache import MetadataCache
+from catalog import CatalogReader
+from ddlreader import DdlScriptReader
+from tablemodel import Column, TableModel, columns_from_table
+from ddlemitter import create_table_sql, create_temporal_table_sql
+from sqlalchemy import MetaData, text
 import sys
+import re
 import logging
 
 logger = logging.getLogger(__file__)
 
+# staging column change tracking loads record the change operation in
+CHANGE_OPERATION_COLUMN = "SYS_CHANGE_OPERATION"
+incremental_modes = ["watermark", "change_tracking"]
+rowversion_types = ["TIMESTAMP", "ROWVERSION"]
+# watermark columns stamped from the clock, read up to a lag behind it
+watermark_clock_types = [
+    "DATE",
+    "SMALLDATETIME",
+    "DATETIME",
+    "DATETIME2",
+    "DATETIMEOFFSET",
+]
+watermark_lag_default = 60
+# persisted row hash the temporal merge compares instead of every column
+HASH_COLUMN = "RowHash"
+hash_sizes = {"MD5": 16, "SHA1": 20, "SHA2_256": 32, "SHA2_512": 64}
+# deterministic CONVERT styles, a persisted column can't use the default ones
+hash_convert_styles = {
+    "DATE": 126,
+    "DATETIME": 126,
+    "DATETIME2": 126,
+    "DATETIMEOFFSET": 126,
+    "SMALLDATETIME": 126,
+    "TIME": 126,
+    "FLOAT": 3,
+    "REAL": 3,
+    "BINARY": 1,
+    "VARBINARY": 1,
+}
+# types CONVERT can only take to NVARCHAR(MAX) by way of another type
+hash_convert_types = {
+    "IMAGE": "VARBINARY(MAX)",
+    "TEXT": "VARCHAR(MAX)",
+    "NTEXT": "NVARCHAR(MAX)",
+}
+# converting these is never deterministic, so no persisted hash can cover them
+unhashable_types = ["SQL_VARIANT"]
+compression_types = ["NONE", "ROW", "PAGE"]
+index_options = ["columns", "unique", "include", "clustered", "columnstore"]
+bulk_load_defaults = {
+    "batch_size": 10000,
+    "commit_interval": 100000,
+    "partitions": 1,
+    "retries": 2,
+    # fetched batches a partition may buffer ahead of its inserts
+    "queue_size": 4,
+}
+partition_intervals = ["day", "week", "month", "year"]
+dimension_lag_default = 60
+
 
 class DbUtil:
-    source_table = Table()
-    staging_table = Table()
-    temporal_table = Table()
     settings = None
 
     def __init__(self, *args, **kwargs):
         self.settings = kwargs["settingsinstance"]
+        # per table state, one DbUtil per worker when generating in parallel
+        self.source_table = None
+        self.staging_table = None
+        self.temporal_table = None
+        self.source_columns = dict(kwargs.get("source_columns") or {})
+        self.metadata_cache = None
+        self.ddl_reader = None
 
     def _get_engine(self, server, database):
-        return create_engine(
-            f"mssql+pyodbc://{server}/{database}?driver=SQL+Server+Native+Client+11.0"
+        return EngineRegistry.get_engine(
+            server, database, driver=self.settings.get("odbc_driver")
         )
 
-    def _get_table_ddl(self, table, engine):
-        ddl = str(CreateTable(table).compile(engine))
-        ddl = (
-            ddl.replace(" COLLATE SQL_Latin1_General_CP1_CI_AS", "")
-            .replace("\n", " ")
-            .replace("\t", " ")
+    def _get_table_ddl(self, table):
+        with span("emit_ddl", ddl_table=table.name):
+            return create_table_sql(table)
+
+    def _get_source_engine(self):
+        return self._get_engine(
+            self.settings.get("source_server"), self.settings.get("source_db")
         )
-        return ddl
 
-    def get_source_table(self):
-        sourcedb = self.settings.get("source_db")
-        sourceserver = self.settings.get("source_server")
-        sourceschema = self.settings.get("source_schema")
+    def _query_source(self, sql):
+        with self._get_source_engine().connect() as connection:
+            return connection.execute(text(sql)).fetchall()
 
-        source_engine = self._get_engine(sourceserver, sourcedb)
-        # select source tables
+    def _get_metadata_cache(self):
+        if self.metadata_cache is None and self.settings.get("metadata_cache_dir"):
+            self.metadata_cache = MetadataCache(
+                self.settings.get("metadata_cache_dir"),
+                self.settings.get("source_server"),
+                self.settings.get("source_db"),
+                self.settings.get("source_schema"),
+            )
+        return self.metadata_cache
+
+    def _get_ddl_reader(self):
+        # scripts are the source, no connection and no metadata cache needed
+        if self.settings.get("metadata_provider") != "ddl":
+            return None
+        if self.ddl_reader is None:
+            self.ddl_reader = DdlScriptReader(
+                self.settings.get("ddl_scripts_dir"),
+                self.settings.get("source_schema"),
+                self.settings.get("ddl_script_folders"),
+            )
+        return self.ddl_reader
+
+    def _is_offline(self):
+        if self.settings.get("offline") and self._get_metadata_cache() is None:
+            raise ValueError("offline mode needs metadata_cache_dir to be set")
+        return self.settings.get("offline")
+
+    def get_source_tables(self):
+        if self._get_ddl_reader() is not None:
+            return sorted(self._get_ddl_reader().read().keys())
+        if self._is_offline():
+            return sorted(self._get_metadata_cache().tables.keys())
         sql = select_source_tables_template.render(
-            source_db=sourcedb, source_schema=sourceschema
+            source_db=self.settings.get("source_db"),
+            source_schema=self.settings.get("source_schema"),
         )
-        result = source_engine.execute(sql)
-        tablelist = list([x[0] for x in result.fetchall()])
+        return list([x[0] for x in self._query_source(sql)])
 
+    def get_source_table(self):
+        # select source tables
+        tablelist = self.get_source_tables()
         return self.settings.get("source_table", tablelist=tablelist)
 
-    def get_staging_ddl(self, table):
-        sourcedb = self.settings.get("source_db")
-        sourceserver = self.settings.get("source_server")
+    def _get_modify_dates(self):
+        sql = select_modify_dates_template.render(
+            source_schema=self.settings.get("source_schema")
+        )
+        return dict([(x[0], x[1]) for x in self._query_source(sql)])
+
+    def reflect_source_tables(self, tables):
+        with span("reflect", tables=len(tables)):
+            self._reflect_source_tables(tables)
+
+    def _reflect_source_tables(self, tables):
+        cache = None
+        if self._get_ddl_reader() is None:
+            cache = self._get_metadata_cache()
+        missing = list(tables)
+        if cache is not None:
+            # one cheap catalog query decides which cached entries are stale
+            offline = self._is_offline()
+            modify_dates = {} if offline else self._get_modify_dates()
+            missing = []
+            for table in tables:
+                columns = None
+                if offline or table in modify_dates:
+                    columns = cache.get(table, modify_dates.get(table))
+                if columns is None:
+                    missing.append(table)
+                else:
+                    self.source_columns[table] = columns
+            logger.info(
+                f"...{len(tables) - len(missing)} tables from metadata cache, "
+                f"{len(missing)} to reflect"
+            )
+            if missing and offline:
+                raise ValueError(
+                    f"not in metadata cache, can't reflect offline: {', '.join(missing)}"
+                )
+        if not missing:
+            return
+
+        with span(
+            "reflect_source",
+            provider=self.settings.get("metadata_provider") or "reflection",
+            tables=len(missing),
+        ):
+            models = self._read_source_models(missing)
+        for table in missing:
+            columns = models[table]
+            self.source_columns[table] = columns
+            if cache is not None:
+                cache.put(table, modify_dates.get(table), columns)
+        if cache is not None:
+            cache.save()
+
+    def _read_source_models(self, tables):
         sourceschema = self.settings.get("source_schema")
-        source_engine = self._get_engine(sourceserver, sourcedb)
+        if self.settings.get("metadata_provider") == "catalog":
+            models = CatalogReader(self._get_source_engine(), sourceschema).read(
+                tables
+            )
+            notfound = [t for t in tables if t not in models]
+            if notfound:
+                raise ValueError(f"not found in catalog: {', '.join(notfound)}")
+            return models
+        if self._get_ddl_reader() is not None:
+            models = self._get_ddl_reader().read(tables)
+            notfound = [t for t in tables if t not in models]
+            if notfound:
+                raise ValueError(f"not found in ddl scripts: {', '.join(notfound)}")
+            return models
 
-        # ddl for staging table
+        # reflect a whole batch in one pass instead of one autoload per table
         meta = MetaData()
+        meta.reflect(
+            bind=self._get_source_engine(),
+            schema=sourceschema,
+            only=tables,
+            views=True,
+        )
+        return dict(
+            [
+                (table, columns_from_table(meta.tables[f"{sourceschema}.{table}"]))
+                for table in tables
+            ]
+        )
 
-        self.source_table = Table(
-            table, meta, schema=sourceschema, autoload=True, autoload_with=source_engine
+    def get_source_columns(self, table):
+        if table not in self.source_columns:
+            self.reflect_source_tables([table])
+        return self.source_columns[table]
+
+    def _build_staging_table(self, table):
+        # ddl for staging table
+        self.source_table = TableModel(
+            table,
+            self.settings.get("source_schema"),
+            tuple(self.get_source_columns(table)),
         )
-        self.source_table.schema = self.settings.get("staging_schema")
 
-        keys = [x.name for x in self.source_table.columns if x.primary_key]
+        keys = self.source_table.keys
         if len(keys) == 0:
             keys = self.settings.get(
                 "source_primary_keys", columns=self.source_table.columns
             )
 
+        self.source_keys = keys
+
         columns = self.settings.get(
             "staging_columns", columns=list([c.name for c in self.source_table.columns])
         )
+        incremental = self._get_incremental(table)
         staging_columns = [
             Column(
                 x.name,
-                x.type,
+                self._get_column_type(x),
                 primary_key=(x.name in keys),
-                nullable=self._getnullable(x, keys),
+                # deleted rows arrive with nothing but their key
+                nullable=self._getnullable(x, keys)
+                or (incremental["mode"] == "change_tracking" and x.name not in keys),
             )
             for x in self.source_table.columns
             if x.name in columns
         ]
-        self.staging_table = Table(
-            f"{table}",
-            meta,
-            *staging_columns,
-            schema=self.settings.get("staging_schema"),
+        if incremental["mode"] == "change_tracking":
+            staging_columns.append(
+                Column(CHANGE_OPERATION_COLUMN, "NCHAR(1)", nullable=True)
+            )
+        self.staging_table = TableModel(
+            table, self.settings.get("staging_schema"), tuple(staging_columns)
+        )
+
+    def _get_incremental(self, table):
+        # e.g. "staging_incremental":
+        #   {"Orders": {"mode": "watermark", "column": "ModifiedAt"}}
+        incremental = self.settings.table_option("staging_incremental") or {}
+        unknown = set(incremental) - set(["mode", "column", "lag", "utc"])
+        if unknown:
+            raise ValueError(
+                f"{table}: unknown staging_incremental options {sorted(unknown)}"
+            )
+        mode = incremental.get("mode")
+        if mode is not None and mode not in incremental_modes:
+            raise ValueError(
+                f"{table}: staging_incremental mode must be one of {incremental_modes}"
+            )
+        if mode == "watermark":
+            names = [c.name for c in self.get_source_columns(table)]
+            if incremental.get("column") not in names:
+                raise ValueError(
+                    f"{table}: staging_incremental watermark column "
+                    f"{incremental.get('column')} not found"
+                )
+        return dict(incremental, mode=mode)
+
+    def _get_watermark_bound(self, table, incremental):
+        # e.g. "staging_incremental":
+        #   {".*": {"mode": "watermark", "column": "ModifiedAt", "lag": 300}}
+        # a transaction can stamp a row below the upper bound a load reads and
+        # commit after it, the row would land behind the watermark. rowversion
+        # columns stop below the oldest open transaction, datetime columns a
+        # lag in seconds behind the clock, "utc": true if they are UTC
+        column = self.source_table.column(incremental["column"])
+        lag = incremental.get("lag")
+        if column.type in rowversion_types:
+            bound = {"rowversion": True}
+        elif self._get_base_type(column) in watermark_clock_types:
+            if lag is None:
+                lag = watermark_lag_default
+            clock = "SYSUTCDATETIME()" if incremental.get("utc") else "SYSDATETIME()"
+            if self._get_base_type(column) == "DATETIMEOFFSET":
+                clock = "SYSDATETIMEOFFSET()"
+            bound = {"lag": lag, "clock": clock}
+        else:
+            bound = {}
+        if lag is not None and (
+            "lag" not in bound
+            or not isinstance(lag, int)
+            or isinstance(lag, bool)
+            or lag < 1
+        ):
+            raise ValueError(
+                f"{table}: staging_incremental lag must be an int >= 1 and "
+                "needs a datetime watermark column"
+            )
+        return bound
+
+    def _get_staging_load(self, table):
+        # e.g. "staging_load":
+        #   {".*": {"tablock": true, "batch_size": 500000, "index_after_load": true}}
+        load = dict(self.settings.table_option("staging_load") or {})
+        unknown = set(load) - set(["tablock", "batch_size", "index_after_load"])
+        if unknown:
+            raise ValueError(f"{table}: unknown staging_load options {sorted(unknown)}")
+        batch_size = load.get("batch_size")
+        if batch_size is not None and (
+            not isinstance(batch_size, int) or batch_size <= 0
+        ):
+            raise ValueError(f"{table}: staging_load batch_size must be a positive int")
+        if (batch_size or load.get("index_after_load")) and not self.source_keys:
+            raise ValueError(f"{table}: staging_load batching and indexing need a key")
+        return load
+
+    def _get_bulk_load(self, table):
+        # e.g. "bulk_load": {".*": {"batch_size": 10000, "commit_interval": 500000}}
+        # or split into key ranges loaded side by side:
+        #   {"Orders": {"partitions": 8, "sample_percent": 1, "retries": 2}}
+        load = dict(self.settings.table_option("bulk_load") or {})
+        unknown = set(load) - set(bulk_load_defaults) - set(["sample_percent"])
+        if unknown:
+            raise ValueError(f"{table}: unknown bulk_load options {sorted(unknown)}")
+        load = dict(bulk_load_defaults, **load)
+        for key in bulk_load_defaults:
+            minimum = 0 if key == "retries" else 1
+            if not isinstance(load[key], int) or load[key] < minimum:
+                raise ValueError(
+                    f"{table}: bulk_load {key} must be an int >= {minimum}"
+                )
+        sample = load.get("sample_percent")
+        if sample is not None and (
+            not isinstance(sample, (int, float)) or not 0 < sample <= 100
+        ):
+            raise ValueError(f"{table}: bulk_load sample_percent must be in (0, 100]")
+        if load["partitions"] > 1 and not self.source_keys:
+            raise ValueError(f"{table}: bulk_load partitions need a key")
+        return load
+
+    def _get_temporal_load(self, table):
+        # e.g. "temporal_load": {".*": {"batch_size": 100000, "pause": "00:00:01"}}
+        load = dict(self.settings.table_option("temporal_load") or {})
+        unknown = set(load) - set(["batch_size", "pause"])
+        if unknown:
+            raise ValueError(
+                f"{table}: unknown temporal_load options {sorted(unknown)}"
+            )
+        batch_size = load.get("batch_size")
+        if batch_size is not None and (
+            not isinstance(batch_size, int) or batch_size <= 0
+        ):
+            raise ValueError(
+                f"{table}: temporal_load batch_size must be a positive int"
+            )
+        pause = load.get("pause")
+        if pause is not None and not re.fullmatch(
+            r"\d{2}:\d{2}:\d{2}(\.\d{1,3})?", pause
+        ):
+            raise ValueError(f"{table}: temporal_load pause must be hh:mm:ss[.mmm]")
+        return load
+
+    def _get_dimension_incremental(self, table, columns):
+        # e.g. "dimension_incremental": {".*": true}
+        if not self.settings.table_option("dimension_incremental"):
+            return None
+        # dimension rows are found again by their natural key
+        return self._get_natural_keys(table, columns, "dimension_incremental")
+
+    def _get_dimension_lag(self, table):
+        # e.g. "dimension_incremental": {".*": {"lag": 300}}, in seconds
+        # versions are stamped with their transaction's begin time, a build
+        # only reads up to longer ago than the temporal loads' transactions take
+        incremental = self.settings.table_option("dimension_incremental")
+        if not isinstance(incremental, dict):
+            return dimension_lag_default
+        unknown = set(incremental) - set(["lag"])
+        if unknown:
+            raise ValueError(
+                f"{table}: unknown dimension_incremental options {sorted(unknown)}"
+            )
+        lag = incremental.get("lag", dimension_lag_default)
+        if not isinstance(lag, int) or isinstance(lag, bool) or lag < 1:
+            raise ValueError(f"{table}: dimension_incremental lag must be an int >= 1")
+        return lag
+
+    def _get_row_hash(self, table):
+        # e.g. "row_hash": {".*": {"algorithm": "SHA2_256", "index": true}}
+        # or {".*": true} for the defaults
+        row_hash = self.settings.table_option("row_hash")
+        if not row_hash:
+            return None
+        row_hash = dict(
+            {"algorithm": "SHA2_256", "index": False},
+            **(row_hash if isinstance(row_hash, dict) else {}),
+        )
+        if row_hash["algorithm"] not in hash_sizes:
+            raise ValueError(
+                f"{table}: row_hash algorithm must be one of {list(hash_sizes)}"
+            )
+        return row_hash
+
+    def _get_base_type(self, column):
+        return re.split(r"[( ]", self._get_sql_type(column))[0]
+
+    def _get_hash_expression(self, columns, algorithm):
+        values = []
+        for column in columns:
+            value = f"[{column.name}]"
+            sqltype = self._get_base_type(column)
+            if sqltype in hash_convert_types:
+                value = f"CONVERT({hash_convert_types[sqltype]}, {value})"
+                sqltype = hash_convert_types[sqltype].split("(")[0]
+            style = hash_convert_styles.get(sqltype)
+            value = f"CONVERT(NVARCHAR(MAX), {value}"
+            value += f", {style})" if style is not None else ")"
+            # every value is prefixed with its length, so ('a', 'bc') and
+            # ('ab', 'c') differ, and NULL is a marker no prefixed value starts with
+            values.append(
+                f"ISNULL(CONVERT(NVARCHAR(MAX), DATALENGTH({value})) "
+                f"+ N':' + {value}, N'~')"
+            )
+        if len(values) < 2:
+            values.append("N''")
+        concat = ", ".join(values)
+        return (
+            f"CAST(HASHBYTES('{algorithm}', CONCAT({concat})) "
+            f"AS BINARY({hash_sizes[algorithm]}))"
+        )
+
+    def _get_unhashed_columns(self, table):
+        # the temporal merge compares these itself
+        return [
+            c
+            for c in table.columns
+            if self._get_base_type(c) in unhashable_types
+            and c.name != CHANGE_OPERATION_COLUMN
+        ]
+
+    def _get_hash_columns(self, table, row_hash):
+        if not row_hash:
+            return []
+        # every column, staging and temporal keys needn't be the same ones
+        unhashed = self._get_unhashed_columns(table)
+        columns = [
+            c
+            for c in table.columns
+            if c.name != CHANGE_OPERATION_COLUMN and c not in unhashed
+        ]
+        expression = self._get_hash_expression(columns, row_hash["algorithm"])
+        return [Column(HASH_COLUMN, None, expression=expression)]
+
+    def _get_hash_indexes(self, table, row_hash):
+        return [sql for name, sql in self._get_named_hash_indexes(table, row_hash)]
+
+    def _get_named_hash_indexes(self, table, row_hash):
+        if not row_hash or not row_hash["index"]:
+            return []
+        columns = table.keys + [HASH_COLUMN]
+        name = "_".join(["IX", table.name] + columns).replace(" ", "")
+        return [
+            (
+                name,
+                self._get_index_sql(
+                    table.schema,
+                    table.name,
+                    {"columns": columns},
+                    self._get_compression(table.schema),
+                    name=name,
+                ),
+            )
+        ]
+
+    def _get_after_load_indexes(self, load, row_hash):
+        # a nonclustered index on the staging heap would be maintained row by
+        # row and log every insert, indexing after load builds it afterwards
+        if not load.get("index_after_load"):
+            return []
+        return self._get_named_hash_indexes(self.staging_table, row_hash)
+
+    def _get_compression(self, schema):
+        # e.g. "data_compression": {"hist": "PAGE", "dim": "ROW"}
+        compression = (self.settings.get("data_compression") or {}).get(schema)
+        if compression is None:
+            return None
+        if compression.upper() not in compression_types:
+            raise ValueError(
+                f"{schema}: data_compression must be one of {compression_types}"
+            )
+        return compression.upper()
+
+    def _get_compression_sql(self, schema, table):
+        compression = self._get_compression(schema)
+        if compression is None:
+            return []
+        return [
+            f"ALTER TABLE [{schema}].[{table}] "
+            f"REBUILD WITH (DATA_COMPRESSION = {compression})"
+        ]
+
+    def _get_index_specs(self, option, table, defaults, columns):
+        # e.g. "dimension_indexes": {".*": true} for the defaults, or a list of
+        #   {"columns": [...], "unique": false, "include": [...],
+        #    "clustered": false, "columnstore": false}
+        specs = self.settings.table_option(option)
+        if not specs:
+            return []
+        if specs is True:
+            specs = defaults
+        for spec in specs:
+            unknown = set(spec) - set(index_options)
+            if unknown:
+                raise ValueError(f"{table}: unknown {option} options {sorted(unknown)}")
+            if not spec.get("columns") and not (
+                spec.get("clustered") and spec.get("columnstore")
+            ):
+                raise ValueError(f"{table}: {option} entries need columns")
+            missing = [
+                c
+                for c in (spec.get("columns") or []) + (spec.get("include") or [])
+                if c not in columns
+            ]
+            if missing:
+                raise ValueError(f"{table}: {option} columns {missing} not found")
+        return specs
+
+    def _get_index_sql(self, schema, table, spec, compression=None, name=None):
+        columns = spec.get("columns") or []
+        if name is None:
+            prefix = "UX" if spec.get("unique") else "IX"
+            if spec.get("columnstore"):
+                prefix = "CCI" if spec.get("clustered") else "NCCI"
+            name = "_".join([prefix, table] + columns).replace(" ", "")
+        kind = "CLUSTERED" if spec.get("clustered") else "NONCLUSTERED"
+        if spec.get("columnstore"):
+            kind += " COLUMNSTORE"
+        elif spec.get("unique"):
+            kind = "UNIQUE " + kind
+        sql = f"CREATE {kind} INDEX [{name}] ON [{schema}].[{table}]"
+        if columns and not (spec.get("clustered") and spec.get("columnstore")):
+            sql += " (" + ", ".join(f"[{c}]" for c in columns) + ")"
+        if spec.get("include") and not spec.get("columnstore"):
+            sql += " INCLUDE (" + ", ".join(f"[{c}]" for c in spec["include"]) + ")"
+        options = []
+        if compression is not None and not spec.get("columnstore"):
+            options.append(f"DATA_COMPRESSION = {compression}")
+        if spec.get("drop_existing"):
+            options.append("DROP_EXISTING = ON")
+        if options:
+            sql += f" WITH ({', '.join(options)})"
+        return sql
+
+    def _get_history_sql(self, table, history=None):
+        # the history table sql server creates has a clustered rowstore index
+        # named ix_<history table>, a clustered spec replaces that one
+        schema = self.settings.get("temporal_schema")
+        history = history or f"{table}History"
+        keys = self.temporal_table.keys
+        specs = self._get_index_specs(
+            "history_indexes",
+            table,
+            [{"columns": keys + ["ValidTo", "ValidFrom"]}],
+            [c.name for c in self.temporal_table.columns] + ["ValidFrom", "ValidTo"],
+        )
+        statements = []
+        if not any(s.get("clustered") and s.get("columnstore") for s in specs):
+            statements += self._get_compression_sql(schema, history)
+        compression = self._get_compression(schema)
+        for spec in specs:
+            if spec.get("clustered"):
+                statements.append(
+                    self._get_index_sql(
+                        schema,
+                        history,
+                        dict(spec, drop_existing=True),
+                        compression,
+                        name=f"ix_{history}",
+                    )
+                )
+            else:
+                statements.append(
+                    self._get_index_sql(schema, history, spec, compression)
+                )
+        return statements
+
+    def _get_history_partitioning(self, table):
+        # e.g. "history_partitioning":
+        #   {".*": {"interval": "month", "retention": 24, "ahead": 2}}
+        partitioning = self.settings.table_option("history_partitioning")
+        if not partitioning:
+            return None
+        partitioning = dict(
+            {"interval": "month", "ahead": 2, "filegroup": "PRIMARY"}, **partitioning
+        )
+        unknown = set(partitioning) - set(["interval", "retention", "ahead", "filegroup"])
+        if unknown:
+            raise ValueError(
+                f"{table}: unknown history_partitioning options {sorted(unknown)}"
+            )
+        if partitioning["interval"] not in partition_intervals:
+            raise ValueError(
+                f"{table}: history_partitioning interval must be one of "
+                f"{partition_intervals}"
+            )
+        # with fewer than two intervals ahead the last partition already has
+        # rows when the next interval starts, and a partition with rows is
+        # never split
+        for key, minimum in [("retention", 1), ("ahead", 2)]:
+            value = partitioning.get(key)
+            if not isinstance(value, int) or value < minimum:
+                raise ValueError(
+                    f"{table}: history_partitioning {key} must be an int >= {minimum}"
+                )
+        name = f"{table}History".replace(" ", "")
+        partitioning["function"] = f"PF_{name}"
+        partitioning["scheme"] = f"PS_{name}"
+        return partitioning
+
+    def _get_partitioned_history_sql(self, table, partitioning, row_hash):
+        # an explicit history table on the ValidTo partition scheme, plus an
+        # identical unpartitioned one that expired partitions are switched into
+        schema = self.settings.get("temporal_schema")
+        statements = [partition_function_template.render(**partitioning).strip()]
+        for name, storage in [
+            (f"{table}History", f"[{partitioning['scheme']}]([ValidTo])"),
+            (f"{table}HistoryExpired", f"[{partitioning['filegroup']}]"),
+        ]:
+            # the row hash is a plain column in history
+            columns = []
+            if row_hash:
+                size = hash_sizes[row_hash["algorithm"]]
+                columns.append(Column(HASH_COLUMN, f"BINARY({size})"))
+            columns += [
+                Column("ValidFrom", "DATETIME2(0)", nullable=False),
+                Column("ValidTo", "DATETIME2(0)", nullable=False),
+            ]
+            history = self._copy_table(
+                self.temporal_table, heap=True, extra_columns=columns, name=name
+            )
+            statements.append(self._get_table_ddl(history).strip() + f" ON {storage}")
+            statements.append(
+                f"CREATE CLUSTERED INDEX [ix_{name}] ON [{schema}].[{name}] "
+                f"([ValidTo], [ValidFrom]) ON {storage}"
+            )
+        return statements
+
+    def _get_dimension_sql(self, table, columns, scd2):
+        schema = self.settings.get("dimension_schema")
+        dim_columns = list(columns) + (["ValidFrom", "ValidTo"] if scd2 else [])
+        defaults = None
+        if self.settings.table_option("dimension_indexes") is True:
+            # natural key lookups, and its versions' ranges for type 2
+            keys = self._get_natural_keys(table, columns, "dimension_indexes")
+            if scd2:
+                defaults = [{"columns": keys + ["ValidFrom", "ValidTo"]}]
+            else:
+                defaults = [{"columns": keys, "unique": True}]
+        specs = self._get_index_specs("dimension_indexes", table, defaults, dim_columns)
+        for spec in specs:
+            # the identity primary key is the clustered index
+            if spec.get("clustered"):
+                raise ValueError(f"{table}: dimension_indexes can't be clustered")
+        compression = self._get_compression(schema)
+        return self._get_compression_sql(schema, table) + [
+            self._get_index_sql(schema, table, spec, compression) for spec in specs
+        ]
+
+    def _get_natural_keys(self, table, columns, option):
+        keys = self.temporal_table.keys
+        missing = [k for k in keys if k not in columns]
+        if not keys or missing:
+            raise ValueError(
+                f"{table}: {option} needs the key columns {keys} in scd_columns"
+            )
+        return keys
+
+    def _copy_table(self, table, heap=False, extra_columns=(), name=None):
+        # a heap's key columns stay NOT NULL, e.g. a history table's nullability
+        # must match its temporal table's
+        return TableModel(
+            name or table.name,
+            table.schema,
+            tuple(
+                [
+                    c._replace(
+                        primary_key=c.primary_key and not heap,
+                        nullable=c.nullable and not c.primary_key,
+                    )
+                    for c in table.columns
+                ]
+                + list(extra_columns)
+            ),
+        )
+
+    def _get_column_type(self, column):
+        # rowversion values are compared and stored as binary(8), a rowversion
+        # column in staging or temporal would refuse the values copied into it
+        if column.type in rowversion_types:
+            return "BINARY(8)"
+        return column.type
+
+    def _get_sql_type(self, column):
+        return self._get_column_type(column).replace(
+            " COLLATE SQL_Latin1_General_CP1_CI_AS", ""
         )
 
+    def _get_watermark_table_name(self, schema):
+        return f'[{schema}].[{self.settings.get("watermark_table")}]'
+
+    def _get_watermark_reset_sql(self, schema, object_names):
+        if not self.settings.get("dropfirst") or not object_names:
+            return []
+        return [
+            watermark_reset_template.render(
+                watermark_table=self._get_watermark_table_name(schema),
+                object_names=object_names,
+            ).strip()
+        ]
+
+    def get_watermark_table_ddl(self, schema):
+        return watermark_table_template.render(
+            schema=schema,
+            table=self.settings.get("watermark_table"),
+            # staging watermarks wait there for the temporal load to commit them
+            pending=schema == self.settings.get("staging_schema"),
+        )
+
+    def get_staging_ddl(self, table):
+        self._build_staging_table(table)
+        incremental = self._get_incremental(table)
+
+        load = self._get_staging_load(table)
+
+        row_hash = self._get_row_hash(table)
+
+        create = self.staging_table
+        # a heap when indexing after load, the load proc adds the clustered index
+        if load.get("index_after_load") or row_hash:
+            create = self._copy_table(
+                self.staging_table,
+                heap=load.get("index_after_load"),
+                extra_columns=self._get_hash_columns(self.staging_table, row_hash),
+            )
         staging_table_sql = table_creation_template.render(
             dropfirst=self.settings.get("dropfirst"),
             table=table,
             schema=self.settings.get("staging_schema"),
-            create=self._get_table_ddl(self.staging_table, source_engine),
+            create=self._get_table_ddl(create),
+            after_create=self._get_compression_sql(
+                self.settings.get("staging_schema"), table
+            )
+            + (
+                []
+                if load.get("index_after_load")
+                else self._get_hash_indexes(self.staging_table, row_hash)
+            ),
         )
 
         staging_table = f'[{self.settings.get("staging_schema")}].[{table}]'
-        staging_columns = list(["[" + c.name + "]" for c in self.staging_table.columns])
+        staging_columns = list(
+            [
+                "[" + c.name + "]"
+                for c in self.staging_table.columns
+                if c.name != CHANGE_OPERATION_COLUMN
+            ]
+        )
 
         procname = "Populate" + table.replace(" ", "")
 
+        watermark_type = None
+        watermark_bound = {}
+        if incremental["mode"] == "watermark":
+            watermark_type = self._get_sql_type(
+                self.source_table.column(incremental["column"])
+            )
+            watermark_bound = self._get_watermark_bound(table, incremental)
+        changes_sql = None
+        if incremental["mode"] == "change_tracking":
+            changes_sql = change_tracking_insert_template.render(
+                target_db=self.settings.get("target_db"),
+                staging_table=staging_table,
+                staging_columns=staging_columns,
+                change_operation_column=CHANGE_OPERATION_COLUMN,
+                source_schema=self.settings.get("source_schema"),
+                source_table=table,
+                key_columns=list(["[" + k + "]" for k in self.source_keys]),
+                tablock=load.get("tablock"),
+            )
+            # embedded in an N'' literal
+            changes_sql = " ".join(changes_sql.split()).replace("'", "''")
+
+        batch_key_type = None
+        if load.get("batch_size"):
+            batch_key_type = self._get_sql_type(
+                self.source_table.column(self.source_keys[0])
+            )
+
         proc_sql = staging_loadproc_template.render(
             dropfirst=self.settings.get("dropfirst"),
             procedurename=procname,
@@ -116,50 +829,125 @@ class DbUtil:
             source_table=table,
             staging_table=staging_table,
             staging_columns=staging_columns,
+            incremental_mode=incremental["mode"],
+            watermark_table=self._get_watermark_table_name(
+                self.settings.get("staging_schema")
+            ),
+            watermark_column=incremental.get("column"),
+            watermark_type=watermark_type,
+            watermark_rowversion=watermark_bound.get("rowversion"),
+            watermark_lag=watermark_bound.get("lag"),
+            watermark_clock=watermark_bound.get("clock"),
+            changes_sql=changes_sql,
+            tablock=load.get("tablock"),
+            # batches are ranges of the leading key column
+            batch_size=load.get("batch_size"),
+            batch_key=self.source_keys[0] if self.source_keys else None,
+            batch_key_type=batch_key_type,
+            index_after_load=load.get("index_after_load"),
+            index_name="CIX_" + table.replace(" ", ""),
+            index_columns=list(["[" + k + "]" for k in self.source_keys]),
+            after_load_indexes=self._get_after_load_indexes(load, row_hash),
         )
 
         return staging_table_sql, proc_sql
 
+    def get_bulk_copy_sql(self, table):
+        # the statements the python loader runs instead of the staging proc
+        self._build_staging_table(table)
+        if self._get_incremental(table)["mode"] is not None:
+            raise ValueError(f"{table}: the bulk loader only does full loads")
+        load = self._get_staging_load(table)
+        staging_table = f'[{self.settings.get("staging_schema")}].[{table}]'
+        columns = list(["[" + c.name + "]" for c in self.staging_table.columns])
+        index = dict(
+            staging_table=staging_table,
+            index_after_load=load.get("index_after_load"),
+            index_name="CIX_" + table.replace(" ", ""),
+            index_columns=list(["[" + k + "]" for k in self.source_keys]),
+            after_load_indexes=self._get_after_load_indexes(
+                load, self._get_row_hash(table)
+            ),
+        )
+        bulk_load = self._get_bulk_load(table)
+        partitioned = bulk_load["partitions"] > 1
+        source = dict(
+            source_schema=self.settings.get("source_schema"),
+            source_table=table,
+            # ranges are cut on the leading key column
+            key=self.source_keys[0] if partitioned else None,
+        )
+        return dict(
+            bulk_load,
+            prepare=bulk_prepare_template.render(**index).strip(),
+            ranges=bulk_ranges_template.render(
+                partitions=bulk_load["partitions"],
+                sample_percent=bulk_load.get("sample_percent"),
+                **source,
+            ).strip()
+            if partitioned
+            else None,
+            select=bulk_select_template.render(columns=columns, **source).strip(),
+            insert=bulk_insert_template.render(
+                staging_table=staging_table,
+                columns=columns,
+                # an exclusive table lock would serialize the partitions
+                tablock=load.get("tablock") and not partitioned,
+            ).strip(),
+            delete=bulk_delete_template.render(
+                staging_table=staging_table, key=source["key"]
+            ).strip(),
+            count_source=bulk_count_template.render(
+                table=f"[{source['source_schema']}].[{table}]"
+            ).strip(),
+            count_staging=bulk_count_template.render(table=staging_table).strip(),
+            finish=bulk_finish_template.render(**index).strip(),
+        )
+
     def _getnullable(self, column, keys):
-        if column in keys:
+        if column.name in keys:
             return False
         return column.nullable
 
-    def get_temporal_ddl(self, table):
-        target_engine = self._get_engine(
-            self.settings.get("target_server"), self.settings.get("target_db")
-        )
-        target_meta = MetaData(bind=target_engine)
-
-        keys = [x.name for x in self.staging_table.columns if x.primary_key]
+    def _build_temporal_table(self, table):
+        keys = self.staging_table.keys
         if len(keys) == 0:
             keys = self.settings.get(
                 "staging_primary_keys", columns=self.staging_table.columns
             )
 
+        # change tracking staging relaxes nullability, the source's applies here
+        relaxed = self._get_incremental(table)["mode"] == "change_tracking"
         temporal_columns = [
             Column(
                 x.name,
                 x.type,
                 primary_key=(x.name in keys),
-                nullable=self._getnullable(x, keys),
+                nullable=self._getnullable(
+                    self.source_table.column(x.name) if relaxed else x, keys
+                ),
             )
             for x in self.staging_table.columns
+            if x.name != CHANGE_OPERATION_COLUMN
         ]
-        self.temporal_table = Table(
-            f"{table}",
-            target_meta,
-            *temporal_columns,
-            schema=self.settings.get("temporal_schema"),
+        self.temporal_table = TableModel(
+            table, self.settings.get("temporal_schema"), tuple(temporal_columns)
         )
-        temporal_table_ddl = self._get_table_ddl(self.temporal_table, target_engine)
-        temporal_table_ddl = (
-            temporal_table_ddl[:-3]
-            + ",[ValidFrom] [datetime2](0) GENERATED ALWAYS AS ROW START NOT NULL, [ValidTo] [datetime2](0) GENERATED ALWAYS AS ROW END NOT NULL,"
-        )
-        temporal_table_ddl += " PERIOD FOR SYSTEM_TIME ([ValidFrom], [ValidTo]) "
-        temporal_table_ddl += " ) "
-        temporal_table_ddl += f" WITH (SYSTEM_VERSIONING = ON ( HISTORY_TABLE = [{self.settings.get('temporal_schema')}].[{table}History] ))  "
+
+    def get_temporal_ddl(self, table):
+        self._build_temporal_table(table)
+        row_hash = self._get_row_hash(table)
+        partitioning = self._get_history_partitioning(table)
+        create = self.temporal_table
+        if row_hash:
+            create = self._copy_table(
+                self.temporal_table,
+                extra_columns=self._get_hash_columns(self.temporal_table, row_hash),
+            )
+        with span("emit_ddl", ddl_table=table):
+            temporal_table_ddl = create_temporal_table_sql(
+                create, f"[{self.settings.get('temporal_schema')}].[{table}History]"
+            )
 
         temporal_table_sql = temporal_table_creation_template.render(
             dropfirst=self.settings.get("dropfirst"),
@@ -167,6 +955,23 @@ class DbUtil:
             staging_schema=self.settings.get("staging_schema"),
             schema=self.settings.get("temporal_schema"),
             create=temporal_table_ddl,
+            partitioned=partitioning is not None,
+            before_create=self._get_partitioned_history_sql(
+                table, partitioning, row_hash
+            )
+            if partitioning
+            else [],
+            after_create=self._get_compression_sql(
+                self.settings.get("temporal_schema"), table
+            )
+            + self._get_hash_indexes(self.temporal_table, row_hash)
+            + self._get_history_sql(table)
+            + (
+                self._get_history_sql(table, f"{table}HistoryExpired")
+                if partitioning
+                else []
+            )
+            + self._get_temporal_reset_sql(table),
         )
 
         procedurename = f"Populate{table.replace(' ', '')}"
@@ -178,10 +983,11 @@ class DbUtil:
             ]
         )
         col_equality_list = [f"target.{c}=source.{c}" for c in merge_columns]
-        pk_col_equality_list = [
-            f"target.[{c.name}]=source.[{c.name}]"
-            for c in self.temporal_table.primary_key.columns
-        ]
+        keys = self.temporal_table.key_columns
+        pk_col_equality_list = [f"target.[{c.name}]=source.[{c.name}]" for c in keys]
+        load = self._get_temporal_load(table)
+        if load.get("batch_size") and not keys:
+            raise ValueError(f"{table}: temporal_load batching needs a key")
 
         temporal_proc_sql = temporal_loadproc_template.render(
             dropfirst=self.settings.get("dropfirst"),
@@ -191,23 +997,109 @@ class DbUtil:
             merge_columns=merge_columns,
             staging_schema=self.settings.get("staging_schema"),
             backdate_hist_to=self.settings.get("backdate_hist_to"),
+            backdate_procedure=self._get_backdate_procedure(table),
             pk_col_equality_list=pk_col_equality_list,
             col_equality_list=col_equality_list,
+            incremental_mode=self._get_incremental(table)["mode"],
+            watermark_table=self._get_watermark_table_name(
+                self.settings.get("staging_schema")
+            ),
+            change_operation_column=CHANGE_OPERATION_COLUMN,
+            hash_column=HASH_COLUMN if row_hash else None,
+            unhashed_columns=list(
+                [
+                    "[" + c.name + "]"
+                    for c in self._get_unhashed_columns(self.temporal_table)
+                ]
+            )
+            if row_hash
+            else [],
+            key_columns=list(["[" + k.name + "]" for k in keys]),
+            # batches are ranges of the leading key column
+            batch_size=load.get("batch_size"),
+            batch_pause=load.get("pause"),
+            batch_key=keys[0].name if keys else None,
+            batch_key_type=self._get_sql_type(keys[0]) if keys else None,
         )
 
         return temporal_table_sql, temporal_proc_sql
 
-    def get_dimension_scd1_ddl(self, table, columns):
-        target_engine = self._get_engine(
-            self.settings.get("target_server"), self.settings.get("target_db")
+    def _get_temporal_reset_sql(self, table):
+        # the staging watermark would only send the recreated table the changes
+        # and a finished backdate would never run on it
+        sql = []
+        if self._get_incremental(table)["mode"] is not None:
+            sql += self._get_watermark_reset_sql(
+                self.settings.get("staging_schema"), [table]
+            )
+        backdate = self._get_backdate_procedure(table)
+        if backdate is not None:
+            sql += self._get_watermark_reset_sql(
+                self.settings.get("temporal_schema"), [backdate, f"{backdate}Done"]
+            )
+        return sql
+
+    def _get_dimension_reset_sql(self, table, key_columns):
+        if key_columns is None:
+            return []
+        return self._get_watermark_reset_sql(
+            self.settings.get("dimension_schema"), [f'BuildDim{table.replace(" ", "")}']
         )
-        target_meta = MetaData(bind=target_engine)
+
+    def _get_backdate_procedure(self, table):
+        # backdating in key ranges instead of one update over the whole table
+        batch_size = self.settings.get("backdate_batch_size")
+        if not self.settings.get("backdate_hist_to") or batch_size is None:
+            return None
+        if not isinstance(batch_size, int) or batch_size <= 0:
+            raise ValueError("backdate_batch_size must be a positive int")
+        return f"Backdate{table.replace(' ', '')}"
+
+    def get_backdate_ddl(self, table):
+        procedurename = self._get_backdate_procedure(table)
+        if procedurename is None:
+            return None
+        keys = self.temporal_table.key_columns
+        if not keys:
+            raise ValueError(f"{table}: backdate_batch_size needs a key")
+        return backdate_proc_template.render(
+            dropfirst=self.settings.get("dropfirst"),
+            procedurename=procedurename,
+            temporal_schema=self.settings.get("temporal_schema"),
+            source_table=table,
+            backdate_hist_to=self.settings.get("backdate_hist_to"),
+            control_table=self._get_watermark_table_name(
+                self.settings.get("temporal_schema")
+            ),
+            progress_marker=procedurename,
+            done_marker=f"{procedurename}Done",
+            batch_size=self.settings.get("backdate_batch_size"),
+            batch_key=keys[0].name,
+            batch_key_type=self._get_sql_type(keys[0]),
+        )
+
+    def get_history_maintenance_ddl(self, table):
+        partitioning = self._get_history_partitioning(table)
+        if partitioning is None:
+            return None
+        return history_maintenance_template.render(
+            dropfirst=self.settings.get("dropfirst"),
+            procedurename=f"Maintain{table.replace(' ', '')}History",
+            temporal_schema=self.settings.get("temporal_schema"),
+            history_table=f"{table}History",
+            expired_table=f"{table}HistoryExpired",
+            **partitioning,
+        )
+
+    def get_dimension_scd1_ddl(self, table, columns):
+        key_columns = self._get_dimension_incremental(table, columns)
         dim_columns = [
             Column(
                 self.settings.get("dimension_id_column_name"),
-                Integer,
+                "INTEGER",
+                nullable=False,
                 primary_key=True,
-                autoincrement=True,
+                identity=True,
             )
         ]
         dim_columns += list(
@@ -217,19 +1109,18 @@ class DbUtil:
                 if x.name in columns
             ]
         )
-        dim_table = Table(
-            table,
-            target_meta,
-            *dim_columns,
-            schema=self.settings.get("dimension_schema"),
+        dim_table = TableModel(
+            table, self.settings.get("dimension_schema"), tuple(dim_columns)
         )
-        dim_table_ddl = self._get_table_ddl(dim_table, target_engine)
+        dim_table_ddl = self._get_table_ddl(dim_table)
 
         scd1_sql = "--Type 1 SCD\n" + table_creation_template.render(
             dropfirst=self.settings.get("dropfirst"),
             table=table,
             schema=self.settings.get("dimension_schema"),
             create=dim_table_ddl,
+            after_create=self._get_dimension_sql(table, columns, scd2=False)
+            + self._get_dimension_reset_sql(table, key_columns),
         )
 
         proc_name = f'BuildDim{table.replace(" ", "")}'
@@ -242,20 +1133,24 @@ class DbUtil:
             selected_columns=columns,
             temporal_schema=self.settings.get("temporal_schema"),
             temporal_table=table,
+            incremental=key_columns is not None,
+            key_columns=key_columns,
+            lag=self._get_dimension_lag(table) if key_columns is not None else None,
+            watermark_table=self._get_watermark_table_name(
+                self.settings.get("dimension_schema")
+            ),
         )
         return scd1_sql, sc1_proc_sql
 
     def get_dimension_scd2_ddl(self, table, columns):
-        target_engine = self._get_engine(
-            self.settings.get("target_server"), self.settings.get("target_db")
-        )
-        target_meta = MetaData(bind=target_engine)
+        key_columns = self._get_dimension_incremental(table, columns)
         dim_columns = [
             Column(
                 self.settings.get("dimension_id_column_name"),
-                Integer,
+                "INTEGER",
+                nullable=False,
                 primary_key=True,
-                autoincrement=True,
+                identity=True,
             )
         ]
         dim_columns += list(
@@ -265,21 +1160,20 @@ class DbUtil:
                 if x.name in columns
             ]
         )
-        dim_columns.append(Column("ValidFrom", mssql.DATETIME2(0), nullable=False))
-        dim_columns.append(Column("ValidTo", mssql.DATETIME2(0), nullable=False))
-        dim_table = Table(
-            table,
-            target_meta,
-            *dim_columns,
-            schema=self.settings.get("dimension_schema"),
+        dim_columns.append(Column("ValidFrom", "DATETIME2(0)", nullable=False))
+        dim_columns.append(Column("ValidTo", "DATETIME2(0)", nullable=False))
+        dim_table = TableModel(
+            table, self.settings.get("dimension_schema"), tuple(dim_columns)
         )
-        dim_table_ddl = self._get_table_ddl(dim_table, target_engine)
+        dim_table_ddl = self._get_table_ddl(dim_table)
 
         scd2_sql = "--Type 2 SCD\n" + table_creation_template.render(
             dropfirst=self.settings.get("dropfirst"),
             table=table,
             schema=self.settings.get("dimension_schema"),
             create=dim_table_ddl,
+            after_create=self._get_dimension_sql(table, columns, scd2=True)
+            + self._get_dimension_reset_sql(table, key_columns),
         )
 
         proc_name = f'BuildDim{table.replace(" ", "")}'
@@ -293,12 +1187,107 @@ class DbUtil:
             temporal_schema=self.settings.get("temporal_schema"),
             temporal_table=table,
             dimension_id_column_name=self.settings.get("dimension_id_column_name"),
+            incremental=key_columns is not None,
+            key_columns=key_columns,
+            lag=self._get_dimension_lag(table) if key_columns is not None else None,
+            watermark_table=self._get_watermark_table_name(
+                self.settings.get("dimension_schema")
+            ),
         )
         return scd2_sql, sc2_proc_sql
 
-    def get_dimension_ddl(self, table):
-        scdtype = self.settings.get("scd_type")
-        columns = self.settings.get(
+    def resolve_table_settings(self, table):
+        # ask every question generation will ask, so the answers can be shipped
+        # to workers that must never prompt
+        self._build_staging_table(table)
+        self._build_temporal_table(table)
+        self.settings.get("scd_type")
+        self._get_scd_columns()
+
+    def get_artifacts(self, table):
+        # todo for wh for table:
+        # * given input table ->
+        # * create staging table, create load to staging
+        stagingtablesql, stagingloadprocsql = self.get_staging_ddl(table)
+        # * create temporal table, create load to temporal table
+        temporaltablesql, temporalloadprocsql = self.get_temporal_ddl(table)
+        historymaintenancesql = self.get_history_maintenance_ddl(table)
+        backdatesql = self.get_backdate_ddl(table)
+        # * create scd1or2 dim table, create load to dim
+        dimensionsql, dimensionloadsql = self.get_dimension_ddl(table)
+        artifacts = []
+        if self._get_incremental(table)["mode"] is not None:
+            artifacts.append(
+                (
+                    self.settings.get("staging_schema"),
+                    "Tables",
+                    self.settings.get("watermark_table"),
+                    self.get_watermark_table_ddl(self.settings.get("staging_schema")),
+                )
+            )
+        if self.settings.table_option("dimension_incremental"):
+            artifacts.append(
+                (
+                    self.settings.get("dimension_schema"),
+                    "Tables",
+                    self.settings.get("watermark_table"),
+                    self.get_watermark_table_ddl(self.settings.get("dimension_schema")),
+                )
+            )
+        artifacts += [
+            (self.settings.get("staging_schema"), "Tables", table, stagingtablesql),
+            (
+                self.settings.get("staging_schema"),
+                "Stored Procedures",
+                f"Populate{table}",
+                stagingloadprocsql,
+            ),
+            (self.settings.get("temporal_schema"), "Tables", table, temporaltablesql),
+        ]
+        if backdatesql is not None:
+            artifacts += [
+                (
+                    self.settings.get("temporal_schema"),
+                    "Tables",
+                    self.settings.get("watermark_table"),
+                    self.get_watermark_table_ddl(self.settings.get("temporal_schema")),
+                ),
+                (
+                    self.settings.get("temporal_schema"),
+                    "Stored Procedures",
+                    self._get_backdate_procedure(table),
+                    backdatesql,
+                ),
+            ]
+        artifacts.append(
+            (
+                self.settings.get("temporal_schema"),
+                "Stored Procedures",
+                f'Populate{table.replace(" ", "")}',
+                temporalloadprocsql,
+            )
+        )
+        if historymaintenancesql is not None:
+            artifacts.append(
+                (
+                    self.settings.get("temporal_schema"),
+                    "Stored Procedures",
+                    f'Maintain{table.replace(" ", "")}History',
+                    historymaintenancesql,
+                )
+            )
+        return artifacts + [
+            (self.settings.get("dimension_schema"), "Tables", table, dimensionsql),
+            (
+                self.settings.get("dimension_schema"),
+                "Stored Procedures",
+                f'BuildDim{table.replace(" ", "")}',
+                dimensionloadsql,
+            ),
+        ]
+
+    def _get_scd_columns(self):
+        return self.settings.get(
             "scd_columns",
             columns=list(
                 [
@@ -309,6 +1298,10 @@ class DbUtil:
             ),
         )
 
+    def get_dimension_ddl(self, table):
+        scdtype = self.settings.get("scd_type")
+        columns = self._get_scd_columns()
+
         if scdtype == "Type 1":
             return self.get_dimension_scd1_ddl(table, columns)
         return self.get_dimension_scd2_ddl(table, columns)
@@ -0,0 +1,86 @@
+import re
+from functools import lru_cache
+from sqlalchemy.dialects.mssql.base import RESERVED_WORDS
+
+# CREATE TABLE statements rendered straight from the column model, on a single
+# line the formatter lays out later. Identifiers are quoted only where needed
+# and only a column the model marks as identity gets IDENTITY(1,1), staging and
+# temporal tables hold the source's key values as they are.
+
+DEFAULT_COLLATION = " COLLATE SQL_Latin1_General_CP1_CI_AS"
+legal_identifier_re = re.compile(r"^[A-Z0-9_$]+$", re.I)
+
+period_columns = (
+    "[ValidFrom] [datetime2](0) GENERATED ALWAYS AS ROW START NOT NULL, "
+    "[ValidTo] [datetime2](0) GENERATED ALWAYS AS ROW END NOT NULL, "
+    "PERIOD FOR SYSTEM_TIME ([ValidFrom], [ValidTo])"
+)
+
+
+@lru_cache(maxsize=4096)
+def quote(name):
+    if (
+        name.lower() in RESERVED_WORDS
+        or name[0] in "0123456789$"
+        or not legal_identifier_re.match(name)
+        or name.lower() != name
+    ):
+        return "[" + name.replace("]", "]]") + "]"
+    return name
+
+
+def quote_table(table):
+    if not table.schema:
+        return quote(table.name)
+    schema = ".".join(quote(part) for part in table.schema.split(".", 1))
+    return schema + "." + quote(table.name)
+
+
+@lru_cache(maxsize=None)
+def _type_sql(sqltype):
+    # one entry per distinct type string, they are interned and few
+    return sqltype.replace(DEFAULT_COLLATION, "")
+
+
+def _identity_column(table):
+    explicit = [c for c in table.columns if c.identity]
+    if explicit:
+        return explicit[0].name
+    return None
+
+
+def _column_sql(column, identity):
+    if column.expression is not None:
+        return f"{quote(column.name)} AS ({column.expression}) PERSISTED"
+    if column.type is None:
+        raise ValueError(f"column {column.name} has no known type")
+    sql = f"{quote(column.name)} {_type_sql(column.type)}"
+    if not column.nullable or column.primary_key or column.identity:
+        sql += " NOT NULL"
+    else:
+        sql += " NULL"
+    if column.name == identity:
+        sql += " IDENTITY(1,1)"
+    return sql
+
+
+def _definitions(table):
+    identity = _identity_column(table)
+    definitions = [_column_sql(c, identity) for c in table.columns]
+    if table.keys:
+        keys = ", ".join(quote(k) for k in table.keys)
+        definitions.append(f"PRIMARY KEY ({keys})")
+    return ",   ".join(definitions)
+
+
+def create_table_sql(table):
+    return f" CREATE TABLE {quote_table(table)} (  {_definitions(table)} )  "
+
+
+def create_temporal_table_sql(table, history_table):
+    # the period columns and system versioning against an explicit history
+    return (
+        f" CREATE TABLE {quote_table(table)} (  {_definitions(table)} "
+        f",{period_columns}  ) "
+        f" WITH (SYSTEM_VERSIONING = ON ( HISTORY_TABLE = {history_table} ))  "
+    )
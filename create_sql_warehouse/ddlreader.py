@@ -0,0 +1,420 @@
+import os
+import codecs
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from catalog import sa_type, length_types, unicode_types, time_types
+from tablemodel import Column, type_string
+from sqlformat import token_re
+
+logger = logging.getLogger(__file__)
+
+# below this many files parsing in a process pool costs more than it saves
+PARALLEL_THRESHOLD = 200
+
+# words that start a table constraint instead of a column definition
+constraint_words = [
+    "constraint",
+    "primary",
+    "unique",
+    "index",
+    "foreign",
+    "check",
+    "period",
+]
+# column options that take a parenthesized argument we skip
+skip_args = ["default", "check", "identity", "references", "foreign"]
+# functions whose target type is the type of a computed column
+cast_functions = ["cast", "try_cast", "convert", "try_convert"]
+# the folders an SSDT project keeps its CREATE TABLE scripts in
+default_script_folders = ["Tables"]
+# synonyms and system alias types, as the system type the catalog reports
+type_aliases = {
+    "rowversion": ("timestamp", []),
+    "sysname": ("nvarchar", ["128"]),
+    "integer": ("int", []),
+    "dec": ("decimal", []),
+}
+
+
+def _unquote(text):
+    if text[0] == "[":
+        return text[1:-1].replace("]]", "]")
+    if text[0] == '"':
+        return text[1:-1].replace('""', '"')
+    return text
+
+
+def _tokens(sql):
+    # the sqlformat tokenizer, without whitespace and comments and with the
+    # original case, keyword detection is done on the lowered text
+    return [
+        (m.lastgroup, m.group())
+        for m in token_re.finditer(sql)
+        if m.lastgroup not in ["newline", "space", "comment"]
+    ]
+
+
+def _read_script(path):
+    with open(path, "rb") as fp:
+        data = fp.read()
+    if data.startswith(codecs.BOM_UTF16_LE) or data.startswith(codecs.BOM_UTF16_BE):
+        return data.decode("utf-16")
+    return data.decode("utf-8-sig", errors="replace")
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset=0):
+        if self.pos + offset < len(self.tokens):
+            return self.tokens[self.pos + offset][1]
+        return ""
+
+    def word(self, offset=0):
+        return self.peek(offset).lower()
+
+    def next(self):
+        text = self.peek()
+        self.pos += 1
+        return text
+
+    def skip_parens(self):
+        # skips a balanced (...) group if the next token opens one
+        if self.peek() != "(":
+            return
+        depth = 0
+        while self.pos < len(self.tokens):
+            text = self.next()
+            if text == "(":
+                depth += 1
+            elif text == ")":
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def name(self):
+        # [schema].[table], schema.table or table
+        parts = [_unquote(self.next())]
+        while self.peek() == ".":
+            self.next()
+            parts.append(_unquote(self.next()))
+        return parts[-2] if len(parts) > 1 else "dbo", parts[-1]
+
+    def column_list(self):
+        names = []
+        if self.peek() != "(":
+            return names
+        self.next()
+        while self.pos < len(self.tokens) and self.peek() != ")":
+            text = self.next()
+            if text != "," and text.lower() not in ["asc", "desc"]:
+                names.append(_unquote(text))
+        self.next()
+        return names
+
+    def parse(self):
+        # yields ("table", schema, name, columns) and ("pk", schema, name, keys)
+        while self.pos < len(self.tokens):
+            if self.word() == "create" and self.word(1) == "table":
+                self.pos += 2
+                schema, table = self.name()
+                columns = self.table_body()
+                # temp tables created in procedures and scripts
+                if not table.startswith("#"):
+                    yield ("table", schema, table, columns)
+            elif self.word() == "alter" and self.word(1) == "table":
+                self.pos += 2
+                schema, table = self.name()
+                keys = self.alter_primary_key()
+                if keys and not table.startswith("#"):
+                    yield ("pk", schema, table, keys)
+            else:
+                self.pos += 1
+
+    def alter_primary_key(self):
+        # ALTER TABLE t ADD [CONSTRAINT c] PRIMARY KEY [[NON]CLUSTERED] (cols)
+        if self.word() == "with":
+            self.pos += 2
+        if self.word() != "add":
+            return None
+        self.next()
+        if self.word() == "constraint":
+            self.pos += 2
+        if self.word() != "primary":
+            return None
+        self.pos += 2
+        if self.word() in ["clustered", "nonclustered"]:
+            self.next()
+        return self.column_list()
+
+    def table_body(self):
+        columns = []
+        keys = []
+        if self.peek() != "(":
+            return columns
+        self.next()
+        while self.pos < len(self.tokens):
+            if self.word() in constraint_words:
+                keys.extend(self.table_constraint())
+            else:
+                columns.append(self.column())
+            text = self.next()
+            if text != ",":
+                # the closing parenthesis of the table
+                break
+        keys = [k.lower() for k in keys]
+        for column in columns:
+            if column["name"].lower() in keys:
+                column["primary_key"] = True
+                column["nullable"] = False
+        return columns
+
+    def table_constraint(self):
+        keys = []
+        while self.pos < len(self.tokens) and self.peek() not in [",", ")"]:
+            if self.word() == "primary" and self.word(1) == "key":
+                self.pos += 2
+                if self.word() in ["clustered", "nonclustered"]:
+                    self.next()
+                keys = self.column_list()
+            elif self.peek() == "(":
+                self.skip_parens()
+            else:
+                self.next()
+        return keys
+
+    def column(self):
+        column = {
+            "name": _unquote(self.next()),
+            "type": None,
+            "nullable": True,
+            "primary_key": False,
+            "identity": False,
+            "computed": False,
+        }
+        type_name = None
+        collation = None
+        if self.word() == "as":
+            column["computed"] = True
+            self.next()
+            computed_type = self.computed_type()
+            if computed_type is not None:
+                type_name, args = computed_type
+        else:
+            type_name, args = self.column_type()
+            # sysname columns are NOT NULL unless NULL is given
+            column["nullable"] = type_name != "sysname"
+
+        while self.pos < len(self.tokens) and self.peek() not in [",", ")"]:
+            word = self.word()
+            if word == "not" and self.word(1) == "null":
+                column["nullable"] = False
+                self.pos += 2
+            elif word == "null":
+                column["nullable"] = True
+                self.next()
+            elif word == "identity":
+                column["identity"] = True
+                self.next()
+                self.skip_parens()
+            elif word == "primary" and self.word(1) == "key":
+                column["primary_key"] = True
+                column["nullable"] = False
+                self.pos += 2
+            elif word == "collate":
+                self.next()
+                collation = self.next()
+            elif word in skip_args:
+                self.next()
+                self.skip_parens()
+            elif self.peek() == "(":
+                self.skip_parens()
+            else:
+                self.next()
+        if type_name is not None:
+            column["type"] = _sa_type(type_name, args, collation)
+        return column
+
+    def computed_type(self):
+        # the type of a computed column that is a CAST or CONVERT, any other
+        # expression has a type only the server knows
+        opened = 0
+        while self.peek() == "(":
+            self.next()
+            opened += 1
+        function = self.word()
+        result = None
+        if function in cast_functions and self.peek(1) == "(":
+            self.next()
+            start = self.pos
+            self.skip_parens()
+            result = _cast_type(function, self.tokens[start + 1 : self.pos - 1])
+        while opened and self.peek() == ")":
+            self.next()
+            opened -= 1
+        if opened or (
+            self.pos < len(self.tokens)
+            and self.tokens[self.pos][0] == "op"
+            and self.peek() not in [",", ")"]
+        ):
+            # the call is only part of the expression
+            result = None
+        while opened and self.pos < len(self.tokens):
+            text = self.next()
+            if text == "(":
+                opened += 1
+            elif text == ")":
+                opened -= 1
+        return result
+
+    def column_type(self):
+        type_name = _unquote(self.next())
+        if self.peek() == ".":
+            # schema qualified, e.g. [sys].[nvarchar]
+            self.next()
+            type_name = _unquote(self.next())
+        type_name = type_name.lower()
+        args = []
+        if self.peek() == "(":
+            self.next()
+            while self.pos < len(self.tokens) and self.peek() != ")":
+                text = self.next()
+                if text != ",":
+                    args.append(text.lower())
+            self.next()
+        return type_name, args
+
+
+def _cast_type(function, tokens):
+    # the type in the arguments of CAST(x AS type) or CONVERT(type, x[, style])
+    depth = 0
+    split = None
+    for i, (kind, text) in enumerate(tokens):
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and function.endswith("cast") and text.lower() == "as":
+            split = i
+        elif depth == 0 and text == "," and split is None:
+            split = i
+    if split is None:
+        return None
+    if function.endswith("cast"):
+        tokens = tokens[split + 1 :]
+    else:
+        tokens = tokens[:split]
+    if not tokens:
+        return None
+    return _Parser(tokens).column_type()
+
+
+def _sa_type(type_name, args, collation=None):
+    # script arguments to the sys.columns values sa_type expects
+    if type_name in type_aliases:
+        type_name, default_args = type_aliases[type_name]
+        args = args or default_args
+    max_length = precision = scale = None
+    if type_name in length_types:
+        if args and args[0] == "max":
+            max_length = -1
+        else:
+            max_length = int(args[0]) if args else 1
+            if type_name in unicode_types:
+                max_length *= 2
+    elif type_name in time_types:
+        scale = int(args[0]) if args else None
+    elif args:
+        precision = int(args[0])
+        scale = int(args[1]) if len(args) > 1 else 0
+    return sa_type(type_name, max_length, precision, scale, collation)
+
+
+def parse_script(path):
+    try:
+        return list(_Parser(_tokens(_read_script(path))).parse())
+    except Exception as e:
+        logger.warning(f"could not parse {path}: {e}")
+        return []
+
+
+def _script_paths(folder, folders, inside=False):
+    # the .sql files below any folder named in folders, every .sql file when
+    # folders is empty
+    inside = inside or not folders or os.path.basename(folder).lower() in folders
+    for entry in os.scandir(folder):
+        if entry.is_dir():
+            yield from _script_paths(entry.path, folders, inside)
+        elif inside and entry.name.lower().endswith(".sql"):
+            yield entry.path
+
+
+class DdlScriptReader:
+    # reads the column model from a folder of CREATE TABLE scripts, e.g. the
+    # Tables folders of an SSDT project, so generating needs no connection
+    def __init__(self, folder, schema, folders=None, jobs=None):
+        if not folder or not os.path.isdir(folder):
+            raise ValueError(f"ddl_scripts_dir {folder} is not a directory")
+        if folders is None:
+            folders = default_script_folders
+        if isinstance(folders, str) or not all(isinstance(f, str) for f in folders):
+            raise ValueError(
+                f"ddl_script_folders must be a list of folder names, not {folders}"
+            )
+        self.folder = folder
+        self.schema = schema.lower()
+        self.folders = [f.lower() for f in folders]
+        self.jobs = jobs or os.cpu_count()
+        self.models = None
+
+    def _parse_all(self):
+        paths = list(_script_paths(self.folder, self.folders))
+        if len(paths) < PARALLEL_THRESHOLD or self.jobs <= 1:
+            return map(parse_script, paths)
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            return list(pool.map(parse_script, paths, chunksize=32))
+
+    def read(self, tables=None):
+        if self.models is None:
+            models = {}
+            keys = {}
+            for statements in self._parse_all():
+                for kind, schema, table, value in statements:
+                    if schema.lower() != self.schema:
+                        continue
+                    if kind == "table":
+                        models[table] = value
+                    else:
+                        keys[table] = value
+            for table, names in keys.items():
+                names = [n.lower() for n in names]
+                for column in models.get(table, []):
+                    if column["name"].lower() in names:
+                        column["primary_key"] = True
+                        column["nullable"] = False
+            for table, columns in models.items():
+                skipped = [c["name"] for c in columns if c["type"] is None]
+                if skipped:
+                    logger.warning(
+                        f"{table}: skipping computed columns {', '.join(skipped)}, "
+                        "only a CAST or CONVERT gives their type"
+                    )
+                    models[table] = [c for c in columns if c["type"] is not None]
+            logger.debug(f"read {len(models)} tables from scripts in {self.folder}")
+            self.models = dict(
+                [
+                    (
+                        table,
+                        tuple(
+                            Column(**dict(c, type=type_string(c["type"])))
+                            for c in columns
+                        ),
+                    )
+                    for table, columns in models.items()
+                ]
+            )
+        if tables is None:
+            return dict(self.models)
+        return dict([(t, self.models[t]) for t in tables if t in self.models])
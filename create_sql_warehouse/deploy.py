@@ -0,0 +1,205 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from engines import EngineRegistry
+from tracing import span
+
+logger = logging.getLogger(__file__)
+
+DEPLOY_STATE_NAME = ".warehouse_deploy.json"
+DEPLOY_JOURNAL_NAME = ".warehouse_deploy.journal"
+
+# a batch separator is GO alone on its line, "GO;" included
+go_re = re.compile(r"^[ \t]*GO[ \t]*;?[ \t\r]*$", re.IGNORECASE | re.MULTILINE)
+
+
+def split_batches(sql):
+    return [batch.strip() for batch in go_re.split(sql) if batch.strip()]
+
+
+class DeployState:
+    # what was deployed from which file content. Every object is appended to
+    # a journal as it is done, so a failed or interrupted deploy resumes with
+    # the first object not done, and compact() folds the journal into the
+    # state file once the deploy is over.
+    def __init__(self, outputdir):
+        self.path = os.path.join(outputdir, DEPLOY_STATE_NAME)
+        self.journal_path = os.path.join(outputdir, DEPLOY_JOURNAL_NAME)
+        self.objects = {}
+        self.journal = None
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as fp:
+                    self.objects = json.load(fp).get("objects", {})
+            except Exception as e:
+                logger.warning(f"ignoring unreadable deploy state {self.path}: {e}")
+        if os.path.exists(self.journal_path):
+            self._replay()
+
+    def _replay(self):
+        # the objects of a deploy that ended before compacting, a line cut
+        # short by a crash ends the journal
+        with open(self.journal_path, "r", encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning(f"ignoring the rest of {self.journal_path}")
+                    break
+                key = entry.pop("key")
+                if entry.get("forget"):
+                    self.objects.pop(key, None)
+                else:
+                    self.objects[key] = entry
+
+    def is_deployed(self, key, fingerprint):
+        entry = self.objects.get(key)
+        return entry is not None and entry["fingerprint"] == fingerprint
+
+    def record(self, key, fingerprint, seconds):
+        with self.lock:
+            self.objects[key] = {"fingerprint": fingerprint, "seconds": seconds}
+            self._append(dict(self.objects[key], key=key))
+
+    def forget(self, key):
+        with self.lock:
+            if self.objects.pop(key, None) is not None:
+                self._append({"key": key, "forget": True})
+
+    def _append(self, entry):
+        if self.journal is None:
+            self.journal = open(self.journal_path, "a", encoding="utf-8")
+        self.journal.write(json.dumps(entry, sort_keys=True) + "\n")
+        self.journal.flush()
+
+    def compact(self):
+        # the state file is replaced before the journal goes, replaying a
+        # journal that outlived it changes nothing
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            if not os.path.exists(self.journal_path):
+                return
+            tmppath = self.path + ".tmp"
+            with open(tmppath, "w", encoding="utf-8") as fp:
+                json.dump({"objects": self.objects}, fp, indent=4, sort_keys=True)
+            os.replace(tmppath, self.path)
+            os.remove(self.journal_path)
+
+
+class Deployer:
+    # runs the generated files against the target. A table's files are in
+    # dependency order (staging, temporal, dimension) and run in that order on
+    # one pooled connection, independent tables run side by side. Files shared
+    # by several tables, e.g. the watermark tables, go first and only once.
+    def __init__(self, settings, jobs=1, force=False):
+        self.settings = settings
+        self.outputdir = settings.get("outputdir")
+        self.jobs = max(jobs, 1)
+        self.force = force
+        self.state = DeployState(self.outputdir)
+        self.timings = []
+        self.lock = threading.Lock()
+        # every job holds a target connection for the files of its table
+        EngineRegistry.reserve(
+            settings.get("target_server"),
+            settings.get("target_db"),
+            self.jobs,
+            driver=settings.get("odbc_driver"),
+        )
+
+    def _connect(self):
+        engine = EngineRegistry.get_engine(
+            self.settings.get("target_server"),
+            self.settings.get("target_db"),
+            driver=self.settings.get("odbc_driver"),
+        )
+        return engine.raw_connection()
+
+    def _key(self, path):
+        return os.path.relpath(path, self.outputdir).replace(os.sep, "/")
+
+    def _deploy_file(self, connection, table, path):
+        # True when it ran, False when the deployed version is current
+        key = self._key(path)
+        with open(path, "r", encoding="utf-8") as fp:
+            sql = fp.read()
+        fingerprint = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+        if not self.force and self.state.is_deployed(key, fingerprint):
+            return False
+
+        self.state.forget(key)
+        with span("deploy", table=table, object=key):
+            start = time.perf_counter()
+            cursor = connection.cursor()
+            for i, batch in enumerate(split_batches(sql)):
+                try:
+                    cursor.execute(batch)
+                    while cursor.nextset():
+                        pass
+                except Exception as e:
+                    connection.rollback()
+                    raise ValueError(f"{key} batch {i + 1}: {e}") from e
+            connection.commit()
+            seconds = time.perf_counter() - start
+        self.state.record(key, fingerprint, seconds)
+        with self.lock:
+            self.timings.append((seconds, key))
+        logger.debug(f"...Deployed {key} in {seconds:.2f}s")
+        return True
+
+    def _deploy_files(self, table, paths):
+        connection = self._connect()
+        try:
+            deployed = 0
+            for path in paths:
+                deployed += self._deploy_file(connection, table, path)
+            return deployed
+        finally:
+            connection.close()
+
+    def deploy(self, tables):
+        # tables is a list of (table, files in dependency order), yields
+        # (table, deployed count, error) in the order of tables
+        counts = {}
+        for table, paths in tables:
+            for path in paths:
+                counts[path] = counts.get(path, 0) + 1
+        shared = [p for p in counts if counts[p] > 1]
+
+        def run(table, paths):
+            broken = [p for p in paths if p in failed]
+            if broken:
+                raise ValueError(f"depends on failed {self._key(broken[0])}")
+            return self._deploy_files(table, [p for p in paths if p not in shared])
+
+        failed = {}
+        try:
+            for path in shared:
+                try:
+                    self._deploy_files("shared", [path])
+                except Exception as e:
+                    logger.exception(f"...Failed {self._key(path)}")
+                    failed[path] = e
+
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                futures = [
+                    (table, pool.submit(run, table, paths)) for table, paths in tables
+                ]
+                for table, future in futures:
+                    try:
+                        yield table, future.result(), None
+                    except Exception as e:
+                        yield table, 0, e
+        finally:
+            self.state.compact()
+
+    def slowest(self, count=5):
+        return sorted(self.timings, reverse=True)[:count]
@@ -0,0 +1,125 @@
+from sqlalchemy import create_engine, event
+from tracing import span
+import threading
+import logging
+
+logger = logging.getLogger(__file__)
+
+DEFAULT_DRIVER = "SQL Server Native Client 11.0"
+# sqlalchemy's QueuePool defaults
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+
+
+class EngineRegistry:
+    # process wide, keyed by (server, database, driver)
+    engines = {}
+    stats = {}
+    pool_options = {}
+    # pool sizes raised by reserve, per key
+    pool_sizes = {}
+    # loader and deploy threads look up engines side by side
+    lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, pool_size=None, max_overflow=None, pool_recycle=None):
+        cls.pool_options = {
+            k: v
+            for k, v in [
+                ("pool_size", pool_size),
+                ("max_overflow", max_overflow),
+                ("pool_recycle", pool_recycle),
+            ]
+            if v is not None
+        }
+
+    @classmethod
+    def get_engine(cls, server, database, driver=None):
+        key = (server, database, driver or DEFAULT_DRIVER)
+        with span("engine", server=server, database=database):
+            return cls._get_engine(key)
+
+    @classmethod
+    def reserve(cls, server, database, connections, driver=None):
+        # lets the pool hand out this many connections at once instead of
+        # blocking on its overflow limit, a pool too small is replaced
+        key = (server, database, driver or DEFAULT_DRIVER)
+        with cls.lock:
+            cls._reserve(key, connections)
+
+    @classmethod
+    def _reserve(cls, key, connections):
+        pool_size = cls.pool_sizes.get(
+            key, cls.pool_options.get("pool_size", DEFAULT_POOL_SIZE)
+        )
+        max_overflow = cls.pool_options.get("max_overflow", DEFAULT_MAX_OVERFLOW)
+        if max_overflow < 0 or pool_size + max_overflow >= connections:
+            return
+        logger.debug(f"growing the pool for {key} to {connections} connections")
+        cls.pool_sizes[key] = connections
+        engine = cls.engines.pop(key, None)
+        if engine is not None:
+            # closes its idle connections, the engine is not handed out again
+            engine.dispose()
+
+    @classmethod
+    def _get_engine(cls, key):
+        with cls.lock:
+            return cls._create_engine(key)
+
+    @classmethod
+    def _create_engine(cls, key):
+        if key in cls.engines:
+            cls.stats[key]["engine_reuses"] += 1
+            return cls.engines[key]
+
+        logger.debug(f"creating engine for {key}")
+        server, database, driver = key
+        options = dict(cls.pool_options)
+        if key in cls.pool_sizes:
+            options["pool_size"] = cls.pool_sizes[key]
+        engine = create_engine(
+            f"mssql+pyodbc://{server}/{database}?driver={driver.replace(' ', '+')}",
+            **options,
+        )
+        # a replaced engine keeps counting into the same stats
+        cls.stats.setdefault(
+            key,
+            {
+                "engine_reuses": 0,
+                "connects": 0,
+                "checkouts": 0,
+            },
+        )
+        cls._count_connections(engine, cls.stats[key])
+        cls.engines[key] = engine
+        return engine
+
+    @classmethod
+    def _count_connections(cls, engine, stats):
+        def on_connect(dbapi_connection, connection_record):
+            stats["connects"] += 1
+
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            stats["checkouts"] += 1
+
+        event.listen(engine, "connect", on_connect)
+        event.listen(engine, "checkout", on_checkout)
+
+    @classmethod
+    def report(cls):
+        for (server, database, driver), stats in cls.stats.items():
+            # every checkout that didn't need a new dbapi connection was a reuse
+            reuses = stats["checkouts"] - stats["connects"]
+            logger.info(
+                f"...{server}/{database}: {stats['connects']} connects, "
+                f"{reuses} connection reuses, {stats['engine_reuses']} engine reuses"
+            )
+
+    @classmethod
+    def dispose(cls):
+        for engine in cls.engines.values():
+            engine.dispose()
+        cls.engines = {}
+        cls.stats = {}
+        cls.pool_sizes = {}
@@ -0,0 +1,79 @@
+from concurrent.futures import ProcessPoolExecutor
+from settings import Settings
+from dbutil import DbUtil
+from sqlformat import format_sql
+import tracing
+import logging
+
+logger = logging.getLogger(__file__)
+
+
+def _format(name, sql):
+    with tracing.span("format", artifact=name):
+        return format_sql(sql.replace("\r", ""))
+
+
+def generate_table(dbutil, table):
+    with tracing.span("generate", table=table):
+        return [
+            (schema, otype, name, _format(name, sql))
+            for schema, otype, name, sql in dbutil.get_artifacts(table)
+        ]
+
+
+def _generate_worker(task):
+    table, columns, values, trace = task
+    # a forked worker starts with a copy of the parent's spans
+    tracing.reset(trace)
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns={table: columns})
+    return generate_table(dbutil, table), tracing.collect()
+
+
+def generate_tables(settings, dbutil, tables, jobs=1):
+    # yields (table, artifacts, error) in the order of tables
+    if jobs <= 1:
+        for table in tables:
+            settings.set_table(table)
+            logger.info(f"...Processing {table}")
+            try:
+                yield table, generate_table(dbutil, table), None
+            except Exception as e:
+                yield table, None, e
+        return
+
+    # prompts can only happen here, workers get the answers with the reflected
+    # columns and do the rendering, compiling and formatting
+    tasks = []
+    errors = {}
+    for table in tables:
+        settings.set_table(table)
+        try:
+            dbutil.resolve_table_settings(table)
+            tasks.append(
+                (
+                    table,
+                    dbutil.get_source_columns(table),
+                    dict(settings.settings),
+                    tracing.is_enabled(),
+                )
+            )
+        except Exception as e:
+            errors[table] = e
+
+    logger.info(f"...Generating {len(tasks)} tables on {jobs} processes")
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = dict(
+            [(task[0], pool.submit(_generate_worker, task)) for task in tasks]
+        )
+        for table in tables:
+            if table in errors:
+                yield table, None, errors[table]
+                continue
+            try:
+                artifacts, spans = futures[table].result()
+            except Exception as e:
+                yield table, None, e
+                continue
+            tracing.extend(spans)
+            yield table, artifacts, None
@@ -0,0 +1,202 @@
+import time
+import queue
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from engines import EngineRegistry
+from tracing import span
+
+logger = logging.getLogger(__file__)
+
+
+class StagingLoader:
+    # streams a source table into its staging table from python, for when the
+    # target can't reach the source by three part name. Each key range has a
+    # reader thread fetching batches into a bounded queue and a writer sending
+    # them to the target as array bound inserts, so memory stays at about
+    # partitions * (queue_size + 2) * batch_size rows. Every partition holds a
+    # source and a target connection, the engine pools are grown to match.
+    def __init__(self, settings, dbutil):
+        self.settings = settings
+        self.dbutil = dbutil
+
+    def _connect(self, server, database):
+        engine = EngineRegistry.get_engine(
+            server, database, driver=self.settings.get("odbc_driver")
+        )
+        return engine.raw_connection()
+
+    def _reserve(self, partitions):
+        driver = self.settings.get("odbc_driver")
+        databases = Counter(
+            [
+                (self.settings.get("source_server"), self.settings.get("source_db")),
+                (self.settings.get("target_server"), self.settings.get("target_db")),
+            ]
+        )
+        for (server, database), count in databases.items():
+            EngineRegistry.reserve(server, database, count * partitions, driver=driver)
+
+    def _connect_source(self):
+        return self._connect(
+            self.settings.get("source_server"), self.settings.get("source_db")
+        )
+
+    def _connect_target(self):
+        return self._connect(
+            self.settings.get("target_server"), self.settings.get("target_db")
+        )
+
+    def _query(self, connect, sql, params=(), commit=False):
+        connection = connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql, *params)
+            rows = None if commit else cursor.fetchall()
+            if commit:
+                connection.commit()
+            return rows
+        finally:
+            connection.close()
+
+    def load(self, table):
+        sql = self.dbutil.get_bulk_copy_sql(table)
+        with span("bulk_load", table=table):
+            start = time.perf_counter()
+            self._query(self._connect_target, sql["prepare"], commit=True)
+            ranges = self._get_ranges(table, sql)
+            if len(ranges) == 1:
+                rows = self._copy_range(table, sql, *ranges[0])
+            else:
+                self._reserve(len(ranges))
+                with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                    futures = [
+                        pool.submit(self._copy_range, table, sql, lower, upper)
+                        for lower, upper in ranges
+                    ]
+                    rows = sum(f.result() for f in futures)
+            if sql["finish"]:
+                self._query(self._connect_target, sql["finish"], commit=True)
+            if sql["ranges"]:
+                self._reconcile(table, sql, rows)
+            seconds = time.perf_counter() - start
+        stats = {
+            "table": table,
+            "rows": rows,
+            "seconds": seconds,
+            "rows_per_sec": rows / seconds if seconds else 0,
+            "partitions": len(ranges),
+        }
+        logger.info(
+            f"...Loaded {table}: {rows} rows in {seconds:.1f}s on {len(ranges)} "
+            f"connections, {stats['rows_per_sec']:.0f} rows/sec"
+        )
+        return stats
+
+    def _get_ranges(self, table, sql):
+        # (lower, upper] key ranges, open ended at both ends so rows the
+        # sample missed still land in the first or last range
+        if not sql["ranges"]:
+            return [(None, None)]
+        with span("bulk_ranges", table=table):
+            bounds = [r[0] for r in self._query(self._connect_source, sql["ranges"])]
+        bounds = [b for b in bounds[:-1] if b is not None]
+        lowers = [None] + bounds
+        uppers = bounds + [None]
+        return list(zip(lowers, uppers))
+
+    def _copy_range(self, table, sql, lower, upper):
+        for attempt in range(sql["retries"] + 1):
+            try:
+                return self._stream(table, sql, lower, upper)
+            except Exception as e:
+                if attempt == sql["retries"]:
+                    raise
+                logger.warning(
+                    f"...{table} range ({lower}, {upper}] failed, retrying: {e}"
+                )
+                time.sleep(2 ** attempt)
+                # the batches of the failed attempt that were committed
+                self._query(
+                    self._connect_target,
+                    sql["delete"],
+                    self._range_params(sql, lower, upper),
+                    commit=True,
+                )
+
+    def _range_params(self, sql, lower, upper):
+        if not sql["ranges"]:
+            return ()
+        return (lower, lower, upper, upper)
+
+    def _stream(self, table, sql, lower, upper):
+        batches = queue.Queue(maxsize=sql["queue_size"])
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    pass
+
+        def read(source):
+            try:
+                cursor = source.cursor()
+                cursor.execute(sql["select"], *self._range_params(sql, lower, upper))
+                while not stop.is_set():
+                    with span("fetch", table=table):
+                        batch = cursor.fetchmany(sql["batch_size"])
+                    put(batch)
+                    if not batch:
+                        return
+            except Exception as e:
+                put(e)
+
+        source = self._connect_source()
+        target = self._connect_target()
+        reader = threading.Thread(target=read, args=(source,), daemon=True)
+        reader.start()
+        try:
+            writer = target.cursor()
+            # pyodbc sends the whole batch as parameter arrays in one round trip
+            writer.fast_executemany = True
+            rows = 0
+            uncommitted = 0
+            while True:
+                batch = batches.get()
+                if isinstance(batch, Exception):
+                    raise batch
+                if not batch:
+                    break
+                with span("insert", table=table, rows=len(batch)):
+                    writer.executemany(sql["insert"], batch)
+                rows += len(batch)
+                uncommitted += len(batch)
+                if uncommitted >= sql["commit_interval"]:
+                    target.commit()
+                    uncommitted = 0
+                    logger.debug(f"...{table}: {rows} rows committed")
+            target.commit()
+            return rows
+        except Exception:
+            target.rollback()
+            raise
+        finally:
+            stop.set()
+            reader.join()
+            source.close()
+            target.close()
+
+    def _reconcile(self, table, sql, rows):
+        with span("reconcile", table=table):
+            source = self._query(self._connect_source, sql["count_source"])[0][0]
+            staging = self._query(self._connect_target, sql["count_staging"])[0][0]
+        if not source == staging == rows:
+            raise ValueError(
+                f"{table}: row counts differ, source {source}, staging {staging}, "
+                f"loaded {rows}"
+            )
+        logger.debug(f"...{table}: {rows} rows reconciled with the source")
@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__file__)
+
+MANIFEST_NAME = ".warehouse_manifest.json"
+
+# settings that change what gets generated for a table
+fingerprint_keys = [
+    "source_db",
+    "source_schema",
+    "target_db",
+    "staging_schema",
+    "temporal_schema",
+    "dimension_schema",
+    "dimension_id_column_name",
+    "dropfirst",
+    "backdate_hist_to",
+    "backdate_batch_size",
+    "source_primary_keys",
+    "staging_primary_keys",
+    "staging_columns",
+    "scd_type",
+    "scd_columns",
+    "rules",
+    "staging_incremental",
+    "watermark_table",
+    "staging_load",
+    "row_hash",
+    "temporal_load",
+    "dimension_incremental",
+    "dimension_indexes",
+    "history_indexes",
+    "data_compression",
+    "history_partitioning",
+]
+
+# the modules whose code shapes the generated sql, from the column model the
+# readers build and the keys and columns the settings rules pick to the
+# statements the emitter writes
+generator_modules = [
+    "settings.py",
+    "dbtemplates.py",
+    "dbutil.py",
+    "sqlformat.py",
+    "ddlemitter.py",
+    "tablemodel.py",
+    "catalog.py",
+    "ddlreader.py",
+]
+
+
+def template_version():
+    sha = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in generator_modules:
+        with open(os.path.join(here, name), "rb") as fp:
+            sha.update(fp.read())
+    return sha.hexdigest()
+
+
+class Manifest:
+    def __init__(self, outputdir):
+        self.outputdir = outputdir
+        self.path = os.path.join(outputdir, MANIFEST_NAME)
+        self.version = template_version()
+        self.tables = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as fp:
+                    self.tables = json.load(fp).get("tables", {})
+            except Exception as e:
+                logger.warning(f"ignoring unreadable manifest {self.path}: {e}")
+
+    def fingerprint(self, settings, columns):
+        data = {
+            "version": self.version,
+            # raw values only, a fingerprint must never trigger a prompt
+            "settings": dict([(k, settings.settings.get(k)) for k in fingerprint_keys]),
+            # every field, a new one changes the fingerprint without an edit here
+            "columns": [list(c) for c in columns],
+        }
+        return hashlib.sha256(
+            json.dumps(data, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    def is_current(self, table, fingerprint):
+        entry = self.tables.get(table)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return False
+        return all(os.path.exists(p) for p in self.files(table))
+
+    def files(self, table):
+        # recorded relative to the output directory, wherever the command runs
+        return [os.path.join(self.outputdir, p) for p in self.tables[table]["files"]]
+
+    def record(self, table, fingerprint, files):
+        files = [os.path.relpath(p, self.outputdir).replace(os.sep, "/") for p in files]
+        self.tables[table] = {"fingerprint": fingerprint, "files": files}
+
+    def forget(self, table):
+        self.tables.pop(table, None)
+
+    def save(self):
+        tmppath = self.path + ".tmp"
+        with open(tmppath, "w", encoding="utf-8") as fp:
+            json.dump({"tables": self.tables}, fp, indent=4, sort_keys=True)
+        os.replace(tmppath, self.path)
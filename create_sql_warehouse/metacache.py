@@ -0,0 +1,50 @@
+import os
+import re
+import pickle
+import logging
+
+logger = logging.getLogger(__file__)
+
+CACHE_VERSION = 3
+
+
+class MetadataCache:
+    # one file per server/database/schema holding the column model of every
+    # table, stamped with sys.objects.modify_date at the time it was reflected
+    def __init__(self, cache_dir, server, database, schema):
+        os.makedirs(cache_dir, exist_ok=True)
+        filename = re.sub(r"[^\w.-]", "_", f"{server}_{database}_{schema}") + ".pickle"
+        self.path = os.path.join(cache_dir, filename)
+        self.tables = {}
+        self.dirty = False
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "rb") as fp:
+                    data = pickle.load(fp)
+                if data.get("version") == CACHE_VERSION:
+                    self.tables = data["tables"]
+            except Exception as e:
+                logger.warning(f"ignoring unreadable metadata cache {self.path}: {e}")
+        logger.debug(f"{len(self.tables)} tables in metadata cache {self.path}")
+
+    def get(self, table, modify_date=None):
+        # modify_date None means offline, any cached entry will do
+        entry = self.tables.get(table)
+        if entry is None:
+            return None
+        if modify_date is not None and entry["modify_date"] != modify_date:
+            return None
+        return entry["columns"]
+
+    def put(self, table, modify_date, columns):
+        self.tables[table] = {"modify_date": modify_date, "columns": columns}
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmppath = self.path + ".tmp"
+        with open(tmppath, "wb") as fp:
+            pickle.dump({"version": CACHE_VERSION, "tables": self.tables}, fp)
+        os.replace(tmppath, self.path)
+        self.dirty = False
@@ -1,11 +1,32 @@
-import PySimpleGUI as sg
 import os
+import re
 import json
 import logging
 
 logger = logging.getLogger(__file__)
 
 
+class SettingsError(Exception):
+    pass
+
+
+def _gui():
+    # imported on the first prompt, headless runs never load the GUI stack
+    import PySimpleGUI as sg
+
+    return sg
+
+
+def match_table(mapping, table):
+    # exact table name first, then the first key that matches as a regex
+    if table in mapping:
+        return mapping[table]
+    for pattern, value in mapping.items():
+        if re.fullmatch(pattern, table):
+            return value
+    return None
+
+
 class Settings:
     settings = None
     must_keys = [
@@ -21,8 +42,35 @@ class Settings:
         "outputdir",
         "dropfirst",
     ]
+    # answers that belong to a single source table; reset between tables in
+    # batch mode so one table's picks don't leak into the next
+    table_keys = [
+        "source_table",
+        "source_primary_keys",
+        "staging_primary_keys",
+        "staging_columns",
+        "scd_type",
+        "scd_columns",
+    ]
+    # answers that need a dialog; headless runs take them from "rules"
+    prompt_keys = [
+        "source_table",
+        "source_primary_keys",
+        "staging_primary_keys",
+        "staging_columns",
+        "scd_type",
+        "scd_columns",
+    ]
 
     def __init__(self, *args, **kwargs):
+        if kwargs.get("values") is not None:
+            # already resolved settings, e.g. shipped to a worker process
+            self.settingspath = None
+            self.settings = dict(kwargs["values"])
+            self.file_settings = dict(self.settings)
+            self.headless = True
+            return
+
         logger.info(f"looking for settings here: {kwargs.get('config_path')} ")
         self.settingspath = os.path.join(kwargs.get("config_path") or "settings.json")
         if os.path.exists(self.settingspath):
@@ -32,6 +80,8 @@ class Settings:
         else:
             logger.debug("file not loaded")
             self.settings = {}
+        self.file_settings = dict(self.settings)
+        self.headless = bool(kwargs.get("headless") or self.settings.get("headless"))
 
         allmustpresent = True
         for key in self.must_keys:
@@ -39,6 +89,12 @@ class Settings:
                 logger.warn(f"{key} not found in {self.settingspath}")
                 allmustpresent = False
 
+        if not allmustpresent and self.headless:
+            missing = [k for k in self.must_keys if k not in self.settings.keys()]
+            raise SettingsError(
+                f"{', '.join(missing)} missing from {self.settingspath}, "
+                "can't prompt headless"
+            )
         if not allmustpresent:
             logger.debug("prompting")
             self._get_settings(self.settingspath)
@@ -46,14 +102,93 @@ class Settings:
     def get(self, *args, **kwargs):
         key = args[0]
         if self.settings.get(key) is None:
-            self.settings[key] = getattr(self, "_get_" + key)(**kwargs)
+            if self.headless and key in self.prompt_keys:
+                self.settings[key] = getattr(self, "_rule_" + key)(**kwargs)
+            else:
+                self.settings[key] = getattr(self, "_get_" + key)(**kwargs)
         return self.settings.get(key)
 
+    def table_option(self, key):
+        # per table options are maps of table name or regex to the option,
+        # use ".*" to apply one to every table
+        return match_table(
+            self.settings.get(key) or {}, self.settings.get("source_table")
+        )
+
+    def _get_rule(self, name):
+        return (self.settings.get("rules") or {}).get(name)
+
+    def _missing(self, key, hint):
+        table = self.settings.get("source_table")
+        raise SettingsError(f"{table}: no answer for {key} in headless mode, {hint}")
+
+    def _rule_source_table(self, tablelist):
+        self._missing("source_table", "set source_table or pass --tables")
+
+    def _rule_primary_keys(self, key, columns):
+        names = list([x.name for x in columns])
+        keys = match_table(
+            self._get_rule("primary_keys") or {}, self.settings.get("source_table")
+        )
+        if not keys:
+            self._missing(key, "no primary key found, add one to rules.primary_keys")
+        unknown = [k for k in keys if k not in names]
+        if unknown:
+            self._missing(key, f"rules.primary_keys names unknown {unknown}")
+        return keys
+
+    def _rule_source_primary_keys(self, columns):
+        return self._rule_primary_keys("source_primary_keys", columns)
+
+    def _rule_staging_primary_keys(self, columns):
+        return self._rule_primary_keys("staging_primary_keys", columns)
+
+    def _filter_columns(self, rule, columns):
+        # {"include": [regex, ...], "exclude": [regex, ...]}, default everything
+        rule = rule or {}
+        include = rule.get("include") or [".*"]
+        exclude = rule.get("exclude") or []
+        return list(
+            [
+                c
+                for c in columns
+                if any(re.search(p, c) for p in include)
+                and not any(re.search(p, c) for p in exclude)
+            ]
+        )
+
+    def _rule_staging_columns(self, columns):
+        return self._filter_columns(self._get_rule("staging_columns"), columns)
+
+    def _rule_scd_columns(self, columns):
+        return self._filter_columns(self._get_rule("scd_columns"), columns)
+
+    def _rule_scd_type(self):
+        scdtype = self._get_rule("scd_type")
+        if isinstance(scdtype, dict):
+            scdtype = match_table(scdtype, self.settings.get("source_table"))
+        if scdtype not in ["Type 1", "Type 2"]:
+            self._missing("scd_type", 'set rules.scd_type to "Type 1" or "Type 2"')
+        return scdtype
+
+    def set_table(self, table):
+        for key in self.table_keys:
+            if self.file_settings.get(key) is None:
+                self.settings.pop(key, None)
+            else:
+                self.settings[key] = self.file_settings[key]
+        # per table answers, e.g. "table_settings": {"table1": {"scd_type": "Type 1"}}
+        overrides = (self.settings.get("table_settings") or {}).get(table, {})
+        for key, value in overrides.items():
+            self.settings[key] = value
+        self.settings["source_table"] = table
+
     def _save_settings(self, settings):
         with open(os.path.join(self.settingspath), "w", encoding="utf-8") as fp:
             json.dump(settings, fp, indent=4, sort_keys=True)
 
     def _get_settings(self, config_path):
+        sg = _gui()
         self.settings_layout = [
             [sg.Text("Basic Settings")],
             [
@@ -123,7 +258,49 @@ class Settings:
 
         return values
 
+    # optional settings, None means use the default
+    def _get_odbc_driver(self):
+        return None
+
+    def _get_pool_size(self):
+        return None
+
+    def _get_max_overflow(self):
+        return None
+
+    def _get_pool_recycle(self):
+        return None
+
+    def _get_metadata_cache_dir(self):
+        return None
+
+    def _get_metadata_provider(self):
+        # "sqlalchemy" reflection, the set based "catalog" reader or "ddl" to
+        # parse the CREATE TABLE scripts in ddl_scripts_dir
+        return "sqlalchemy"
+
+    def _get_ddl_scripts_dir(self):
+        return None
+
+    def _get_ddl_script_folders(self):
+        # the names of the folders whose scripts are read, None for the Tables
+        # folders of an SSDT project and [] for every folder
+        return None
+
+    def _get_offline(self):
+        return False
+
+    def _get_watermark_table(self):
+        return "LoadWatermark"
+
+    def _get_data_compression(self):
+        return None
+
+    def _get_backdate_batch_size(self):
+        return None
+
     def _get_source_table(self, tablelist):
+        sg = _gui()
         layout = [
             [sg.Listbox(values=tablelist, size=(40, min(len(tablelist), 40)))],
             [sg.OK()],
@@ -135,6 +312,7 @@ class Settings:
         return values[0][0]
 
     def _get_primary_keys(self, columns):
+        sg = _gui()
         tablelist = list([x.name for x in columns])
         layout = [
             [
@@ -158,6 +336,7 @@ class Settings:
         return self._get_primary_keys(columns=columns)
 
     def _get_staging_columns(self, columns):
+        sg = _gui()
         # select source tables
         layout = [
             [
@@ -176,6 +355,7 @@ class Settings:
         return values[0]
 
     def _get_scd_type(self):
+        sg = _gui()
         layout = [[sg.Listbox(values=["Type 1", "Type 2"], size=(40, 15))], [sg.OK()]]
         window = sg.Window("Select Slowly Changing Dimention Type", layout)
         event, values = window.Read()
@@ -183,6 +363,7 @@ class Settings:
         return values[0][0]
 
     def _get_scd_columns(self, columns):
+        sg = _gui()
         layout = [
             [
                 sg.Listbox(
@@ -0,0 +1,347 @@
+import re
+
+# in process replacement for the SqlFormatter.exe pass that used to run over
+# the whole outputdir. It only re-lays out what the templates produce:
+# keywords are upper cased (see contextual_keywords for words that can also be
+# column names), indentation follows BEGIN/END blocks and open
+# parentheses, and lines that are too long (e.g. a compiled CREATE TABLE) are
+# broken at clause keywords and list commas.
+# Tokens are never reordered and whitespace is only dropped where T-SQL
+# doesn't need it, so temporal syntax like PERIOD FOR SYSTEM_TIME or
+# GENERATED ALWAYS AS ROW END passes through untouched.
+
+MAX_WIDTH = 100
+INDENT = "    "
+
+token_re = re.compile(
+    r"""
+    (?P<newline>\r?\n)
+    |(?P<space>[ \t]+)
+    |(?P<comment>--[^\r\n]*|/\*.*?\*/)
+    |(?P<string>N?'(?:[^']|'')*')
+    |(?P<ident>\[(?:[^\]]|\]\])*\]|"(?:[^"]|"")*")
+    |(?P<word>[@#$\w]+)
+    |(?P<op><>|<=|>=|!=|.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# reserved words can't be unquoted identifiers, they are always upper cased
+reserved_keywords = set(
+    """
+    add all alter and as asc begin between by cascade case check close clustered
+    coalesce commit constraint convert create cross cursor dbcc deallocate
+    declare default delete desc distinct drop else end except exec execute
+    exists fetch for foreign from full function group having identity if in
+    index inner insert intersect into is join key left like merge nonclustered
+    not null of off on open or order outer over primary print procedure
+    raiserror references return right rollback select set table then top tran
+    transaction truncate union unique update values view waitfor when where
+    while with
+    """.split()
+)
+
+type_keywords = set(
+    """
+    bigint binary bit char date datetime datetime2 datetimeoffset decimal float
+    int integer money nchar ntext numeric nvarchar real smalldatetime smallint
+    smallmoney sql_variant sysname text time timestamp tinyint uniqueidentifier
+    varbinary varchar xml
+    """.split()
+)
+
+
+def _is_name(tok):
+    return tok is not None and (
+        tok.kind == "ident"
+        or (tok.kind == "word" and tok.text.lower() not in reserved_keywords)
+    )
+
+
+def _text(tok):
+    return tok.text.upper() if tok is not None else ""
+
+
+def _is_type(prev2, prev, next):
+    # a column definition or DECLARE @x, CAST(x AS type) and CONVERT(type, x)
+    return (
+        _is_name(prev)
+        or _text(prev) == "AS"
+        or (_text(prev) == "(" and _text(prev2) == "CONVERT")
+    )
+
+
+def _is_function(prev2, prev, next):
+    return _text(next) == "("
+
+
+def _after(*words):
+    return lambda prev2, prev, next: _text(prev) in words
+
+
+def _before(*words):
+    return lambda prev2, prev, next: _text(next) in words
+
+
+# words that can also name a column or table, e.g. a column called date, time
+# or start. They are upper cased only where their neighbours make them a
+# keyword, (token before the previous, previous, next) -> bool. Anywhere else
+# they keep the case they were written in, so names stay exact under case
+# sensitive collations. GO and THROW are decided by their line.
+contextual_keywords = dict(
+    [(word, _is_type) for word in type_keywords]
+    + [(word, _is_function) for word in ["cast", "count", "isnull", "min"]]
+    + [
+        (
+            "max",
+            lambda prev2, prev, next: _text(next) == "("
+            or (_text(prev) == "(" and _text(prev2).lower() in type_keywords),
+        ),
+        ("try", _after("BEGIN", "END")),
+        ("catch", _after("BEGIN", "END")),
+        ("nocount", _after("SET")),
+        ("ansi_nulls", _after("SET")),
+        ("matched", _after("WHEN", "NOT")),
+        ("generated", _before("ALWAYS")),
+        ("always", _after("GENERATED")),
+        ("row", _before("START", "END")),
+        ("start", _after("ROW")),
+        ("period", _before("FOR")),
+        ("system_time", _after("FOR")),
+        ("system_versioning", _before("=")),
+        ("history_table", _before("=")),
+        (
+            "partition",
+            lambda prev2, prev, next: _text(next) in ["BY", "FUNCTION", "SCHEME"]
+            or _text(prev) in ["SWITCH", "REBUILD"],
+        ),
+        ("columnstore", _before("INDEX")),
+        ("checkident", _after("DBCC")),
+        (
+            "reseed",
+            lambda prev2, prev, next: _text(prev) == ","
+            and prev2 is not None
+            and prev2.kind == "string",
+        ),
+        ("no_infomsgs", _after("WITH")),
+        ("tablock", lambda prev2, prev, next: _text(prev2) == "WITH"),
+        ("next", _after("FETCH")),
+        ("nulls", _after("IGNORE", "RESPECT")),
+        (
+            "rows",
+            lambda prev2, prev, next: _text(next) in ["ONLY", "BETWEEN"]
+            or (prev is not None and prev.text.isdigit()),
+        ),
+    ]
+)
+
+# clause keywords a long line is broken in front of
+break_keywords = [
+    "FROM",
+    "WHERE",
+    "GROUP",
+    "ORDER",
+    "HAVING",
+    "ON",
+    "WHEN",
+    "THEN",
+    "VALUES",
+    "EXCEPT",
+    "UNION",
+    "INTERSECT",
+    "INNER",
+    "LEFT",
+    "JOIN",
+]
+
+
+class Token:
+    __slots__ = ["kind", "text", "space"]
+
+    def __init__(self, kind, text, space):
+        self.kind = kind
+        self.text = text
+        self.space = space
+
+
+def tokenize(sql):
+    lines = [[]]
+    space = False
+    for m in token_re.finditer(sql):
+        kind = m.lastgroup
+        if kind == "newline":
+            lines.append([])
+            space = False
+        elif kind == "space":
+            space = True
+        else:
+            lines[-1].append(Token(kind, m.group(), space))
+            space = False
+    _upper_keywords(lines)
+    return lines
+
+
+def _upper_keywords(lines):
+    # neighbours are looked up across lines and comments
+    code = []
+    line_starts = set()
+    for tokens in lines:
+        if tokens:
+            line_starts.add(len(code))
+        code.extend(tok for tok in tokens if tok.kind != "comment")
+    code = [None, None] + code + [None, None]
+    line_starts = set(i + 2 for i in line_starts)
+
+    def ends_line(i):
+        return code[i] is None or i in line_starts
+
+    for i in range(2, len(code) - 2):
+        tok = code[i]
+        if tok.kind != "word":
+            continue
+        word = tok.text.lower()
+        if word in reserved_keywords:
+            tok.text = tok.text.upper()
+        elif word in ["go", "throw"]:
+            # GO is a line of its own, THROW starts a statement
+            alone = ends_line(i + 1) or (
+                code[i + 1].text == ";" and ends_line(i + 2)
+            )
+            if i in line_starts and (word == "throw" or alone):
+                tok.text = tok.text.upper()
+        elif word in contextual_keywords:
+            if contextual_keywords[word](code[i - 2], code[i - 1], code[i + 1]):
+                tok.text = tok.text.upper()
+
+
+def _render(tokens):
+    out = []
+    for i, tok in enumerate(tokens):
+        if i > 0 and tok.space:
+            prev = tokens[i - 1].text
+            if prev != "(" and tok.text not in [")", ",", ";"]:
+                out.append(" ")
+        out.append(tok.text)
+    return "".join(out)
+
+
+def _split_before_keywords(tokens):
+    pieces = [[]]
+    depth = 0
+    for i, tok in enumerate(tokens):
+        if tok.text == "(":
+            depth += 1
+        elif tok.text == ")":
+            depth -= 1
+        if (
+            depth <= 0
+            and i > 0
+            and tok.kind == "word"
+            and tok.text in break_keywords
+            and tokens[i - 1].text not in break_keywords
+        ):
+            pieces.append([])
+        pieces[-1].append(tok)
+    return pieces
+
+
+def _split_at_commas(tokens):
+    pieces = [[]]
+    depth = 0
+    for tok in tokens:
+        if tok.text == "(":
+            depth += 1
+        elif tok.text == ")":
+            depth -= 1
+        pieces[-1].append(tok)
+        if tok.text == "," and depth <= 0:
+            pieces.append([])
+    return [p for p in pieces if p]
+
+
+def _split_outer_parens(tokens):
+    # break open the widest top level parenthesis group:
+    # after its "(", after each of its commas and before its ")"
+    groups = []
+    depth = 0
+    for i, tok in enumerate(tokens):
+        if tok.text == "(":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif tok.text == ")":
+            depth -= 1
+            if depth == 0:
+                groups.append((start, i))
+    if not groups:
+        return [tokens]
+    start, end = max(groups, key=lambda g: g[1] - g[0])
+    if end - start < 2:
+        return [tokens]
+    pieces = [tokens[: start + 1], []]
+    depth = 0
+    for tok in tokens[start + 1 : end]:
+        if tok.text == "(":
+            depth += 1
+        elif tok.text == ")":
+            depth -= 1
+        pieces[-1].append(tok)
+        if tok.text == "," and depth == 0:
+            pieces.append([])
+    pieces.append(tokens[end:])
+    return [p for p in pieces if p]
+
+
+def _wrap(tokens, width):
+    if len(_render(tokens)) <= width:
+        return [tokens]
+    for splitter in [_split_before_keywords, _split_at_commas, _split_outer_parens]:
+        pieces = splitter(tokens)
+        if len(pieces) > 1:
+            lines = []
+            for piece in pieces:
+                lines.extend(_wrap(piece, width))
+            return lines
+    return [tokens]
+
+
+def _is_block_end(tokens, i):
+    return tokens[i].text == "END" and (i == 0 or tokens[i - 1].text != "ROW")
+
+
+def format_sql(sql, width=MAX_WIDTH):
+    lines = []
+    for tokens in tokenize(sql):
+        lines.extend(_wrap(tokens, width) if tokens else [tokens])
+
+    out = []
+    block = 0
+    parens = 0
+    for tokens in lines:
+        if not tokens:
+            # blank lines survive only between statements
+            if parens == 0 and out and out[-1] != "":
+                out.append("")
+            continue
+        if tokens[0].text == "GO":
+            block = 0
+            parens = 0
+
+        indent = block + parens
+        if _is_block_end(tokens, 0) or tokens[0].text == ")":
+            indent -= 1
+        out.append(INDENT * max(indent, 0) + _render(tokens))
+
+        for i, tok in enumerate(tokens):
+            if tok.text == "(":
+                parens += 1
+            elif tok.text == ")":
+                parens = max(parens - 1, 0)
+            elif tok.text in ["BEGIN", "CASE"]:
+                following = tokens[i + 1].text if i + 1 < len(tokens) else ""
+                if following not in ["TRAN", "TRANSACTION", "DISTRIBUTED"]:
+                    block += 1
+            elif _is_block_end(tokens, i):
+                block = max(block - 1, 0)
+
+    return "\n".join(out).strip() + "\n"
@@ -0,0 +1,65 @@
+import sys
+from collections import namedtuple
+from sqlalchemy import types as sqltypes
+from sqlalchemy.dialects import mssql
+
+# the column model every metadata provider produces and the generators consume:
+# immutable tuples whose type is the T-SQL type as an interned string, so the
+# columns of thousands of wide tables share a few hundred type strings.
+# sqlalchemy types only exist at the reflection boundary, see type_string.
+# expression is set on the persisted computed columns generation adds, e.g.
+# the row hash, computed flags a computed source column.
+Column = namedtuple(
+    "Column",
+    ["name", "type", "nullable", "primary_key", "identity", "computed", "expression"],
+    defaults=[True, False, False, False, None],
+)
+
+
+class TableModel(namedtuple("TableModel", ["name", "schema", "columns"])):
+    __slots__ = ()
+
+    @property
+    def key_columns(self):
+        return [c for c in self.columns if c.primary_key]
+
+    @property
+    def keys(self):
+        return [c.name for c in self.columns if c.primary_key]
+
+    def column(self, name):
+        for c in self.columns:
+            if c.name == name:
+                return c
+        raise KeyError(name)
+
+
+_dialect = mssql.dialect()
+_type_strings = {}
+
+
+def type_string(sqltype):
+    # compiled once per distinct type, None for types sqlalchemy didn't know
+    if isinstance(sqltype, sqltypes.NullType):
+        return None
+    key = repr(sqltype)
+    if key not in _type_strings:
+        _type_strings[key] = sys.intern(str(sqltype.compile(dialect=_dialect)))
+    return _type_strings[key]
+
+
+def columns_from_table(table):
+    return tuple(
+        [
+            Column(
+                c.name,
+                type_string(c.type),
+                nullable=c.nullable,
+                primary_key=c.primary_key,
+                identity=c.autoincrement is True,
+                computed=c.computed is not None,
+            )
+            for c in table.columns
+        ]
+    )
+
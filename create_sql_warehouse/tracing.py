@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# structured timing spans, off unless --trace is given. A span inherits the
+# attributes of the span it is nested in, so everything under a table's
+# "generate" span carries the table name. Worker processes collect() their
+# spans and hand them back with their results, the parent extend()s them.
+
+_enabled = False
+_spans = []
+_local = threading.local()
+
+
+def reset(enabled=False):
+    global _enabled
+    _enabled = enabled
+    _spans.clear()
+    _local.stack = []
+
+
+def is_enabled():
+    return _enabled
+
+
+@contextmanager
+def span(name, **attrs):
+    if not _enabled:
+        yield
+        return
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    if stack:
+        attrs = {**stack[-1], **attrs}
+    stack.append(attrs)
+    start = time.time()
+    counter = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - counter
+        stack.pop()
+        _spans.append(
+            {
+                "name": name,
+                "start": start,
+                "duration": duration,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "attrs": attrs,
+            }
+        )
+
+
+def collect():
+    spans = list(_spans)
+    _spans.clear()
+    return spans
+
+
+def extend(spans):
+    _spans.extend(spans)
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summary():
+    stages = {}
+    tables = {}
+    for s in _spans:
+        stages.setdefault(s["name"], []).append(s["duration"])
+        table = s["attrs"].get("table")
+        if table is not None:
+            totals = tables.setdefault(table, {})
+            totals[s["name"]] = totals.get(s["name"], 0) + s["duration"] * 1000
+    for name, durations in stages.items():
+        durations.sort()
+        stages[name] = {
+            "count": len(durations),
+            "total_ms": sum(durations) * 1000,
+            "mean_ms": sum(durations) / len(durations) * 1000,
+            "p95_ms": _percentile(durations, 0.95) * 1000,
+            "max_ms": durations[-1] * 1000,
+        }
+    return {"stages": stages, "tables": tables}
+
+
+def chrome_trace():
+    # the Trace Event Format, opens in chrome://tracing, Perfetto and speedscope
+    return {
+        "traceEvents": [
+            {
+                "name": s["name"],
+                "cat": "create_sql_warehouse",
+                "ph": "X",
+                "ts": s["start"] * 1e6,
+                "dur": s["duration"] * 1e6,
+                "pid": s["pid"],
+                "tid": s["tid"],
+                "args": s["attrs"],
+            }
+            for s in sorted(_spans, key=lambda s: s["start"])
+        ],
+        "displayTimeUnit": "ms",
+    }
+
+
+def write(prefix):
+    summary_path = prefix + ".summary.json"
+    with open(summary_path, "w", encoding="utf-8") as fp:
+        json.dump(summary(), fp, indent=4, sort_keys=True)
+    trace_path = prefix + ".trace.json"
+    with open(trace_path, "w", encoding="utf-8") as fp:
+        json.dump(chrome_trace(), fp, default=str)
+    return summary_path, trace_path
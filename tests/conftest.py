@@ -0,0 +1,122 @@
+import os
+import sys
+
+import pytest
+
+# the modules import each other by bare name, the way the scripts run them
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "create_sql_warehouse")
+)
+
+from sqlalchemy.sql.elements import TextClause  # noqa: E402
+
+from catalog import sa_type  # noqa: E402
+from tablemodel import Column, type_string  # noqa: E402
+
+
+def column(name, type_name, *args, **kwargs):
+    # type arguments as sys.columns reports them, see catalog.sa_type
+    return Column(name, type_string(sa_type(type_name, *args)), **kwargs)
+
+
+def source_models():
+    return {
+        "Customer": (
+            column("id", "int", nullable=False, primary_key=True, identity=True),
+            column("name", "nvarchar", 100),
+            column("City", "varchar", 40, None, None, "Latin1_General_CI_AS"),
+            column("balance", "decimal", None, 18, 4),
+            column("Modified", "datetime2", None, 27, 3, nullable=False),
+        ),
+        "OrderLine": (
+            column("orderId", "bigint", nullable=False, primary_key=True),
+            column("line", "smallint", nullable=False, primary_key=True),
+            column("amount", "money"),
+            column("note", "nvarchar", -1),
+            column("Modified", "datetime2", None, 27, 3, nullable=False),
+        ),
+    }
+
+
+base_values = {
+    "source_server": "localhost",
+    "source_db": "source",
+    "source_schema": "dbo",
+    "target_server": "localhost",
+    "target_db": "target",
+    "staging_schema": "staging",
+    "temporal_schema": "hist",
+    "dimension_schema": "dim",
+    "dimension_id_column_name": "dimId",
+    "dropfirst": True,
+    "backdate_hist_to": "2019-01-01",
+    "outputdir": ".",
+    "offline": True,
+    "rules": {"scd_type": {"Customer": "Type 2", ".*": "Type 1"}},
+}
+
+# option combinations every generated artifact is checked under
+option_sets = {
+    "defaults": {},
+    "incremental": {
+        "staging_incremental": {".*": {"mode": "watermark", "column": "Modified"}},
+        "staging_load": {".*": {"batch_size": 1000}},
+        "dimension_incremental": {".*": True},
+    },
+    "change_tracking": {
+        "staging_incremental": {".*": {"mode": "change_tracking"}},
+        "staging_load": {".*": {"tablock": True, "batch_size": 500}},
+    },
+    "row_hash_batched": {
+        "row_hash": {".*": {"algorithm": "SHA2_256", "index": True}},
+        "temporal_load": {".*": {"batch_size": 1000}},
+        "backdate_batch_size": 1000,
+    },
+    "partitioned": {
+        "history_partitioning": {".*": {"interval": "month", "retention": 24}},
+        "data_compression": {"hist": "PAGE", "dim": "ROW"},
+        "dimension_indexes": {".*": True},
+        "dropfirst": False,
+    },
+}
+
+
+class FakeSourceEngine:
+    # answers every statement with rows, and like sqlalchemy 2 only runs
+    # statements on a connection
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def connect(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, statement):
+        assert isinstance(statement, TextClause)
+        self.statements.append(statement.text)
+        return self
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.fixture(params=sorted(option_sets))
+def generated(request):
+    # (table, model, artifacts) for every table under one option set
+    from dbutil import DbUtil
+    from settings import Settings
+
+    settings = Settings(values=dict(base_values, **option_sets[request.param]))
+    models = source_models()
+    dbutil = DbUtil(settingsinstance=settings, source_columns=models)
+    result = []
+    for table in models:
+        settings.set_table(table)
+        result.append((table, models[table], dbutil.get_artifacts(table)))
+    return result
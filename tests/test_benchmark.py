@@ -0,0 +1,39 @@
+from benchmark import BENCHMARK_VERSION, base_settings, compare, run_case
+
+
+def test_every_timed_pass_is_kept():
+    case = run_case(
+        dict(base_settings), 2, 5, 1, False, repeat=3, warmup=1, min_time=0
+    )
+    assert case["name"] == "t2_c5"
+    assert case["warmup"] == 1
+    assert len(case["passes"]) == 3
+    assert case["best_tables_per_sec"] == 2 / min(case["passes"])
+    assert case["tables_per_sec"] <= case["best_tables_per_sec"]
+    assert case["peak_memory_bytes"] is None
+
+
+def result(name, best, tables_per_sec=None):
+    return {
+        "name": name,
+        "tables_per_sec": tables_per_sec or best,
+        "best_tables_per_sec": best,
+        "peak_memory_bytes": None,
+    }
+
+
+def test_compare_flags_best_pass_drops_beyond_the_threshold():
+    baseline = {
+        "benchmark_version": BENCHMARK_VERSION,
+        "cases": [result("a", 100), result("b", 100), result("gone", 100)],
+    }
+    # the medians are far off, only the best passes count
+    current = {"cases": [result("a", 95, 10), result("b", 85, 200), result("new", 1)]}
+    assert compare(current, baseline, 0.1) == ["b"]
+
+
+def test_compare_falls_back_to_a_single_pass_baseline(capsys):
+    baseline = {"cases": [{"name": "a", "tables_per_sec": 100}]}
+    current = {"cases": [result("a", 80)]}
+    assert compare(current, baseline, 0.1) == ["a"]
+    assert "benchmark version None" in capsys.readouterr().out
@@ -0,0 +1,124 @@
+from collections import namedtuple
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import mssql
+from sqlalchemy.sql.elements import TextClause
+
+from catalog import CatalogReader, sa_type
+from tablemodel import Column, type_string
+
+collation = "Latin1_General_CI_AS"
+
+
+# sys.columns arguments and the type reflecting the same column returns
+@pytest.mark.parametrize(
+    "args, reflected",
+    [
+        (("int",), mssql.INTEGER()),
+        (("BigInt",), mssql.BIGINT()),
+        (("bit",), mssql.BIT()),
+        (("money",), mssql.MONEY()),
+        (("uniqueidentifier",), mssql.UNIQUEIDENTIFIER()),
+        (("decimal", None, 18, 4), mssql.DECIMAL(18, 4)),
+        (("numeric", None, 9, 0), mssql.NUMERIC(9, 0)),
+        (("float", None, 53, 0), mssql.FLOAT(53)),
+        # max_length is in bytes, two per character for the unicode types
+        (("nvarchar", 200), mssql.NVARCHAR(100)),
+        (("nchar", 20), mssql.NCHAR(10)),
+        (("varchar", 40, None, None, collation), mssql.VARCHAR(40, collation=collation)),
+        (("nvarchar", -1), mssql.NVARCHAR(None)),
+        (("varbinary", -1, None, None, collation), mssql.VARBINARY(None)),
+        (("binary", 8), mssql.BINARY(8)),
+        (("ntext", 16, None, None, collation), mssql.NTEXT(collation=collation)),
+        # precision is in sys.columns.scale for the time types
+        (("datetime2", None, 27, 3), mssql.DATETIME2(3)),
+        (("datetimeoffset", None, 34, 7), mssql.DATETIMEOFFSET(7)),
+        (("time", None, 16, 0), mssql.TIME(0)),
+        (("datetime", None, 23, 3), mssql.DATETIME()),
+        (("timestamp", 8), mssql.TIMESTAMP()),
+    ],
+)
+def test_sa_type_matches_reflection(args, reflected):
+    assert type_string(sa_type(*args)) == type_string(reflected)
+
+
+def test_unknown_types_have_no_type_string():
+    assert type_string(sa_type("geography")) is None
+
+
+ColumnRow = namedtuple(
+    "ColumnRow",
+    [
+        "table_name",
+        "column_name",
+        "type_name",
+        "max_length",
+        "precision",
+        "scale",
+        "collation_name",
+        "is_nullable",
+        "is_identity",
+        "is_computed",
+    ],
+)
+KeyRow = namedtuple("KeyRow", ["table_name", "column_name"])
+
+
+class FakeConnection:
+    # executes only statements, as sqlalchemy 2 connections do
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.engine.closed = True
+
+    def execute(self, statement):
+        assert isinstance(statement, TextClause)
+        self.engine.statements.append(statement.text)
+        return self
+
+    def fetchall(self):
+        return self.engine.results[len(self.engine.statements) - 1]
+
+
+class FakeEngine:
+    def __init__(self, columns, keys):
+        self.results = [columns, keys]
+        self.statements = []
+        self.closed = False
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+def test_read_builds_every_table_from_two_queries():
+    engine = FakeEngine(
+        [
+            ColumnRow("Customer", "id", "int", 4, 10, 0, None, 0, 1, 0),
+            ColumnRow("Customer", "name", "nvarchar", 200, 0, 0, collation, 1, 0, 0),
+            ColumnRow("Customer", "total", "money", 8, 19, 4, None, 1, 0, 1),
+            ColumnRow("Skipped", "id", "int", 4, 10, 0, None, 0, 0, 0),
+        ],
+        [KeyRow("Customer", "id"), KeyRow("Skipped", "id")],
+    )
+    models = CatalogReader(engine, "sales").read(["Customer"])
+    assert len(engine.statements) == 2
+    assert engine.closed
+    assert all("'sales'" in sql for sql in engine.statements)
+    assert models == {
+        "Customer": (
+            Column("id", "INTEGER", nullable=False, primary_key=True, identity=True),
+            Column("name", f"NVARCHAR(100) COLLATE {collation}"),
+            Column("total", "MONEY", computed=True),
+        )
+    }
+
+
+def test_read_runs_on_a_real_engine():
+    # sqlite has no sys.columns, getting that far means the statements ran
+    with pytest.raises(Exception, match="no such table: sys.columns"):
+        CatalogReader(create_engine("sqlite://"), "dbo").read()
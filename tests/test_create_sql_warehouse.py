@@ -0,0 +1,57 @@
+import logging
+
+from conftest import FakeSourceEngine, base_values
+from create_sql_warehouse import select_tables
+from dbutil import DbUtil
+from settings import Settings
+
+tablelist = ["Customer", "CustomerAddress", "OrderLine", "Orders", "Product"]
+
+
+def test_no_selection_keeps_every_table():
+    assert select_tables(tablelist) == tablelist
+
+
+def test_named_tables_in_the_order_given():
+    assert select_tables(tablelist, tables="Orders, Customer,") == [
+        "Orders",
+        "Customer",
+    ]
+
+
+def test_missing_names_are_dropped_with_a_warning(caplog):
+    with caplog.at_level(logging.WARNING):
+        selected = select_tables(tablelist, tables="Customer,Invoice,Refund")
+    assert selected == ["Customer"]
+    assert "Invoice, Refund" in caplog.text
+
+
+def test_regex_searches_anywhere_in_the_name():
+    assert select_tables(tablelist, pattern="^Customer") == [
+        "Customer",
+        "CustomerAddress",
+    ]
+    assert select_tables(tablelist, pattern="Line|^Prod") == ["OrderLine", "Product"]
+
+
+def test_glob_matches_the_whole_name():
+    assert select_tables(tablelist, globpattern="Order*") == ["OrderLine", "Orders"]
+    assert select_tables(tablelist, globpattern="Customer") == ["Customer"]
+
+
+def test_filters_combine():
+    selected = select_tables(
+        tablelist,
+        tables="Customer,CustomerAddress,Orders",
+        pattern="Customer",
+        globpattern="*Address",
+    )
+    assert selected == ["CustomerAddress"]
+
+
+def test_source_tables_are_listed_from_the_source(monkeypatch):
+    dbutil = DbUtil(settingsinstance=Settings(values=dict(base_values, offline=False)))
+    engine = FakeSourceEngine([("Customer",), ("Orders",)])
+    monkeypatch.setattr(dbutil, "_get_source_engine", lambda: engine)
+    assert dbutil.get_source_tables() == ["Customer", "Orders"]
+    assert "TABLE_SCHEMA='dbo'" in engine.statements[0]
@@ -0,0 +1,591 @@
+import re
+
+import pytest
+
+from conftest import base_values, column, option_sets, source_models
+from dbutil import DbUtil
+from ddlreader import _Parser, _tokens
+from settings import Settings
+from sqlformat import format_sql
+from tablemodel import type_string
+
+markers_re = re.compile(
+    r"BEGIN TRY|END TRY|BEGIN CATCH|END CATCH|BEGIN TRANSACTION|"
+    r"COMMIT TRANSACTION|ROLLBACK TRANSACTION|THROW"
+)
+
+
+def assert_transactions_guarded(sql, name):
+    # every transaction commits inside a TRY whose CATCH rolls back and rethrows,
+    # under XACT_ABORT so a failed statement never reaches the COMMIT
+    markers = markers_re.findall(format_sql(sql.replace("\r", "")))
+    if "BEGIN TRANSACTION" not in markers:
+        return
+    assert "SET XACT_ABORT ON" in sql, name
+    for i, marker in enumerate(markers):
+        if marker != "BEGIN TRANSACTION":
+            continue
+        assert "BEGIN TRY" in markers[:i], name
+        assert markers[i - 1] == "BEGIN TRY", name
+        end = markers.index("END TRY", i)
+        assert markers[i + 1 : end] == ["COMMIT TRANSACTION"], name
+        assert markers[end + 1 : end + 5] == [
+            "BEGIN CATCH",
+            "ROLLBACK TRANSACTION",
+            "THROW",
+            "END CATCH",
+        ], name
+
+
+def _procs(generated, schema):
+    for table, model, artifacts in generated:
+        for proc_schema, otype, name, sql in artifacts:
+            if proc_schema == schema and otype == "Stored Procedures":
+                yield name, sql
+
+
+def test_staging_batches_are_guarded(generated):
+    for name, sql in _procs(generated, "staging"):
+        assert_transactions_guarded(sql, name)
+
+
+def test_temporal_batches_are_guarded(generated):
+    for name, sql in _procs(generated, "hist"):
+        assert_transactions_guarded(sql, name)
+
+
+def test_dimension_builds_are_guarded(generated):
+    for name, sql in _procs(generated, "dim"):
+        assert_transactions_guarded(sql, name)
+
+
+def _tables(values, table):
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns=source_models())
+    settings.set_table(table)
+    return dict(
+        [
+            ((schema, name), sql)
+            for schema, otype, name, sql in dbutil.get_artifacts(table)
+            if otype == "Tables"
+        ]
+    )
+
+
+@pytest.mark.parametrize("dropfirst", [True, False])
+def test_recreated_tables_reset_their_watermarks(dropfirst):
+    values = dict(
+        base_values,
+        dropfirst=dropfirst,
+        backdate_batch_size=1000,
+        **option_sets["incremental"],
+    )
+    tables = _tables(values, "Customer")
+    resets = {
+        ("hist", "Customer"): [
+            "DELETE FROM [staging].[LoadWatermark]",
+            "('Customer')",
+            "DELETE FROM [hist].[LoadWatermark]",
+            "('BackdateCustomer', 'BackdateCustomerDone')",
+        ],
+        ("dim", "Customer"): [
+            "DELETE FROM [dim].[LoadWatermark]",
+            "('BuildDimCustomer')",
+        ],
+    }
+    for key, expected in resets.items():
+        for text in expected:
+            assert (text in tables[key]) == dropfirst, (key, text)
+    assert "LoadWatermark" not in tables[("staging", "Customer")]
+
+
+def test_only_empty_history_partitions_are_split():
+    settings = Settings(values=dict(base_values, **option_sets["partitioned"]))
+    dbutil = DbUtil(settingsinstance=settings, source_columns=source_models())
+    settings.set_table("Customer")
+    sql = format_sql(dbutil.get_history_maintenance_ddl("Customer"))
+    check = sql.index("$PARTITION.[PF_CustomerHistory](@boundary)")
+    assert "[rows] > 0" in sql[check:]
+    assert check < sql.index("SPLIT RANGE (@boundary)")
+    assert sql.index("BREAK", check) < sql.index("SPLIT RANGE (@boundary)")
+
+
+def test_rowversion_is_copied_as_binary():
+    models = source_models()
+    models["Customer"] += (column("Version", "timestamp", 8, nullable=False),)
+    values = dict(
+        base_values,
+        staging_incremental={".*": {"mode": "watermark", "column": "Version"}},
+        row_hash={".*": True},
+    )
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns=models)
+    settings.set_table("Customer")
+    staging_sql, staging_proc = dbutil.get_staging_ddl("Customer")
+    temporal_sql, temporal_proc = dbutil.get_temporal_ddl("Customer")
+    for sql in [staging_sql, temporal_sql]:
+        assert "[Version] BINARY(8)" in sql
+        assert "TIMESTAMP" not in sql.upper()
+    assert "DECLARE @from BINARY(8)" in staging_proc
+    assert "[Version]" in staging_proc.split("INSERT INTO")[1]
+
+
+@pytest.mark.parametrize(
+    "option_set, temporal_load",
+    [
+        ("incremental", {}),
+        ("change_tracking", {}),
+        ("incremental", {"temporal_load": {".*": {"batch_size": 1000}}}),
+    ],
+)
+def test_temporal_load_commits_the_staged_watermark(option_set, temporal_load):
+    values = dict(base_values, **option_sets[option_set], **temporal_load)
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns=source_models())
+    settings.set_table("OrderLine")
+    artifacts = dict(
+        [
+            ((schema, name), sql)
+            for schema, otype, name, sql in dbutil.get_artifacts("OrderLine")
+        ]
+    )
+    watermarks = artifacts[("staging", "LoadWatermark")]
+    assert "[PendingWatermark] SQL_VARIANT NULL" in watermarks
+    assert "PendingWatermark" not in dbutil.get_watermark_table_ddl("dim")
+
+    staging = format_sql(artifacts[("staging", "PopulateOrderLine")])
+    # staging reads the committed watermark and only ever sets the pending one
+    assert "SET [Watermark]" not in staging
+    cleared = staging.index("SET [PendingWatermark] = NULL")
+    assert cleared < staging.index("TRUNCATE TABLE [staging].[OrderLine]")
+    assert staging.rindex("INSERT INTO") < staging.index(
+        "SET [PendingWatermark] = CAST(@to AS SQL_VARIANT)"
+    )
+
+    temporal = format_sql(artifacts[("hist", "PopulateOrderLine")])
+    assert "SET XACT_ABORT ON" in temporal
+    committed = temporal.index("SET [Watermark] = [PendingWatermark]")
+    assert temporal.rindex("MERGE [hist].[OrderLine]") < committed
+    if "COMMIT TRANSACTION" in temporal:
+        assert temporal.rindex("COMMIT TRANSACTION") < committed
+    assert "[ObjectName] = 'OrderLine' AND [PendingWatermark] IS NOT NULL" in temporal
+
+
+def _row_hash_artifacts(extra_columns):
+    models = source_models()
+    models["Customer"] += extra_columns
+    settings = Settings(values=dict(base_values, row_hash={".*": True}))
+    dbutil = DbUtil(settingsinstance=settings, source_columns=models)
+    settings.set_table("Customer")
+    staging_sql, staging_proc = dbutil.get_staging_ddl("Customer")
+    temporal_sql, temporal_proc = dbutil.get_temporal_ddl("Customer")
+    return dbutil, staging_sql, temporal_sql, temporal_proc
+
+
+def test_row_hash_converts_large_object_types():
+    collation = "SQL_Latin1_General_CP1_CI_AS"
+    dbutil, staging_sql, temporal_sql, temporal_proc = _row_hash_artifacts(
+        (
+            column("photo", "image"),
+            column("memo", "text", 16, None, None, collation),
+            column("comment", "ntext", 16, None, None, collation),
+            column("doc", "xml"),
+        )
+    )
+    for sql in [staging_sql, temporal_sql]:
+        assert "CONVERT(NVARCHAR(MAX), CONVERT(VARBINARY(MAX), [photo]), 1)" in sql
+        assert "CONVERT(NVARCHAR(MAX), CONVERT(VARCHAR(MAX), [memo]))" in sql
+        assert "CONVERT(NVARCHAR(MAX), CONVERT(NVARCHAR(MAX), [comment]))" in sql
+        assert "CONVERT(NVARCHAR(MAX), [doc])" in sql
+        assert "CONVERT(NVARCHAR(MAX), [photo]" not in sql
+
+
+def test_row_hash_null_and_value_boundaries():
+    dbutil = _row_hash_artifacts(())[0]
+    expression = dbutil._get_hash_expression(
+        source_models()["Customer"][:2], "SHA2_256"
+    )
+    value = "CONVERT(NVARCHAR(MAX), [id])"
+    # a length prefix on every value, and a NULL marker no prefix starts with
+    assert (
+        f"ISNULL(CONVERT(NVARCHAR(MAX), DATALENGTH({value})) + N':' + {value}, N'~')"
+        in expression
+    )
+    assert "N'|'" not in expression
+
+
+def test_sql_variant_columns_are_compared_outside_the_hash():
+    dbutil, staging_sql, temporal_sql, temporal_proc = _row_hash_artifacts(
+        (column("setting", "sql_variant"),)
+    )
+    for sql in [staging_sql, temporal_sql]:
+        assert "setting SQL_VARIANT" in sql
+        assert "[setting]" not in sql.split("HASHBYTES")[1]
+    assert (
+        "WHEN MATCHED AND (target.[RowHash] <> source.[RowHash] OR NOT EXISTS "
+        "(SELECT target.[setting] INTERSECT SELECT source.[setting])) THEN UPDATE"
+    ) in temporal_proc
+
+
+def _dimension_proc(table, dimension_incremental):
+    values = dict(base_values, dimension_incremental=dimension_incremental)
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns=source_models())
+    settings.set_table(table)
+    procs = dict(_procs([(table, None, dbutil.get_artifacts(table))], "dim"))
+    return " ".join(procs[f"BuildDim{table}"].split())
+
+
+@pytest.mark.parametrize("table", ["Customer", "OrderLine"])
+@pytest.mark.parametrize(
+    "dimension_incremental, lag",
+    [({".*": True}, 60), ({".*": {"lag": 900}}, 900)],
+)
+def test_dimension_builds_read_half_open_lagged_windows(
+    table, dimension_incremental, lag
+):
+    # Customer is a type 2 dimension, OrderLine type 1
+    proc = _dimension_proc(table, dimension_incremental)
+    assert "@from DATETIME2(0) = ( SELECT CAST([Watermark] AS DATETIME2(0))" in proc
+    assert (
+        f"DECLARE @to DATETIME2(0) = "
+        f"CAST(DATEADD(SECOND, -{lag}, SYSUTCDATETIME()) AS DATETIME2(0));"
+    ) in proc
+    assert (
+        "WHERE ([ValidFrom] < @to AND (@from IS NULL OR [ValidFrom] >= @from)) "
+        "OR ([ValidTo] < @to AND (@from IS NULL OR [ValidTo] >= @from))"
+    ) in proc
+    assert "DATETIME2(7)" not in proc and "<= @to" not in proc
+
+
+@pytest.mark.parametrize(
+    "dimension_incremental, message",
+    [
+        ({".*": {"lag": 0}}, "lag must be an int >= 1"),
+        ({".*": {"lag": "60"}}, "lag must be an int >= 1"),
+        ({".*": {"delay": 60}}, "unknown dimension_incremental options"),
+    ],
+)
+def test_dimension_lag_is_validated(dimension_incremental, message):
+    with pytest.raises(ValueError, match=message):
+        _dimension_proc("Customer", dimension_incremental)
+
+
+def test_partitioned_history_matches_a_rules_keyed_temporal_table():
+    # no source key, the key comes from rules.primary_keys
+    models = {
+        "Code": (
+            column("code", "varchar", 10),
+            column("label", "nvarchar", 100),
+            column("Modified", "datetime2", None, 27, 3, nullable=False),
+        )
+    }
+    values = dict(base_values, **option_sets["partitioned"])
+    values["rules"] = dict(values["rules"], primary_keys={"Code": ["code"]})
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns=models)
+    settings.set_table("Code")
+    dbutil.get_staging_ddl("Code")
+    temporal_sql, temporal_proc = dbutil.get_temporal_ddl("Code")
+    tables = dict(
+        [
+            (name, [(c["name"], type_string(c["type"]), c["nullable"]) for c in value])
+            for kind, schema, name, value in _Parser(_tokens(temporal_sql)).parse()
+            if kind == "table"
+        ]
+    )
+    assert ("code", "VARCHAR(10)", False) in tables["Code"]
+    assert tables["CodeHistory"] == tables["Code"]
+    assert tables["CodeHistoryExpired"] == tables["Code"]
+
+
+def _partitioned(partitioning):
+    values = dict(base_values, **option_sets["partitioned"])
+    values["history_partitioning"] = {".*": partitioning}
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns=source_models())
+    settings.set_table("Customer")
+    dbutil.get_staging_ddl("Customer")
+    temporal_sql, temporal_proc = dbutil.get_temporal_ddl("Customer")
+    return temporal_sql, dbutil.get_history_maintenance_ddl("Customer")
+
+
+@pytest.mark.parametrize("interval, ahead", [("month", None), ("week", 3)])
+def test_history_partitions_are_seeded_through_ahead(interval, ahead):
+    partitioning = {"interval": interval, "retention": 12}
+    if ahead is not None:
+        partitioning["ahead"] = ahead
+    temporal_sql, maintenance_sql = _partitioned(partitioning)
+    ahead = ahead or 2
+    boundaries = ["@current"] + [
+        f"DATEADD({interval}, {i}, @current)" for i in range(1, ahead + 1)
+    ]
+    create = (
+        "CREATE PARTITION FUNCTION [PF_CustomerHistory] (DATETIME2(0)) "
+        f"AS RANGE RIGHT FOR VALUES ({', '.join(boundaries)})"
+    )
+    assert create in temporal_sql
+    current = f"DATEADD({interval}, DATEDIFF({interval}, 0, SYSUTCDATETIME()), 0)"
+    assert f"DECLARE @current DATETIME2(0) = {current};" in temporal_sql
+    # the function exists before the history table that is partitioned on it
+    assert temporal_sql.index(create) < temporal_sql.index("ON [PS_CustomerHistory]")
+    # the proc keeps splitting up to the same boundary, one past the seeded ones
+    # once the next interval has started
+    assert f"DECLARE @current DATETIME2(0) = {current};" in maintenance_sql
+    assert f"WHILE @boundary <= DATEADD({interval}, {ahead}, @current)" in (
+        maintenance_sql
+    )
+    assert f"SET @boundary = (\n        SELECT DATEADD({interval}, 1, MAX(" in (
+        maintenance_sql.replace("\r", "")
+    )
+
+
+@pytest.mark.parametrize(
+    "partitioning, message",
+    [
+        ({"ahead": 1}, "ahead must be an int >= 2"),
+        ({"ahead": 0}, "ahead must be an int >= 2"),
+        ({"retention": 0}, "retention must be an int >= 1"),
+    ],
+)
+def test_history_partitioning_is_validated(partitioning, message):
+    with pytest.raises(ValueError, match=message):
+        _partitioned(dict({"interval": "month", "retention": 12}, **partitioning))
+
+
+def _watermark_proc(watermark, **incremental):
+    models = source_models()
+    models["Customer"] += (
+        column("Version", "timestamp", 8, nullable=False),
+        column("Stamped", "datetimeoffset", None, 34, 7),
+    )
+    values = dict(
+        base_values,
+        staging_incremental={
+            ".*": dict({"mode": "watermark", "column": watermark}, **incremental)
+        },
+    )
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns=models)
+    settings.set_table("Customer")
+    return dbutil.get_staging_ddl("Customer")[1]
+
+
+def test_rowversion_watermark_stops_below_open_transactions():
+    proc = _watermark_proc("Version")
+    assert "EXEC [source].sys.sp_executesql" in proc
+    assert "MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1 AS BINARY(8)" in proc
+    assert "MAX([Version])" not in proc
+    assert proc.index("IF @to < @from") < proc.index("INSERT INTO")
+
+
+@pytest.mark.parametrize(
+    "watermark, incremental, to",
+    [
+        ("Modified", {}, "DATEADD(SECOND, -60, SYSDATETIME()) AS DATETIME2(3)"),
+        (
+            "Modified",
+            {"lag": 300, "utc": True},
+            "DATEADD(SECOND, -300, SYSUTCDATETIME()) AS DATETIME2(3)",
+        ),
+        (
+            "Stamped",
+            {},
+            "DATEADD(SECOND, -60, SYSDATETIMEOFFSET()) AS DATETIMEOFFSET(7)",
+        ),
+    ],
+)
+def test_datetime_watermark_lags_the_clock(watermark, incremental, to):
+    proc = _watermark_proc(watermark, **incremental)
+    assert f"DECLARE @to {to.split(' AS ')[1]} = CAST({to})" in proc
+    assert f"MAX([{watermark}])" not in proc
+
+
+def test_other_watermark_columns_read_the_newest_value():
+    proc = _watermark_proc("id")
+    assert "SELECT MAX([id])" in proc
+
+
+@pytest.mark.parametrize(
+    "watermark, incremental",
+    [("Modified", {"lag": 0}), ("Version", {"lag": 60}), ("id", {"lag": 60})],
+)
+def test_watermark_lag_is_validated(watermark, incremental):
+    with pytest.raises(ValueError, match="lag must be an int >= 1"):
+        _watermark_proc(watermark, **incremental)
+
+
+def _bulk_staging(**load):
+    values = dict(
+        base_values,
+        staging_load={".*": dict({"tablock": True, "index_after_load": True}, **load)},
+        row_hash={".*": {"index": True}},
+    )
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns=source_models())
+    settings.set_table("OrderLine")
+    return dbutil
+
+
+def test_bulk_staging_load_batches_then_indexes():
+    dbutil = _bulk_staging(batch_size=500)
+    staging_sql, staging_proc = dbutil.get_staging_ddl("OrderLine")
+    hash_index = (
+        "CREATE NONCLUSTERED INDEX [IX_OrderLine_orderId_line_RowHash] "
+        "ON [staging].[OrderLine] ([orderId], [line], [RowHash])"
+    )
+    # the heap is created without it, the load proc builds it
+    assert "INDEX" not in staging_sql
+    proc = " ".join(format_sql(staging_proc).split())
+    order = [
+        "TRUNCATE TABLE [staging].[OrderLine]",
+        "DROP INDEX IF EXISTS [IX_OrderLine_orderId_line_RowHash]",
+        "DROP INDEX IF EXISTS [CIX_OrderLine]",
+        "WHILE 1 = 1",
+        "SELECT TOP (500) [orderId]",
+        "BEGIN TRANSACTION",
+        "INSERT INTO [staging].[OrderLine] WITH (TABLOCK)",
+        "AND [orderId] <= @batch_to",
+        "COMMIT TRANSACTION",
+        "SET @batch_from = @batch_to",
+        "ROLLBACK TRANSACTION",
+        "CREATE UNIQUE CLUSTERED INDEX [CIX_OrderLine] "
+        "ON [staging].[OrderLine] ([orderId], [line])",
+        hash_index,
+    ]
+    positions = [proc.index(statement) for statement in order]
+    assert positions == sorted(positions)
+    assert proc.count("COMMIT TRANSACTION") == 1
+
+
+def test_bulk_copy_indexes_after_the_load():
+    sql = _bulk_staging().get_bulk_copy_sql("OrderLine")
+    assert sql["insert"].startswith("INSERT INTO [staging].[OrderLine] WITH (TABLOCK)")
+    prepare = sql["prepare"]
+    assert prepare.index("TRUNCATE TABLE") < prepare.index(
+        "DROP INDEX IF EXISTS [IX_OrderLine_orderId_line_RowHash]"
+    )
+    assert prepare.index("[IX_OrderLine_") < prepare.index("[CIX_OrderLine]")
+    finish = sql["finish"]
+    assert finish.index("CREATE UNIQUE CLUSTERED INDEX [CIX_OrderLine]") < finish.index(
+        "CREATE NONCLUSTERED INDEX [IX_OrderLine_orderId_line_RowHash]"
+    )
+
+
+def test_staging_indexes_with_the_table_unless_indexing_after_load():
+    dbutil = _bulk_staging(index_after_load=False)
+    staging_sql, staging_proc = dbutil.get_staging_ddl("OrderLine")
+    assert "CREATE NONCLUSTERED INDEX [IX_OrderLine_orderId_line_RowHash]" in (
+        staging_sql
+    )
+    assert "INDEX" not in staging_proc
+
+
+def _index_artifacts(table, data_compression, history_indexes=True):
+    values = dict(
+        base_values,
+        dimension_indexes={".*": True},
+        history_indexes={".*": history_indexes},
+        data_compression=data_compression,
+    )
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns=source_models())
+    settings.set_table(table)
+    return dict(
+        [
+            ((schema, otype), sql)
+            for schema, otype, name, sql in dbutil.get_artifacts(table)
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "data_compression, dim_with",
+    [
+        ({"hist": "PAGE", "dim": "row"}, " WITH (DATA_COMPRESSION = ROW)"),
+        # dim not configured, its indexes take the server default
+        ({"hist": "PAGE"}, ""),
+    ],
+)
+def test_indexes_are_compressed_per_schema(data_compression, dim_with):
+    customer = _index_artifacts("Customer", data_compression)
+    history = customer[("hist", "Tables")]
+    assert (
+        "CREATE NONCLUSTERED INDEX [IX_CustomerHistory_id_ValidTo_ValidFrom] "
+        "ON [hist].[CustomerHistory] ([id], [ValidTo], [ValidFrom]) "
+        "WITH (DATA_COMPRESSION = PAGE);"
+    ) in history
+    assert (
+        "ALTER TABLE [hist].[CustomerHistory] REBUILD WITH (DATA_COMPRESSION = PAGE)"
+        in history
+    )
+    # type 2 looks up a key's versions, type 1 a key's only row
+    assert (
+        "CREATE NONCLUSTERED INDEX [IX_Customer_id_ValidFrom_ValidTo] "
+        f"ON [dim].[Customer] ([id], [ValidFrom], [ValidTo]){dim_with};"
+    ) in customer[("dim", "Tables")]
+    order_line = _index_artifacts("OrderLine", data_compression)
+    assert (
+        "CREATE UNIQUE NONCLUSTERED INDEX [UX_OrderLine_orderId_line] "
+        f"ON [dim].[OrderLine] ([orderId], [line]){dim_with};"
+    ) in order_line[("dim", "Tables")]
+    assert ("REBUILD WITH" in order_line[("dim", "Tables")]) == bool(dim_with)
+    assert "DATA_COMPRESSION" not in order_line[("staging", "Tables")]
+
+
+def test_clustered_columnstore_history_is_not_page_compressed():
+    history = _index_artifacts(
+        "OrderLine", {"hist": "PAGE"}, [{"clustered": True, "columnstore": True}]
+    )[("hist", "Tables")]
+    assert (
+        "CREATE CLUSTERED COLUMNSTORE INDEX [ix_OrderLineHistory] "
+        "ON [hist].[OrderLineHistory] WITH (DROP_EXISTING = ON);"
+    ) in history
+    assert "[hist].[OrderLineHistory] REBUILD" not in history
+
+
+def _backdate_proc(**values):
+    settings = Settings(values=dict(base_values, **values))
+    dbutil = DbUtil(settingsinstance=settings, source_columns=source_models())
+    settings.set_table("OrderLine")
+    dbutil.get_staging_ddl("OrderLine")
+    dbutil.get_temporal_ddl("OrderLine")
+    return dbutil.get_backdate_ddl("OrderLine")
+
+
+def test_backdate_runs_in_key_range_batches():
+    proc = _backdate_proc(backdate_batch_size=250, backdate_hist_to="2020-06-30")
+    proc = " ".join(format_sql(proc).split())
+    order = [
+        "IF EXISTS (SELECT 1 FROM [hist].[LoadWatermark] "
+        "WHERE [ObjectName] = 'BackdateOrderLineDone') RETURN;",
+        "DECLARE @batch_from BIGINT = ( SELECT CAST([Watermark] AS BIGINT)",
+        # an earlier backdate is detected from one row, not MIN over the table
+        "IF (SELECT TOP (1) [ValidFrom] FROM [hist].[OrderLine]) = '2020-06-30'",
+        "SET (system_versioning = off)",
+        "DROP PERIOD FOR SYSTEM_TIME",
+        "WHILE 1 = 1",
+        "SELECT TOP (250) [orderId] FROM [hist].[OrderLine] "
+        "WHERE @batch_from IS NULL OR [orderId] > @batch_from ORDER BY [orderId]",
+        "IF @batch_to IS NULL BREAK;",
+        "BEGIN TRANSACTION;",
+        "SET ValidFrom=''2020-06-30'' WHERE (@batch_from IS NULL "
+        "OR [orderId] > @batch_from) AND [orderId] <= @batch_to;",
+        "SET [Watermark] = CAST(@batch_to AS SQL_VARIANT)",
+        "COMMIT TRANSACTION;",
+        "SET @batch_from = @batch_to;",
+        "ADD PERIOD FOR SYSTEM_TIME (ValidFrom,ValidTo)",
+        "set (system_versioning = on (HISTORY_TABLE=[hist].[OrderLineHistory]))",
+        "DELETE FROM [hist].[LoadWatermark] WHERE [ObjectName] = 'BackdateOrderLine';",
+        "VALUES ('BackdateOrderLineDone', NULL, SYSUTCDATETIME());",
+    ]
+    # each in turn, after the one before
+    position = 0
+    for statement in order:
+        position = proc.index(statement, position)
+    assert "MIN([ValidFrom])" not in proc
+    assert "2019-01-01" not in proc
+
+
+def test_no_backdate_procedure_without_a_batch_size():
+    assert _backdate_proc() is None
@@ -0,0 +1,92 @@
+from ddlemitter import create_table_sql, create_temporal_table_sql, quote
+from ddlreader import _Parser, _tokens
+from tablemodel import Column, TableModel
+
+from conftest import column
+
+
+def test_quote_only_where_needed():
+    assert quote("name") == "name"
+    assert quote("Name") == "[Name]"
+    assert quote("order") == "[order]"
+    assert quote("1st") == "[1st]"
+    assert quote("a b") == "[a b]"
+    assert quote("a]b") == "[a]]b]"
+
+
+def test_create_table():
+    table = TableModel(
+        "Customer",
+        "staging",
+        (
+            column("id", "int", nullable=False, primary_key=True),
+            column("name", "nvarchar", 100, None, None, "SQL_Latin1_General_CP1_CI_AS"),
+            column("City", "varchar", 40, None, None, "Latin1_General_CI_AS"),
+        ),
+    )
+    assert create_table_sql(table) == (
+        " CREATE TABLE staging.[Customer] (  id INTEGER NOT NULL,   "
+        "name NVARCHAR(50) NULL,   "
+        "[City] VARCHAR(40) COLLATE Latin1_General_CI_AS NULL,   "
+        "PRIMARY KEY (id) )  "
+    )
+
+
+def test_identity_only_where_the_model_says():
+    # copies of source keys keep the source's values
+    int_key = TableModel("t", "s", (column("a", "int", primary_key=True),))
+    assert "IDENTITY" not in create_table_sql(int_key)
+    text_key = TableModel("t", "s", (column("a", "nvarchar", 20, primary_key=True),))
+    assert "IDENTITY" not in create_table_sql(text_key)
+    explicit = TableModel(
+        "t",
+        "s",
+        (column("a", "int"), column("b", "bigint", nullable=False, identity=True)),
+    )
+    assert create_table_sql(explicit).count("IDENTITY(1,1)") == 1
+    assert "b BIGINT NOT NULL IDENTITY(1,1)" in create_table_sql(explicit)
+
+
+def test_computed_expression_column():
+    table = TableModel(
+        "t",
+        "s",
+        (
+            column("a", "int"),
+            Column("RowHash", None, expression="HASHBYTES('MD5', a)"),
+        ),
+    )
+    assert "[RowHash] AS (HASHBYTES('MD5', a)) PERSISTED" in create_table_sql(table)
+
+
+def test_temporal_table():
+    table = TableModel("Customer", "hist", (column("id", "int", primary_key=True),))
+    sql = create_temporal_table_sql(table, "[hist].[CustomerHistory]")
+    assert "GENERATED ALWAYS AS ROW START" in sql
+    assert "PERIOD FOR SYSTEM_TIME ([ValidFrom], [ValidTo])" in sql
+    assert sql.rstrip().endswith(
+        "WITH (SYSTEM_VERSIONING = ON ( HISTORY_TABLE = [hist].[CustomerHistory] ))"
+    )
+
+
+def _created_tables(artifacts):
+    tables = {}
+    for schema, otype, name, sql in artifacts:
+        if otype != "Tables":
+            continue
+        for kind, parsed_schema, table, value in _Parser(_tokens(sql)).parse():
+            if kind == "table":
+                tables[(parsed_schema, table)] = value
+    return tables
+
+
+def test_created_tables_parse_back_to_the_model(generated):
+    # the script reader reads what the emitter wrote for every option set
+    for table, model, artifacts in generated:
+        created = _created_tables(artifacts)
+        assert ("staging", table) in created
+        staging = dict([(c["name"], c) for c in created[("staging", table)]])
+        for source in model:
+            assert source.name in staging, f"{table}.{source.name}"
+            assert staging[source.name]["primary_key"] == source.primary_key
+        assert ("dim", table) in created
@@ -0,0 +1,141 @@
+import pytest
+
+from ddlemitter import create_table_sql
+from ddlreader import DdlScriptReader
+from tablemodel import TableModel
+
+customer_sql = """\
+CREATE TABLE [dbo].[Customer] (
+    [Id] INT IDENTITY (1, 1) NOT NULL,
+    [Name] NVARCHAR (100) COLLATE Latin1_General_CI_AS NOT NULL,
+    [Notes] nvarchar(max) NULL,
+    [Balance] DECIMAL (18, 4) CONSTRAINT [DF_Balance] DEFAULT ((0)) NULL,
+    [Modified] DATETIME2 (3) NOT NULL, -- last change
+    CONSTRAINT [PK_Customer] PRIMARY KEY CLUSTERED ([Id] ASC)
+);
+GO
+"""
+
+order_sql = """\
+/* keys are added separately */
+create table Sales.OrderLine (orderId bigint not null, line smallint not null,
+    amount money)
+go
+alter table Sales.OrderLine add constraint PK_OrderLine
+    primary key nonclustered (orderId, line)
+go
+"""
+
+
+@pytest.fixture
+def scripts(tmp_path):
+    (tmp_path / "dbo" / "Tables").mkdir(parents=True)
+    (tmp_path / "dbo" / "Tables" / "Customer.sql").write_text(customer_sql)
+    (tmp_path / "Sales" / "Tables").mkdir(parents=True)
+    (tmp_path / "Sales" / "Tables" / "OrderLine.sql").write_text(order_sql)
+    (tmp_path / "readme.txt").write_text("CREATE TABLE dbo.NotAScript (a int)")
+    return tmp_path
+
+
+def test_reads_columns(scripts):
+    columns = DdlScriptReader(str(scripts), "dbo").read()["Customer"]
+    assert [c.name for c in columns] == ["Id", "Name", "Notes", "Balance", "Modified"]
+    by_name = dict([(c.name, c) for c in columns])
+    assert by_name["Id"].type == "INTEGER"
+    assert by_name["Id"].identity and by_name["Id"].primary_key
+    assert not by_name["Id"].nullable
+    assert by_name["Name"].type == "NVARCHAR(100) COLLATE Latin1_General_CI_AS"
+    assert not by_name["Name"].nullable
+    assert by_name["Notes"].type == "NVARCHAR(max)"
+    assert by_name["Notes"].nullable
+    assert by_name["Balance"].type == "DECIMAL(18, 4)"
+    assert by_name["Modified"].type == "DATETIME2(3)"
+
+
+def test_alias_types(tmp_path):
+    (tmp_path / "Log.sql").write_text(
+        "CREATE TABLE dbo.Log (Id integer NOT NULL PRIMARY KEY, Version rowversion,"
+        " LoggedBy sysname, Host sysname NULL, Amount dec(9, 2))"
+    )
+    columns = DdlScriptReader(str(tmp_path), "dbo", folders=[]).read()["Log"]
+    assert [(c.name, c.type, c.nullable) for c in columns] == [
+        ("Id", "INTEGER", False),
+        ("Version", "TIMESTAMP", True),
+        ("LoggedBy", "NVARCHAR(128)", False),
+        ("Host", "NVARCHAR(128)", True),
+        ("Amount", "DECIMAL(9, 2)", True),
+    ]
+    sql = create_table_sql(TableModel("Log", "staging", columns))
+    assert "[Version] TIMESTAMP NULL" in sql
+    assert "[LoggedBy] NVARCHAR(128) NOT NULL" in sql
+
+
+def test_computed_columns(tmp_path, caplog):
+    (tmp_path / "Line.sql").write_text(
+        "CREATE TABLE dbo.Line (Id int NOT NULL,"
+        " Total AS (CAST([Price] * [Quantity] AS decimal(19, 4))) PERSISTED,"
+        " Code AS convert(nvarchar(20), [Id], 0),"
+        " Label AS CAST([Id] AS varchar(10)) + 'x',"
+        " Amount AS ([Price] * [Quantity]) PERSISTED NOT NULL,"
+        " Modified datetime2(3))"
+    )
+    columns = DdlScriptReader(str(tmp_path), "dbo", folders=[]).read()["Line"]
+    assert [(c.name, c.type, c.computed) for c in columns] == [
+        ("Id", "INTEGER", False),
+        ("Total", "DECIMAL(19, 4)", True),
+        ("Code", "NVARCHAR(20)", True),
+        ("Modified", "DATETIME2(3)", False),
+    ]
+    assert "skipping computed columns Label, Amount" in caplog.text
+
+
+def test_only_the_requested_schema(scripts):
+    assert list(DdlScriptReader(str(scripts), "dbo").read()) == ["Customer"]
+    assert list(DdlScriptReader(str(scripts), "sales").read()) == ["OrderLine"]
+
+
+def test_alter_table_primary_key(scripts):
+    columns = DdlScriptReader(str(scripts), "Sales").read()["OrderLine"]
+    assert [c.name for c in columns if c.primary_key] == ["orderId", "line"]
+    assert [c.type for c in columns] == ["BIGINT", "SMALLINT", "MONEY"]
+
+
+def test_selected_tables(scripts):
+    reader = DdlScriptReader(str(scripts), "dbo")
+    assert reader.read(["Customer", "Missing"]).keys() == {"Customer"}
+
+
+def test_missing_folder(tmp_path):
+    with pytest.raises(ValueError):
+        DdlScriptReader(str(tmp_path / "missing"), "dbo")
+
+
+def test_only_scripts_in_tables_folders(scripts):
+    procedures = scripts / "dbo" / "Stored Procedures"
+    procedures.mkdir()
+    (procedures / "Load.sql").write_text("CREATE TABLE dbo.Work (a int)")
+    assert list(DdlScriptReader(str(scripts), "dbo").read()) == ["Customer"]
+    # a Tables folder given directly
+    tables = str(scripts / "dbo" / "Tables")
+    assert list(DdlScriptReader(tables, "dbo").read()) == ["Customer"]
+    reader = DdlScriptReader(str(scripts), "dbo", folders=["stored procedures"])
+    assert list(reader.read()) == ["Work"]
+    reader = DdlScriptReader(str(scripts), "dbo", folders=[])
+    assert sorted(reader.read()) == ["Customer", "Work"]
+
+
+def test_folders_must_be_a_list(scripts):
+    with pytest.raises(ValueError):
+        DdlScriptReader(str(scripts), "dbo", folders="Tables")
+
+
+def test_skips_temp_tables(tmp_path):
+    (tmp_path / "Tables").mkdir()
+    (tmp_path / "Tables" / "Batch.sql").write_text(
+        "CREATE TABLE #Batch (Id int NOT NULL);\n"
+        "ALTER TABLE #Batch ADD PRIMARY KEY (Id);\n"
+        "CREATE TABLE ##Shared (Id int);\n"
+        "DECLARE @Rows TABLE (Id int);\n"
+        "CREATE TABLE dbo.Batch (Id int NOT NULL)"
+    )
+    assert list(DdlScriptReader(str(tmp_path), "dbo").read()) == ["Batch"]
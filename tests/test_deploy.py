@@ -0,0 +1,160 @@
+import json
+import os
+
+import pytest
+
+import deploy
+from deploy import (
+    DEPLOY_JOURNAL_NAME,
+    DEPLOY_STATE_NAME,
+    Deployer,
+    DeployState,
+    split_batches,
+)
+
+
+def test_split_on_go_lines():
+    sql = "CREATE TABLE a (x int)\nGO\nCREATE PROC p AS SELECT 1\n  go;  \nSELECT 2\nGO"
+    assert split_batches(sql) == [
+        "CREATE TABLE a (x int)",
+        "CREATE PROC p AS SELECT 1",
+        "SELECT 2",
+    ]
+
+
+def test_split_crlf_scripts():
+    sql = "CREATE TABLE a (x int)\r\nGO\r\nSELECT 1\r\ngo;\r\n"
+    assert split_batches(sql) == ["CREATE TABLE a (x int)", "SELECT 1"]
+
+
+def test_go_only_alone_on_its_line():
+    sql = "GOTO done\nSELECT 1 AS GO\n-- GO\ndone:\n"
+    assert split_batches(sql) == [sql.strip()]
+
+
+class FakeCursor:
+    def __init__(self, executed, failing):
+        self.executed = executed
+        self.failing = failing
+
+    def execute(self, sql):
+        if sql in self.failing:
+            raise RuntimeError("failed")
+        self.executed.append(sql)
+
+    def nextset(self):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, executed, failing):
+        self.executed = executed
+        self.failing = failing
+
+    def cursor(self):
+        return FakeCursor(self.executed, self.failing)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def target(monkeypatch):
+    executed = []
+    failing = set()
+    monkeypatch.setattr(deploy.EngineRegistry, "pool_sizes", {})
+
+    class FakeEngine:
+        def raw_connection(self):
+            return FakeConnection(executed, failing)
+
+    monkeypatch.setattr(
+        deploy.EngineRegistry, "get_engine", lambda *args, **kwargs: FakeEngine()
+    )
+    return executed, failing
+
+
+def _files(tmp_path):
+    def write(name, sql):
+        path = tmp_path / name
+        path.write_text(sql)
+        return str(path)
+
+    watermark = write("LoadWatermark.sql", "CREATE TABLE w (x int)\nGO\n")
+    return [
+        (table, [watermark, write(f"{table}.sql", f"CREATE {table}\nGO\nPROC {table}")])
+        for table in ["a", "b"]
+    ]
+
+
+def test_deploy_resumes_after_a_failure(tmp_path, target):
+    executed, failing = target
+    tables = _files(tmp_path)
+    failing.add("PROC b")
+    results = list(Deployer({"outputdir": str(tmp_path)}, jobs=2).deploy(tables))
+    assert [(t, n, e is None) for t, n, e in results] == [
+        ("a", 1, True),
+        ("b", 0, False),
+    ]
+    assert executed.count("CREATE TABLE w (x int)") == 1
+
+    executed.clear()
+    failing.clear()
+    results = list(Deployer({"outputdir": str(tmp_path)}, jobs=2).deploy(tables))
+    assert [(t, n, e) for t, n, e in results] == [("a", 0, None), ("b", 1, None)]
+    assert executed == ["CREATE b", "PROC b"]
+
+
+def test_deploy_pool_fits_the_jobs(tmp_path, target):
+    Deployer({"outputdir": str(tmp_path), "target_db": "t"}, jobs=20)
+    assert list(deploy.EngineRegistry.pool_sizes.values()) == [20]
+
+
+def test_deploy_compacts_the_journal(tmp_path, target):
+    list(Deployer({"outputdir": str(tmp_path)}, jobs=2).deploy(_files(tmp_path)))
+    assert not (tmp_path / DEPLOY_JOURNAL_NAME).exists()
+    with open(tmp_path / DEPLOY_STATE_NAME, encoding="utf-8") as fp:
+        objects = json.load(fp)["objects"]
+    assert sorted(objects) == ["LoadWatermark.sql", "a.sql", "b.sql"]
+
+
+def test_state_appends_instead_of_rewriting(tmp_path):
+    state = DeployState(str(tmp_path))
+    state.record("a.sql", "1", 0.5)
+    state.forget("a.sql")
+    state.forget("never.sql")
+    state.record("a.sql", "2", 0.5)
+    state.record("b.sql", "3", 0.5)
+    assert not (tmp_path / DEPLOY_STATE_NAME).exists()
+    lines = (tmp_path / DEPLOY_JOURNAL_NAME).read_text().splitlines()
+    assert len(lines) == 4
+
+
+def test_interrupted_deploy_resumes_from_the_journal(tmp_path):
+    state = DeployState(str(tmp_path))
+    state.record("a.sql", "1", 0.5)
+    state.compact()
+    state = DeployState(str(tmp_path))
+    state.forget("a.sql")
+    state.record("b.sql", "2", 0.5)
+    state.record("c.sql", "3", 0.5)
+    state.journal.close()
+    # a crash while writing the last line
+    journal = tmp_path / DEPLOY_JOURNAL_NAME
+    with open(journal, "rb+") as fp:
+        fp.seek(-10, os.SEEK_END)
+        fp.truncate()
+
+    state = DeployState(str(tmp_path))
+    assert not state.is_deployed("a.sql", "1")
+    assert state.is_deployed("b.sql", "2")
+    assert not state.is_deployed("c.sql", "3")
+    state.compact()
+    assert not journal.exists()
+    assert DeployState(str(tmp_path)).objects.keys() == {"b.sql"}
@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+
+import pytest
+import sqlalchemy
+from sqlalchemy.pool import QueuePool
+
+import engines
+from engines import DEFAULT_DRIVER, EngineRegistry
+
+
+class FakeEngine:
+    disposed = False
+
+    def dispose(self):
+        self.disposed = True
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(EngineRegistry, "engines", {})
+    monkeypatch.setattr(EngineRegistry, "stats", {})
+    monkeypatch.setattr(EngineRegistry, "pool_sizes", {})
+    monkeypatch.setattr(EngineRegistry, "pool_options", {})
+    return EngineRegistry
+
+
+def test_reserve_within_the_pool(registry):
+    # the default 5 + 10 overflow connections
+    engine = registry.engines[("s", "db", DEFAULT_DRIVER)] = FakeEngine()
+    registry.reserve("s", "db", 15)
+    assert registry.pool_sizes == {}
+    assert not engine.disposed
+
+
+def test_reserve_grows_the_pool(registry):
+    key = ("s", "db", DEFAULT_DRIVER)
+    engine = registry.engines[key] = FakeEngine()
+    registry.reserve("s", "db", 16)
+    assert registry.pool_sizes == {key: 16}
+    assert engine.disposed and key not in registry.engines
+
+
+def test_reserve_with_configured_pools(registry):
+    registry.configure(pool_size=2, max_overflow=0)
+    registry.reserve("s", "db", 3, driver="d")
+    assert registry.pool_sizes == {("s", "db", "d"): 3}
+    registry.configure(pool_size=2, max_overflow=-1)
+    registry.reserve("s", "other", 100)
+    assert ("s", "other", DEFAULT_DRIVER) not in registry.pool_sizes
+
+
+def test_one_engine_for_concurrent_lookups(registry, monkeypatch):
+    created = []
+
+    def create_engine(url, **kwargs):
+        # slow enough for every thread to miss the engine without the lock
+        time.sleep(0.05)
+        created.append(url)
+        return FakeEngine()
+
+    monkeypatch.setattr(engines, "create_engine", create_engine)
+    monkeypatch.setattr(EngineRegistry, "_count_connections", lambda *args: None)
+    found = []
+    threads = [
+        threading.Thread(target=lambda: found.append(registry.get_engine("s", "db")))
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert all(engine is found[0] for engine in found)
+    assert registry.stats[("s", "db", DEFAULT_DRIVER)]["engine_reuses"] == 7
+
+
+def test_one_engine_per_server_database_and_driver(registry, monkeypatch):
+    urls = []
+
+    def create_engine(url, **kwargs):
+        urls.append(url)
+        return FakeEngine()
+
+    monkeypatch.setattr(engines, "create_engine", create_engine)
+    monkeypatch.setattr(EngineRegistry, "_count_connections", lambda *args: None)
+    source = registry.get_engine("s", "db")
+    assert registry.get_engine("s", "db") is source
+    assert registry.get_engine("s", "db", driver=DEFAULT_DRIVER) is source
+    assert registry.get_engine("s", "other") is not source
+    assert registry.get_engine("t", "db") is not source
+    other_driver = registry.get_engine("s", "db", driver="ODBC Driver 17 for SQL Server")
+    assert other_driver is not source
+    assert len(urls) == 4
+    assert urls[-1].endswith("?driver=ODBC+Driver+17+for+SQL+Server")
+    assert registry.stats[("s", "db", DEFAULT_DRIVER)]["engine_reuses"] == 2
+
+
+def test_connects_and_checkouts_are_counted(registry, caplog):
+    engine = sqlalchemy.create_engine("sqlite://", poolclass=QueuePool)
+    stats = registry.stats[("s", "db", DEFAULT_DRIVER)] = {
+        "engine_reuses": 0,
+        "connects": 0,
+        "checkouts": 0,
+    }
+    registry._count_connections(engine, stats)
+    for i in range(3):
+        with engine.connect():
+            pass
+    # the pooled connection is opened once and checked out three times
+    assert stats["connects"] == 1
+    assert stats["checkouts"] == 3
+    with caplog.at_level(logging.INFO):
+        registry.report()
+    assert "s/db: 1 connects, 2 connection reuses, 0 engine reuses" in caplog.text
+    engine.dispose()
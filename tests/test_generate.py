@@ -0,0 +1,53 @@
+import pytest
+
+from conftest import base_values, source_models
+from dbutil import DbUtil
+from generate import generate_tables
+from settings import Settings
+
+
+def _generate(jobs, cachedir):
+    models = source_models()
+    models["Bad"] = models["OrderLine"]
+    values = dict(
+        base_values,
+        metadata_cache_dir=cachedir,
+        staging_load={"^Bad$": {"batch_size": -1}},
+    )
+    settings = Settings(values=values)
+    dbutil = DbUtil(settingsinstance=settings, source_columns=models)
+    # Missing is in no cache and can't be reflected offline, it fails before it
+    # reaches a worker, Bad fails generating
+    tables = ["Customer", "Missing", "Bad", "OrderLine"]
+    return [
+        (table, artifacts, None if error is None else str(error))
+        for table, artifacts, error in generate_tables(
+            settings, dbutil, tables, jobs=jobs
+        )
+    ]
+
+
+@pytest.fixture(scope="module")
+def cachedir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("cache"))
+
+
+@pytest.fixture(scope="module")
+def serial(cachedir):
+    return _generate(1, cachedir)
+
+
+def test_failing_tables_do_not_stop_the_others(serial):
+    assert [(table, error is None) for table, artifacts, error in serial] == [
+        ("Customer", True),
+        ("Missing", False),
+        ("Bad", False),
+        ("OrderLine", True),
+    ]
+    assert "can't reflect offline: Missing" in serial[1][2]
+    assert "batch_size must be a positive int" in serial[2][2]
+    assert all(artifacts for table, artifacts, error in serial if error is None)
+
+
+def test_processes_match_the_serial_path(serial, cachedir):
+    assert _generate(2, cachedir) == serial
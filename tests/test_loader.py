@@ -0,0 +1,133 @@
+import re
+
+import pytest
+
+import loader
+from conftest import base_values, source_models
+from dbutil import DbUtil
+from ddlreader import _Parser, _tokens
+from loader import StagingLoader
+from settings import Settings
+
+source_rows = [(i, f"name{i}", "City", i * 10, "2020-01-01") for i in range(1, 8)]
+insert_columns_re = re.compile(r"\((.*)\)\s*VALUES", re.DOTALL)
+
+
+class FakeCursor:
+    # the source database hands out its rows, the target's staging table
+    # refuses explicit values for identity columns like SQL Server's error 544
+    def __init__(self, database, identity, staged):
+        self.database = database
+        self.identity = identity
+        self.staged = staged
+        self.rows = []
+
+    def execute(self, sql, *params):
+        if "COUNT_BIG" in sql:
+            count = len(source_rows if self.database == "source" else self.staged)
+            self.rows = [(count,)]
+        elif "NTILE" in sql:
+            # the upper bound of every tile
+            self.rows = [(2,), (5,), (7,)]
+        elif self.database == "source":
+            lower, upper = (params[0], params[2]) if params else (None, None)
+            self.rows = [
+                row
+                for row in source_rows
+                if (lower is None or row[0] > lower)
+                and (upper is None or row[0] <= upper)
+            ]
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def executemany(self, sql, batch):
+        columns = insert_columns_re.search(sql).group(1)
+        for name in self.identity:
+            if f"[{name}]" in columns:
+                raise RuntimeError(
+                    f"Cannot insert explicit value for identity column {name} "
+                    "when IDENTITY_INSERT is set to OFF. (544)"
+                )
+        self.staged.extend(batch)
+
+
+class FakeConnection:
+    def __init__(self, database, identity, staged):
+        self.cursor = lambda: FakeCursor(database, identity, staged)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeEngine:
+    def __init__(self, database, identity, staged):
+        self.connection = (database, identity, staged)
+
+    def raw_connection(self):
+        return FakeConnection(*self.connection)
+
+
+def _identity_columns(dbutil, table):
+    # the identity columns of the staging table as created
+    for schema, otype, name, sql in dbutil.get_artifacts(table):
+        if schema == "staging" and otype == "Tables":
+            for kind, _, _, columns in _Parser(_tokens(sql)).parse():
+                if kind == "table":
+                    return [c["name"] for c in columns if c["identity"]]
+
+
+@pytest.fixture
+def load(monkeypatch):
+    # loads Customer with the given bulk_load options, returns its stats, the
+    # staged rows and the pool sizes reserved
+    reserved = {}
+    monkeypatch.setattr(
+        loader.EngineRegistry,
+        "reserve",
+        lambda server, database, connections, **kwargs: reserved.update(
+            {database: connections}
+        ),
+    )
+
+    def load(options):
+        settings = Settings(values=dict(base_values, bulk_load={".*": options}))
+        dbutil = DbUtil(settingsinstance=settings, source_columns=source_models())
+        settings.set_table("Customer")
+        identity = _identity_columns(dbutil, "Customer")
+        assert identity == []
+        staged = []
+        monkeypatch.setattr(
+            loader.EngineRegistry,
+            "get_engine",
+            lambda server, database, **kwargs: FakeEngine(database, identity, staged),
+        )
+        stats = StagingLoader(settings, dbutil).load("Customer")
+        return stats, staged, reserved
+
+    return load
+
+
+def test_loads_an_integer_key_table(load):
+    stats, staged, reserved = load({"batch_size": 3})
+    assert stats["rows"] == len(source_rows)
+    assert staged == source_rows
+    assert reserved == {}
+
+
+def test_partitions_reserve_their_connections(load):
+    stats, staged, reserved = load({"batch_size": 2, "partitions": 3})
+    assert stats["partitions"] == 3
+    assert sorted(staged) == source_rows
+    # a reader on the source and a writer on the target per partition
+    assert reserved == {"source": 3, "target": 3}
@@ -0,0 +1,119 @@
+import os
+import re
+
+import pytest
+
+import dbutil
+from conftest import base_values, column, source_models
+from create_sql_warehouse import _write_if_changed
+from manifest import Manifest, fingerprint_keys, generator_modules
+from settings import Settings
+
+# modules dbutil uses that connect, time or cache, not generate
+runtime_modules = ["engines", "tracing", "metacache"]
+
+
+def test_generator_modules_cover_the_generating_imports():
+    here = os.path.dirname(os.path.abspath(dbutil.__file__))
+    for name in generator_modules:
+        assert os.path.exists(os.path.join(here, name)), name
+    with open(dbutil.__file__, "r", encoding="utf-8") as fp:
+        imported = re.findall(r"^from (\w+) import", fp.read(), re.MULTILINE)
+    for module in imported:
+        if os.path.exists(os.path.join(here, f"{module}.py")):
+            if module not in runtime_modules:
+                assert f"{module}.py" in generator_modules, module
+    # the settings rules pick keys and columns, dbutil only gets an instance
+    assert "settings.py" in generator_modules
+
+
+def _fingerprint(tmp_path, columns=None, **values):
+    settings = Settings(values=dict(base_values, **values))
+    settings.set_table("Customer")
+    columns = source_models()["Customer"] if columns is None else columns
+    return Manifest(str(tmp_path)).fingerprint(settings, columns)
+
+
+def test_fingerprint_is_stable(tmp_path):
+    assert _fingerprint(tmp_path) == _fingerprint(tmp_path)
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda c: c[:-1],
+        lambda c: c + (column("added", "int"),),
+        lambda c: (c[0]._replace(name="Id"),) + c[1:],
+        lambda c: (c[0], column("name", "nvarchar", 200)) + c[2:],
+        lambda c: (c[0], c[1]._replace(nullable=False)) + c[2:],
+        lambda c: (c[0]._replace(primary_key=False),) + c[1:],
+        lambda c: (c[0]._replace(identity=False),) + c[1:],
+        lambda c: (c[0], c[1]._replace(computed=True)) + c[2:],
+        lambda c: (c[0], c[1]._replace(expression="UPPER([name])")) + c[2:],
+    ],
+)
+def test_fingerprint_changes_with_a_column(tmp_path, change):
+    columns = source_models()["Customer"]
+    assert _fingerprint(tmp_path, change(columns)) != _fingerprint(tmp_path, columns)
+
+
+@pytest.mark.parametrize(
+    "key, value",
+    [
+        ("staging_schema", "stage"),
+        ("dropfirst", False),
+        ("rules", {"scd_type": {".*": "Type 1"}}),
+        ("row_hash", {".*": True}),
+        ("history_partitioning", {".*": {"interval": "month", "retention": 24}}),
+    ],
+)
+def test_fingerprint_changes_with_a_setting(tmp_path, key, value):
+    assert key in fingerprint_keys
+    assert _fingerprint(tmp_path, **{key: value}) != _fingerprint(tmp_path)
+
+
+def test_fingerprint_ignores_other_settings(tmp_path):
+    assert _fingerprint(tmp_path, outputdir="elsewhere") == _fingerprint(tmp_path)
+
+
+def test_is_current_needs_every_recorded_file(tmp_path):
+    files = [str(tmp_path / "a.sql"), str(tmp_path / "b.sql")]
+    for path in files:
+        open(path, "w").close()
+    manifest = Manifest(str(tmp_path))
+    manifest.record("Customer", "abc", files)
+    manifest.save()
+    manifest = Manifest(str(tmp_path))
+    assert manifest.is_current("Customer", "abc")
+    assert not manifest.is_current("Customer", "abd")
+    assert not manifest.is_current("Orders", "abc")
+    os.remove(files[1])
+    assert not manifest.is_current("Customer", "abc")
+
+
+def test_files_are_relative_to_the_output_directory(tmp_path, monkeypatch):
+    (tmp_path / "run" / "out" / "staging").mkdir(parents=True)
+    (tmp_path / "elsewhere").mkdir()
+    (tmp_path / "run" / "out" / "staging" / "a.sql").write_text("")
+    monkeypatch.chdir(tmp_path / "run")
+    manifest = Manifest("out")
+    manifest.record("Customer", "abc", [os.path.join("out", "staging", "a.sql")])
+    manifest.save()
+    assert manifest.tables["Customer"]["files"] == ["staging/a.sql"]
+
+    monkeypatch.chdir(tmp_path / "elsewhere")
+    manifest = Manifest(os.path.join("..", "run", "out"))
+    assert manifest.is_current("Customer", "abc")
+    assert os.path.exists(manifest.files("Customer")[0])
+
+
+def test_identical_content_leaves_the_mtime_alone(tmp_path):
+    path = str(tmp_path / "Customer.sql")
+    _write_if_changed(path, "CREATE TABLE a (x INT);\n")
+    os.utime(path, (1000000000, 1000000000))
+    _write_if_changed(path, "CREATE TABLE a (x INT);\n")
+    assert os.path.getmtime(path) == 1000000000
+    _write_if_changed(path, "CREATE TABLE a (y INT);\n")
+    assert os.path.getmtime(path) != 1000000000
+    with open(path, encoding="utf-8") as fp:
+        assert fp.read() == "CREATE TABLE a (y INT);\n"
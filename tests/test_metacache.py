@@ -0,0 +1,88 @@
+import datetime
+
+import metacache
+from conftest import FakeSourceEngine, base_values, source_models
+from dbutil import DbUtil
+from metacache import MetadataCache
+from settings import Settings
+
+monday = datetime.datetime(2026, 10, 12, 9, 30)
+tuesday = datetime.datetime(2026, 10, 13, 14, 0)
+
+
+def _cache(tmp_path):
+    return MetadataCache(str(tmp_path), "local\\sql", "source", "dbo")
+
+
+def test_entries_survive_a_reload(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("Customer", monday, source_models()["Customer"])
+    cache.save()
+    reloaded = _cache(tmp_path)
+    assert reloaded.get("Customer", monday) == source_models()["Customer"]
+    assert reloaded.path == cache.path
+    assert reloaded.path.endswith("local_sql_source_dbo.pickle")
+
+
+def test_a_changed_modify_date_makes_an_entry_stale(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("Customer", monday, source_models()["Customer"])
+    assert cache.get("Customer", tuesday) is None
+    assert cache.get("OrderLine", monday) is None
+    # offline there is no modify date to compare with
+    assert cache.get("Customer") == source_models()["Customer"]
+
+
+def test_a_version_bump_drops_the_cache(tmp_path, monkeypatch):
+    cache = _cache(tmp_path)
+    cache.put("Customer", monday, source_models()["Customer"])
+    cache.save()
+    monkeypatch.setattr(metacache, "CACHE_VERSION", metacache.CACHE_VERSION + 1)
+    assert _cache(tmp_path).tables == {}
+
+
+def test_only_stale_and_missing_tables_are_reflected(tmp_path, monkeypatch):
+    settings = Settings(
+        values=dict(base_values, offline=False, metadata_cache_dir=str(tmp_path))
+    )
+    cache = MetadataCache(str(tmp_path), "localhost", "source", "dbo")
+    cache.put("Customer", monday, source_models()["Customer"])
+    cache.put("OrderLine", monday, source_models()["OrderLine"])
+    cache.save()
+
+    dbutil = DbUtil(settingsinstance=settings)
+    reflected = []
+
+    def read_source_models(tables):
+        reflected.extend(tables)
+        return dict([(t, source_models()["OrderLine"]) for t in tables])
+
+    monkeypatch.setattr(
+        dbutil,
+        "_get_modify_dates",
+        lambda: {"Customer": monday, "OrderLine": tuesday, "Invoice": monday},
+    )
+    monkeypatch.setattr(dbutil, "_read_source_models", read_source_models)
+    dbutil.reflect_source_tables(["Customer", "OrderLine", "Invoice"])
+    assert reflected == ["OrderLine", "Invoice"]
+    assert dbutil.source_columns["Customer"] == source_models()["Customer"]
+    saved = MetadataCache(str(tmp_path), "localhost", "source", "dbo")
+    assert saved.get("OrderLine", tuesday) == source_models()["OrderLine"]
+    assert saved.get("Invoice", monday) == source_models()["OrderLine"]
+
+
+def test_modify_dates_come_from_the_source(tmp_path, monkeypatch):
+    settings = Settings(
+        values=dict(base_values, offline=False, metadata_cache_dir=str(tmp_path))
+    )
+    cache = MetadataCache(str(tmp_path), "localhost", "source", "dbo")
+    cache.put("Customer", monday, source_models()["Customer"])
+    cache.save()
+
+    dbutil = DbUtil(settingsinstance=settings)
+    engine = FakeSourceEngine([("Customer", monday)])
+    monkeypatch.setattr(dbutil, "_get_source_engine", lambda: engine)
+    dbutil.reflect_source_tables(["Customer"])
+    assert dbutil.source_columns["Customer"] == source_models()["Customer"]
+    assert "s.name = 'dbo'" in engine.statements[0]
+    assert dbutil._get_modify_dates() == {"Customer": monday}
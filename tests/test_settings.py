@@ -0,0 +1,91 @@
+import json
+import sys
+
+import pytest
+
+from conftest import base_values, column
+from settings import Settings, SettingsError
+
+columns = [
+    column("code", "varchar", 10, nullable=False),
+    column("region", "varchar", 10, nullable=False),
+    column("name", "nvarchar", 100),
+]
+
+
+def _settings(rules, table="Customer", **values):
+    settings = Settings(values=dict(base_values, rules=rules, **values))
+    settings.set_table(table)
+    return settings
+
+
+def test_primary_keys_by_name_then_regex():
+    rules = {"primary_keys": {"Customer": ["code"], "Cust.*": ["code", "region"]}}
+    assert _settings(rules).get("source_primary_keys", columns=columns) == ["code"]
+    settings = _settings(rules, table="CustomerRegion")
+    assert settings.get("staging_primary_keys", columns=columns) == ["code", "region"]
+
+
+@pytest.mark.parametrize(
+    "rules, message",
+    [
+        ({}, "add one to rules.primary_keys"),
+        ({"primary_keys": {"Order.*": ["code"]}}, "add one to rules.primary_keys"),
+        ({"primary_keys": {".*": ["code", "id"]}}, "unknown ['id']"),
+    ],
+)
+def test_unanswerable_primary_keys(rules, message):
+    with pytest.raises(SettingsError) as e:
+        _settings(rules).get("source_primary_keys", columns=columns)
+    assert str(e.value).startswith("Customer: no answer for source_primary_keys")
+    assert message in str(e.value)
+
+
+def test_scd_type_for_every_table_or_per_table():
+    assert _settings({"scd_type": "Type 1"}).get("scd_type") == "Type 1"
+    rules = {"scd_type": {"Customer": "Type 2", ".*": "Type 1"}}
+    assert _settings(rules).get("scd_type") == "Type 2"
+    assert _settings(rules, table="Orders").get("scd_type") == "Type 1"
+
+
+@pytest.mark.parametrize("scd_type", [None, "Type 3", {"Orders": "Type 1"}])
+def test_unanswerable_scd_type(scd_type):
+    with pytest.raises(SettingsError, match="rules.scd_type"):
+        _settings({"scd_type": scd_type}).get("scd_type")
+
+
+def test_no_source_table_headless():
+    settings = Settings(values=dict(base_values))
+    with pytest.raises(SettingsError, match="--tables"):
+        settings.get("source_table", tablelist=["Customer"])
+
+
+def test_answers_reset_between_tables():
+    rules = {"scd_type": {"Customer": "Type 2", ".*": "Type 1"}}
+    settings = _settings(rules, table_settings={"Orders": {"scd_columns": ["name"]}})
+    assert settings.get("scd_type") == "Type 2"
+    settings.set_table("Orders")
+    assert settings.get("scd_type") == "Type 1"
+    assert settings.get("scd_columns", columns=["code", "name"]) == ["name"]
+    settings.set_table("Product")
+    assert settings.get("scd_columns", columns=["code", "name"]) == ["code", "name"]
+
+
+def test_headless_file_missing_settings(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text(json.dumps({"source_server": "localhost", "headless": True}))
+    with pytest.raises(SettingsError, match="source_db, .* can't prompt headless"):
+        Settings(config_path=str(path))
+
+
+def test_headless_never_imports_the_gui():
+    settings = _settings({"scd_type": "Type 1", "primary_keys": {".*": ["code"]}})
+    settings.get("scd_type")
+    settings.get("source_primary_keys", columns=columns)
+    settings.get("staging_columns", columns=["code", "name"])
+    assert "PySimpleGUI" not in sys.modules
+
+
+def test_every_table_key_can_be_answered():
+    for key in Settings.table_keys:
+        assert hasattr(Settings, "_get_" + key) or hasattr(Settings, "_rule_" + key)
@@ -0,0 +1,71 @@
+from sqlformat import format_sql, token_re
+
+
+def _tokens(sql):
+    return [
+        m.group().lower()
+        for m in token_re.finditer(sql)
+        if m.lastgroup not in ["newline", "space"]
+    ]
+
+
+def test_format_is_idempotent(generated):
+    for table, model, artifacts in generated:
+        for schema, otype, name, sql in artifacts:
+            formatted = format_sql(sql.replace("\r", ""))
+            assert format_sql(formatted) == formatted, f"{schema}.{name}"
+
+
+def test_format_keeps_every_token(generated):
+    for table, model, artifacts in generated:
+        for schema, otype, name, sql in artifacts:
+            sql = sql.replace("\r", "")
+            assert _tokens(format_sql(sql)) == _tokens(sql), f"{schema}.{name}"
+
+
+def test_keywords_are_upper_cased():
+    assert format_sql("select a from t where b = 1") == "SELECT a FROM t WHERE b = 1\n"
+
+
+def test_names_that_are_keywords_keep_their_case():
+    sql = "create table s.t (date date null, time time not null, start int)"
+    assert format_sql(sql) == (
+        "CREATE TABLE s.t (date DATE NULL, time TIME NOT NULL, start INT)\n"
+    )
+    sql = "select date, Time, t.max from t where start = 1 order by go"
+    assert format_sql(sql) == (
+        "SELECT date, Time, t.max FROM t WHERE start = 1 ORDER BY go\n"
+    )
+
+
+def test_contextual_keywords_are_upper_cased():
+    sql = (
+        "declare @x datetime2(7) = cast(y as date)\n"
+        "declare @n nvarchar(max) = convert(nvarchar(30), max(y))\n"
+        "begin try\nselect 1\nend try\nbegin catch\nthrow;\nend catch\ngo"
+    )
+    assert format_sql(sql) == (
+        "DECLARE @x DATETIME2(7) = CAST(y AS DATE)\n"
+        "DECLARE @n NVARCHAR(MAX) = CONVERT(NVARCHAR(30), MAX(y))\n"
+        "BEGIN TRY\n    SELECT 1\nEND TRY\nBEGIN CATCH\n    THROW;\nEND CATCH\nGO\n"
+    )
+
+
+def test_strings_and_comments_are_untouched():
+    sql = "select 'select  from', N'x' -- keep  this\nfrom t /* and  this */\n"
+    formatted = format_sql(sql)
+    assert "'select  from'" in formatted
+    assert "-- keep  this" in formatted
+    assert "/* and  this */" in formatted
+
+
+def test_long_lines_are_broken_at_clauses():
+    sql = "SELECT " + ", ".join(f"column{i}" for i in range(20)) + " FROM t WHERE x = 1"
+    lines = format_sql(sql, width=60).splitlines()
+    assert all(len(line) <= 60 for line in lines)
+    assert lines[-1].strip() == "WHERE x = 1"
+
+
+def test_blocks_are_indented():
+    sql = "IF 1 = 1\nBEGIN\nSELECT 1\nEND\nGO\n"
+    assert format_sql(sql) == "IF 1 = 1\nBEGIN\n    SELECT 1\nEND\nGO\n"
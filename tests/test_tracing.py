@@ -0,0 +1,130 @@
+import json
+import threading
+
+import pytest
+
+import tracing
+from tracing import span
+
+
+@pytest.fixture
+def traced():
+    tracing.reset(enabled=True)
+    yield tracing
+    tracing.reset()
+
+
+def _span(name, duration, start=0.0, **attrs):
+    return {
+        "name": name,
+        "start": start,
+        "duration": duration,
+        "pid": 1,
+        "tid": 2,
+        "attrs": attrs,
+    }
+
+
+def test_disabled_spans_record_nothing():
+    tracing.reset()
+    with span("generate", table="Customer"):
+        pass
+    assert tracing.collect() == []
+
+
+def test_nested_spans_inherit_attributes(traced):
+    with span("generate", table="Customer", worker=1):
+        with span("render", template="staging_loadproc_template"):
+            with span("emit_ddl", table="CustomerHistory"):
+                pass
+        with span("save"):
+            pass
+    spans = dict([(s["name"], s["attrs"]) for s in traced.collect()])
+    assert spans["generate"] == {"table": "Customer", "worker": 1}
+    assert spans["render"] == {
+        "table": "Customer",
+        "worker": 1,
+        "template": "staging_loadproc_template",
+    }
+    # an inner attribute overrides the inherited one
+    assert spans["emit_ddl"]["table"] == "CustomerHistory"
+    assert spans["save"] == {"table": "Customer", "worker": 1}
+
+
+def test_spans_close_when_the_body_raises(traced):
+    with pytest.raises(ValueError):
+        with span("generate", table="Customer"):
+            raise ValueError()
+    with span("save"):
+        pass
+    spans = traced.collect()
+    assert [s["name"] for s in spans] == ["generate", "save"]
+    assert spans[1]["attrs"] == {}
+
+
+def test_threads_have_their_own_nesting(traced):
+    with span("deploy", table="Customer"):
+        with span("batch"):
+            pass
+        thread = threading.Thread(target=_in_thread)
+        thread.start()
+        thread.join()
+    attrs = [s["attrs"] for s in traced.collect() if s["name"] == "batch"]
+    assert sorted(attrs, key=len) == [{}, {"table": "Customer"}]
+
+
+def _in_thread():
+    with span("batch"):
+        pass
+
+
+def test_summary_stats(traced):
+    traced.extend(
+        [_span("render", d / 1000, table="Customer") for d in range(1, 21)]
+        + [_span("render", 0.5, table="Orders"), _span("reflect", 0.25)]
+    )
+    summary = traced.summary()
+    render = summary["stages"]["render"]
+    assert render["count"] == 21
+    assert render["total_ms"] == pytest.approx(710)
+    assert render["mean_ms"] == pytest.approx(710 / 21)
+    assert render["p95_ms"] == pytest.approx(20)
+    assert render["max_ms"] == pytest.approx(500)
+    assert summary["stages"]["reflect"]["p95_ms"] == pytest.approx(250)
+    # only spans with a table add up per table
+    assert summary["tables"] == {
+        "Customer": {"render": pytest.approx(210)},
+        "Orders": {"render": pytest.approx(500)},
+    }
+
+
+def test_chrome_trace_events(traced):
+    traced.extend(
+        [
+            _span("save", 0.002, start=20.5, table="Customer"),
+            _span("generate", 0.01, start=20.0, table="Customer"),
+        ]
+    )
+    trace = traced.chrome_trace()
+    assert trace["displayTimeUnit"] == "ms"
+    events = trace["traceEvents"]
+    assert [e["name"] for e in events] == ["generate", "save"]
+    assert events[0] == {
+        "name": "generate",
+        "cat": "create_sql_warehouse",
+        "ph": "X",
+        "ts": pytest.approx(20e6),
+        "dur": pytest.approx(10000),
+        "pid": 1,
+        "tid": 2,
+        "args": {"table": "Customer"},
+    }
+
+
+def test_write_both_reports(traced, tmp_path):
+    traced.extend([_span("generate", 0.01, table="Customer")])
+    summary_path, trace_path = traced.write(str(tmp_path / "run"))
+    with open(summary_path, encoding="utf-8") as fp:
+        assert json.load(fp)["stages"]["generate"]["count"] == 1
+    with open(trace_path, encoding="utf-8") as fp:
+        assert len(json.load(fp)["traceEvents"]) == 1